@@ -0,0 +1,347 @@
+"""Offline BM25 search over declaration names, signatures and docstrings.
+
+Needs numpy (``pip install 'lean-lsp-mcp[local-search]'``). The index of
+each project, documents included, is stored as memory-mapped arrays, so it
+is loaded instantly and shared by all sessions through the page cache.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import math
+import re
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, Optional
+
+import orjson
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.cache_utils import get_cache_dir, write_json_atomic
+from lean_lsp_mcp.index_utils import get_declaration_index, scan_declarations
+
+logger = get_logger(__name__)
+
+_INDEX_VERSION = 2
+_GROUPS = ("project", "deps")
+
+# BM25 parameters; names count twice, they carry most of the meaning
+_K1 = 1.2
+_B = 0.75
+_NAME_WEIGHT = 2
+_MAX_TEXT = 300
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as be by for from if in is it of on or that the then this to with "
+    "there exists any all every some".split()
+)
+
+
+def numpy_available() -> bool:
+    # Only imported by the functions using it, numpy costs ~0.1 s at server start
+    return importlib.util.find_spec("numpy") is not None
+
+
+def _stem(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase terms of ``text``, splitting ``camelCase``, ``snake_case`` and dotted names."""
+    terms = []
+    for word in _WORD.findall(text):
+        word = word.lower()
+        if word not in _STOPWORDS:
+            terms.append(_stem(word))
+    return terms
+
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= _MAX_TEXT else text[: _MAX_TEXT - 1] + "…"
+
+
+def extract_documents(data: bytes) -> list[tuple[str, str, int, str, str]]:
+    """``(name, kind, line, signature, docstring)`` for the declarations in ``data``.
+
+    The signature is the declaration header up to ``:=`` (at most a few
+    lines); the docstring is a ``/-- ... -/`` comment right above it.
+    """
+    lines = data.decode("utf-8", errors="replace").split("\n")
+    documents = []
+    for name, kind, line in scan_declarations(data):
+        header = []
+        for text in lines[line : line + 6]:
+            head, sep, _ = text.partition(":=")
+            header.append(head)
+            if sep or text.rstrip().endswith(" where"):
+                break
+        signature = _clip(" ".join(header))
+
+        doc = ""
+        above = line - 1
+        while above >= 0 and lines[above].lstrip().startswith("@["):
+            above -= 1
+        if above >= 0 and lines[above].rstrip().endswith("-/"):
+            start = above
+            while start > above - 50 and start >= 0 and "/--" not in lines[start]:
+                start -= 1
+            if start >= 0 and "/--" in lines[start]:
+                text = "\n".join(lines[start : above + 1])
+                doc = _clip(text.split("/--", 1)[1].rsplit("-/", 1)[0])
+        documents.append((name, kind, line, signature, doc))
+    return documents
+
+
+def idf(n_docs: int, df: int) -> float:
+    """BM25 inverse document frequency of a term in ``df`` of ``n_docs`` documents."""
+    return math.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+
+class Bm25Index:
+    """BM25 over one group of files, stored as CSR arrays (terms x documents).
+
+    ``weights`` holds the term frequency part of each (term, document) pair;
+    the IDF is applied per query, so several groups can share one IDF. The
+    documents are JSON rows in one byte array, located by ``offsets``: a
+    search only decodes the rows it returns.
+    """
+
+    def __init__(self, meta: dict, indptr, doc_ids, weights, offsets, docs):
+        self.meta = meta
+        self.vocab: dict[str, int] = meta["vocab"]
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.offsets = offsets
+        self.docs = docs
+        self.n_docs = len(offsets) - 1
+
+    @classmethod
+    def build(
+        cls, documents: list[list], directory: Path, signature: str
+    ) -> "Bm25Index":
+        """Index ``[name, kind, file, line, signature, doc]`` rows and store them in ``directory``."""
+        import numpy as np
+
+        vocab: dict[str, int] = {}
+        rows, cols, tfs, lengths = [], [], [], []
+        for doc_id, (name, _, _, _, sig, doc) in enumerate(documents):
+            counts = Counter(tokenize(name) * _NAME_WEIGHT)
+            counts.update(tokenize(sig.split(name, 1)[-1]))
+            counts.update(tokenize(doc))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(doc_id)
+                tfs.append(tf)
+
+        n_docs = len(documents)
+        term_ids = np.asarray(rows, dtype=np.int64)
+        doc_ids = np.asarray(cols, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float32)
+        doc_len = np.asarray(lengths, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n_docs else 1.0
+
+        norm = _K1 * (1 - _B + _B * doc_len[doc_ids] / max(avgdl, 1e-6))
+        weights = (tf * (_K1 + 1) / (tf + norm)).astype(np.float32)
+
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=indptr[1:])
+
+        rows_json = [orjson.dumps(document) for document in documents]
+        offsets = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows_json], out=offsets[1:])
+
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "indptr.npy", indptr)
+        np.save(directory / "doc_ids.npy", doc_ids[order])
+        np.save(directory / "weights.npy", weights[order])
+        np.save(directory / "offsets.npy", offsets)
+        np.save(
+            directory / "docs.npy", np.frombuffer(b"".join(rows_json), dtype=np.uint8)
+        )
+        meta = {"version": _INDEX_VERSION, "signature": signature, "vocab": vocab}
+        write_json_atomic(directory / "meta.json", meta)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["Bm25Index"]:
+        import numpy as np
+
+        try:
+            meta = orjson.loads((directory / "meta.json").read_bytes())
+            if meta.get("version") != _INDEX_VERSION:
+                return None
+            arrays = [
+                np.load(directory / f"{name}.npy", mmap_mode="r")
+                for name in ("indptr", "doc_ids", "weights", "offsets", "docs")
+            ]
+        except (OSError, ValueError, orjson.JSONDecodeError):
+            return None
+        return cls(meta, *arrays)
+
+    def document(self, doc_id: int) -> list:
+        return orjson.loads(
+            self.docs[self.offsets[doc_id] : self.offsets[doc_id + 1]].tobytes()
+        )
+
+    def document_frequency(self, term: str) -> int:
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return 0
+        return int(self.indptr[term_id + 1] - self.indptr[term_id])
+
+    def query_terms(self, query: str) -> Counter:
+        """Terms of the index with weights; abbreviations (``comm`` for ``commutative``) count half."""
+        terms: Counter = Counter()
+        for word in tokenize(query):
+            if word in self.vocab:
+                terms[word] += 1.0
+                continue
+            for end in range(len(word) - 1, 2, -1):
+                if word[:end] in self.vocab:
+                    terms[word[:end]] += 0.5
+                    break
+        return terms
+
+    def search(
+        self, query: str, limit: int, idfs: Optional[dict[str, float]] = None
+    ) -> list[tuple[float, list]]:
+        """Top ``limit`` documents; ``idfs`` (by term) defaults to the IDF within this index."""
+        import numpy as np
+
+        terms = self.query_terms(query)
+        if not terms or not self.n_docs or limit <= 0:
+            return []
+        if idfs is None:
+            idfs = {
+                term: idf(self.n_docs, self.document_frequency(term)) for term in terms
+            }
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term, weight in terms.items():
+            term_id = self.vocab[term]
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # Document ids are unique within a term, so fancy indexing adds correctly
+            scores[self.doc_ids[start:end]] += self.weights[start:end] * (
+                weight * idfs[term]
+            )
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[i]), self.document(int(i))) for i in top if scores[i] > 0]
+
+
+class LocalSemanticSearch:
+    """BM25 indexes of a project and of its dependencies.
+
+    Files come from the :class:`DeclarationIndex` of the project. Each group
+    is rebuilt only when its files change, so edits to the project never
+    re-index ``.lake`` packages.
+    """
+
+    def __init__(self, root: Path, cache_dir: Optional[Path] = None):
+        self.root = root
+        if cache_dir is None:
+            cache_dir = Path(tempfile.mkdtemp(prefix="lean-lsp-bm25-"))
+        self.cache_dir = cache_dir
+        self._indexes: dict[str, Bm25Index] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_root(cls, root: Path) -> "LocalSemanticSearch":
+        cache_dir = get_cache_dir()
+        if cache_dir is not None:
+            digest = hashlib.sha256(str(root).encode("utf-8")).hexdigest()[:32]
+            cache_dir = cache_dir / "bm25" / digest
+        return cls(root, cache_dir)
+
+    def _documents(self, files: list[tuple[str, int, int]]) -> Iterator[list]:
+        for file, _, _ in files:
+            try:
+                data = (self.root / file).read_bytes()
+            except OSError:
+                continue
+            for name, kind, line, signature, doc in extract_documents(data):
+                yield [name, kind, file, line + 1, signature, doc]
+
+    def _index(self, group: str, files: list[tuple[str, int, int]]) -> Bm25Index:
+        signature = hashlib.sha256(orjson.dumps(files)).hexdigest()
+        index = self._indexes.get(group)
+        if index is not None and index.meta["signature"] == signature:
+            return index
+
+        pointer = self.cache_dir / f"{group}.json"
+        try:
+            current = orjson.loads(pointer.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            current = {}
+        if current.get("signature") == signature:
+            index = Bm25Index.load(self.cache_dir / current["directory"])
+
+        if index is None or index.meta["signature"] != signature:
+            logger.info("Building local search index (%s, %d files)", group, len(files))
+            directory = f"{group}-{signature[:16]}"
+            index = Bm25Index.build(
+                list(self._documents(files)), self.cache_dir / directory, signature
+            )
+            write_json_atomic(pointer, {"signature": signature, "directory": directory})
+            # Open memory maps keep their (unlinked) files alive
+            for old in self.cache_dir.glob(f"{group}-*"):
+                if old.name != directory:
+                    shutil.rmtree(old, ignore_errors=True)
+
+        self._indexes[group] = index
+        return index
+
+    def search(self, query: str, limit: int = 5) -> list[dict]:
+        """Best matching declarations of the project and its dependencies."""
+        files = get_declaration_index(self.root).files()
+        with self._lock:
+            indexes = [self._index(group, files[group]) for group in _GROUPS]
+
+        # One IDF over all groups keeps their scores comparable
+        n_docs = sum(index.n_docs for index in indexes)
+        terms = set().union(*(index.query_terms(query) for index in indexes))
+        idfs = {
+            term: idf(n_docs, sum(index.document_frequency(term) for index in indexes))
+            for term in terms
+        }
+        hits = []
+        for index in indexes:
+            hits.extend(index.search(query, limit, idfs))
+        hits.sort(key=lambda hit: -hit[0])
+        return [
+            {
+                "name": name,
+                "kind": kind,
+                "file": file,
+                "line": line,
+                "signature": signature,
+                "doc": doc,
+                "score": round(score, 3),
+            }
+            for score, (name, kind, file, line, signature, doc) in hits[:limit]
+        ]
+
+
+_SEARCHES: dict[Path, LocalSemanticSearch] = {}
+_SEARCHES_LOCK = threading.Lock()
+
+
+def get_local_semantic_search(root: Path) -> LocalSemanticSearch:
+    """Shared search for ``root`` (one per process, used by all sessions)."""
+    with _SEARCHES_LOCK:
+        search = _SEARCHES.get(root)
+        if search is None:
+            search = _SEARCHES[root] = LocalSemanticSearch.for_root(root)
+        return search
@@ -0,0 +1,639 @@
+"""Planning and bookkeeping for ``lean_build``."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import orjson
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.cache_utils import (
+    get_cache_dir,
+    project_fingerprint,
+    write_json_atomic,
+)
+
+
+logger = get_logger(__name__)
+
+# Recent builds kept per project, for ETAs
+_MAX_RUNS = 20
+
+# Build state of projects without a cache dir, for the lifetime of the process
+_MEMORY_STATES: dict[str, dict] = {}
+
+
+class BuildState:
+    """Small persistent record of a project's builds (``<cache>/build/<project>.json``)."""
+
+    def __init__(self, project_path: Path, path: Optional[Path]):
+        self.project_path = project_path
+        self.path = path
+        self.data: dict[str, Any] = self._load()
+
+    @classmethod
+    def for_project(cls, project_path: Path) -> "BuildState":
+        cache_dir = get_cache_dir()
+        path = None
+        if cache_dir is not None:
+            digest = hashlib.sha256(str(project_path).encode("utf-8")).hexdigest()[:32]
+            path = cache_dir / "build" / f"{digest}.json"
+        return cls(project_path, path)
+
+    def _load(self) -> dict[str, Any]:
+        if self.path is None:
+            return dict(_MEMORY_STATES.get(str(self.project_path), {}))
+        try:
+            data = orjson.loads(self.path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self) -> None:
+        if self.path is None:
+            _MEMORY_STATES[str(self.project_path)] = dict(self.data)
+            return
+        try:
+            write_json_atomic(self.path, self.data)
+        except OSError as exc:
+            logger.warning("Failed to save build state `%s`: %s", self.path, exc)
+
+    def needs_cache_get(self) -> bool:
+        """Whether ``lake exe cache get`` may fetch anything new.
+
+        The downloaded oleans only depend on ``lake-manifest.json`` and
+        ``lean-toolchain``; after a successful fetch for the same files
+        another one is a no-op that still costs a network round trip.
+        """
+        return self.data.get("cache_get") != project_fingerprint(self.project_path)
+
+    def record_cache_get(self) -> None:
+        self.data["cache_get"] = project_fingerprint(self.project_path)
+        self.save()
+
+    def record_build(
+        self,
+        modules: dict[str, dict],
+        jobs: int,
+        wall_seconds: float,
+        returncode: int,
+        targets: list[str],
+    ) -> None:
+        """Store the outcome of a ``lake build`` (``modules`` as collected by :class:`BuildOutput`)."""
+        now = time.time()
+        sources = project_modules(self.project_path)
+        records = self.data.setdefault("modules", {})
+        for name, entry in modules.items():
+            record = records.setdefault(name, {})
+            record["status"] = entry["status"]
+            if entry.get("seconds") is not None:
+                record["seconds"] = entry["seconds"]
+            record["built_at"] = round(now, 3)
+            record["source"] = _source_stamp(sources.get(name))
+        runs = self.data.setdefault("runs", [])
+        runs.append(
+            {
+                "finished_at": round(now, 3),
+                "seconds": round(wall_seconds, 3),
+                "jobs": jobs,
+                "modules": len(modules),
+                "returncode": returncode,
+                "targets": targets,
+            }
+        )
+        del runs[:-_MAX_RUNS]
+        self.save()
+
+    def seconds_per_job(self) -> Optional[float]:
+        """Average wall time per Lake job of the recent builds that compiled something."""
+        rates = [
+            run["seconds"] / run["jobs"]
+            for run in self.data.get("runs", [])
+            if run.get("jobs") and run.get("modules")
+        ]
+        return sum(rates) / len(rates) if rates else None
+
+    def eta(self, job: int, total: Optional[int]) -> Optional[float]:
+        """Expected seconds until job ``total`` is done, from the previous builds."""
+        rate = self.seconds_per_job()
+        if rate is None or not total:
+            return None
+        return max(0.0, (total - job) * rate)
+
+    def slowest(self, limit: int = 10) -> list[dict]:
+        records = self.data.get("modules", {})
+        timed = [
+            (name, r) for name, r in records.items() if r.get("seconds") is not None
+        ]
+        timed.sort(key=lambda item: -item[1]["seconds"])
+        return [{"module": name, **record_summary(r)} for name, r in timed[:limit]]
+
+    def failed(self) -> list[str]:
+        records = self.data.get("modules", {})
+        return sorted(
+            name for name, r in records.items() if r.get("status") == "failed"
+        )
+
+    def stale(self) -> list[dict]:
+        """Project modules whose last build is outdated, with the reason.
+
+        A module is stale if it was never built (and has no olean newer than
+        the source), failed, its source changed since, or it imports a stale
+        module.
+        """
+        modules = project_modules(self.project_path)
+        records = self.data.get("modules", {})
+        lib = self.project_path / ".lake" / "build" / "lib"
+        reasons: dict[str, str] = {}
+        for name, path in modules.items():
+            record = records.get(name)
+            stamp = _source_stamp(path)
+            if record is None:
+                olean = _source_stamp(
+                    lib.joinpath(*name.split(".")).with_suffix(".olean")
+                )
+                if olean is None or stamp is None or olean[0] < stamp[0]:
+                    reasons[name] = "not built"
+            elif record.get("status") == "failed":
+                reasons[name] = "failed"
+            elif record.get("source") != stamp:
+                reasons[name] = "source changed"
+
+        importers = _importers(modules)
+        for name in sorted(reasons):
+            for dependent in _dependents(importers, name) - {name}:
+                reasons.setdefault(dependent, f"imports {name}")
+        return [{"module": name, "reason": reasons[name]} for name in sorted(reasons)]
+
+
+def format_duration(seconds: float) -> str:
+    seconds = round(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def record_summary(record: dict) -> dict:
+    return {k: record[k] for k in ("status", "seconds", "built_at") if k in record}
+
+
+def _source_stamp(path: Optional[Path]) -> Optional[list[int]]:
+    if path is None:
+        return None
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def olean_snapshot(project_path: Path) -> dict[str, tuple[int, int]]:
+    """``(mtime_ns, size)`` of the build outputs of the project and its packages."""
+    roots = [project_path / ".lake" / "build" / "lib"]
+    packages = project_path / ".lake" / "packages"
+    try:
+        roots += [p / ".lake" / "build" / "lib" for p in packages.iterdir()]
+    except OSError:
+        pass
+
+    snapshot = {}
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if not name.endswith(".olean"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def changed_oleans(
+    before: dict[str, tuple[int, int]], after: dict[str, tuple[int, int]]
+) -> list[str]:
+    """Oleans that were written (or removed) between two snapshots."""
+    return sorted(
+        p for p in before.keys() | after.keys() if before.get(p) != after.get(p)
+    )
+
+
+_IMPORT = re.compile(r"^(?:(?:public|private|meta)\s+)*import\s+(?:all\s+)?(.*)$")
+_ISSUE = re.compile(r"^\s*(✖|⚠|error:|warning:)")
+_JOB = re.compile(
+    r"^\s*(\S+)\s+\[\d+/\d+\]\s+(Built|Building|Replayed|Compiling)\s+(\S+)"
+)
+_JOBS = re.compile(r"\[\d+/(\d+)\]")
+_BUILT = re.compile(r"\[\d+/\d+\]\s+Built\s+(\S+).*?\((\d+(?:\.\d+)?)(ms|s)\)\s*$")
+
+
+def read_imports(path: Path) -> list[str]:
+    """Modules imported by the header of the Lean file at ``path``."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16384).decode("utf-8", errors="replace")
+    except OSError:
+        return []
+    return parse_imports(head)
+
+
+def parse_imports(head: str) -> list[str]:
+    """Modules imported by the header of Lean source ``head``."""
+    imports = []
+    in_comment = False
+    for line in head.splitlines():
+        line = line.strip()
+        if in_comment:
+            in_comment = "-/" not in line
+            continue
+        if line.startswith("/-"):
+            in_comment = "-/" not in line[2:]
+            continue
+        if not line or line.startswith("--") or line in ("prelude", "module"):
+            continue
+        match = _IMPORT.match(line.split("--", 1)[0].strip())
+        if match is None:
+            break
+        imports += [m for m in match.group(1).split() if m != "runtime"]
+    return imports
+
+
+class LeanLib:
+    """A ``lean_lib`` of the lakefile: where its sources are and which modules belong to it."""
+
+    def __init__(
+        self, name: str, src_dir: Path, roots: list[str], globs: list[tuple[str, str]]
+    ):
+        self.name = name
+        self.src_dir = src_dir
+        self.roots = roots or [name]
+        # (kind, module) with kind "one", "submodules" or "andSubmodules", as in Lake
+        self.globs = globs or [("one", root) for root in self.roots]
+
+    def contains(self, module: str) -> bool:
+        """Whether Lake treats ``module`` as a module of this library."""
+        if any(module == r or module.startswith(r + ".") for r in self.roots):
+            return True
+        for kind, prefix in self.globs:
+            if module == prefix and kind != "submodules":
+                return True
+            if module.startswith(prefix + ".") and kind != "one":
+                return True
+        return False
+
+
+_DECL = re.compile(r"^(?:@\[[^\]]*\]\s*)?(package|lean_lib)\s+([^\s{]+)(.*)$")
+_SRC_DIR = re.compile(r'\bsrcDir\s*:=\s*"([^"]*)"')
+_ROOTS = re.compile(r"\broots\s*:=\s*#\[([^\]]*)\]")
+_GLOBS = re.compile(r"\bglobs\s*:=\s*#\[([^\]]*)\]")
+_GLOB = re.compile(
+    r"(?:(?:Glob)?\.(one|submodules|andSubmodules)\s+)?`((?:«[^»]*»|[\w.'!?])+)"
+)
+_TOML_GLOB = {".*": "andSubmodules", ".+": "submodules"}
+
+# (name, srcDir, roots, globs) of a ``lean_lib``
+_LibConfig = tuple[str, str, list[str], list[tuple[str, str]]]
+
+
+def _lean_name(name: str) -> str:
+    return name.strip("`").replace("«", "").replace("»", "")
+
+
+def _lakefile_lean_libs(text: str) -> tuple[str, list[_LibConfig]]:
+    """Package ``srcDir`` and the configuration of each ``lean_lib`` in a ``lakefile.lean``."""
+    package_src, libs = ".", []
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        match = _DECL.match(line)
+        if match is None:
+            continue
+        # The configuration is the rest of the line and the indented lines below
+        body = [match.group(3)]
+        for following in lines[i + 1 :]:
+            if following.strip() and not following[0].isspace():
+                break
+            body.append(following)
+        config = "\n".join(body)
+        src = _SRC_DIR.search(config)
+        if match.group(1) == "package":
+            package_src = src.group(1) if src else "."
+            continue
+        roots = _ROOTS.search(config)
+        globs = _GLOBS.search(config)
+        libs.append(
+            (
+                _lean_name(match.group(2)),
+                src.group(1) if src else ".",
+                [_lean_name(m.group(2)) for m in _GLOB.finditer(roots.group(1))]
+                if roots
+                else [],
+                [
+                    (m.group(1) or "one", _lean_name(m.group(2)))
+                    for m in _GLOB.finditer(globs.group(1))
+                ]
+                if globs
+                else [],
+            )
+        )
+    return package_src, libs
+
+
+def _lakefile_toml_libs(text: str) -> tuple[str, list[_LibConfig]]:
+    """Same as :func:`_lakefile_lean_libs` for a ``lakefile.toml``."""
+    config = tomllib.loads(text)
+    libs = []
+    for lib in config.get("lean_lib", []):
+        globs = []
+        for glob in lib.get("globs", []):
+            kind = _TOML_GLOB.get(glob[-2:])
+            globs.append((kind, glob[:-2]) if kind else ("one", glob))
+        libs.append(
+            (lib["name"], lib.get("srcDir", "."), list(lib.get("roots", [])), globs)
+        )
+    return config.get("srcDir", "."), libs
+
+
+def lean_libs(root: Path) -> list[LeanLib]:
+    """The ``lean_lib`` targets of the project's lakefile (``lakefile.lean`` takes precedence)."""
+    for filename, parse in (
+        ("lakefile.lean", _lakefile_lean_libs),
+        ("lakefile.toml", _lakefile_toml_libs),
+    ):
+        try:
+            text = (root / filename).read_text(encoding="utf-8")
+        except OSError:
+            continue
+        try:
+            package_src, libs = parse(text)
+        except (tomllib.TOMLDecodeError, KeyError, TypeError) as exc:
+            logger.warning(
+                "Cannot read the libraries of `%s`: %s", root / filename, exc
+            )
+            return []
+        return [
+            LeanLib(name, root / package_src / src_dir, roots, globs)
+            for name, src_dir, roots, globs in libs
+        ]
+    return []
+
+
+def project_modules(root: Path) -> dict[str, Path]:
+    """Modules of the project's ``lean_lib`` targets, as Lake resolves them (``srcDir``, ``roots``, ``globs``)."""
+    modules = {}
+    for lib in lean_libs(root):
+        for dirpath, dirnames, filenames in os.walk(lib.src_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                if not filename.endswith(".lean") or filename.startswith("_mcp_"):
+                    continue
+                path = Path(dirpath) / filename
+                module = ".".join(path.relative_to(lib.src_dir).with_suffix("").parts)
+                if lib.contains(module):
+                    modules.setdefault(module, path)
+    return modules
+
+
+def module_name(root: Path, target: str) -> Optional[str]:
+    """Module of ``target``, a ``.lean`` file (absolute or relative to ``root``) or a module name.
+
+    Files are named relative to the source directory of their library, or
+    relative to ``root`` if no library contains them.
+    """
+    if not target.endswith(".lean"):
+        return target.strip()
+    path = Path(target)
+    if not path.is_absolute():
+        path = root / path
+    path = path.resolve()
+    try:
+        relative = path.relative_to(root.resolve())
+    except ValueError:
+        return None
+    for lib in lean_libs(root):
+        try:
+            module = ".".join(
+                path.relative_to(lib.src_dir.resolve()).with_suffix("").parts
+            )
+        except ValueError:
+            continue
+        if lib.contains(module):
+            return module
+    return ".".join(relative.with_suffix("").parts)
+
+
+def import_stamps(root: Path, imports: list[str]) -> tuple:
+    """Stamps of the ``.olean`` of every library module in ``imports``, transitively.
+
+    Entries are ``(module, mtime_ns, size)``, ``None`` for a module not built yet, so the
+    result changes whenever one of them is rebuilt, by ``lean_build`` or outside of it.
+    """
+    libs = lean_libs(root)
+    lib_dir = root / ".lake" / "build" / "lib"
+    stamps, seen, pending = [], set(), list(imports)
+    while pending:
+        module = pending.pop()
+        if module in seen:
+            continue
+        seen.add(module)
+        parts = module.split(".")
+        source = None
+        for lib in libs:
+            path = lib.src_dir.joinpath(*parts).with_suffix(".lean")
+            if lib.contains(module) and path.is_file():
+                source = path
+                break
+        if source is None:
+            continue  # Not a module of the project, e.g. Mathlib
+        stamp = None
+        for base in (lib_dir / "lean", lib_dir):
+            stamp = _source_stamp(base.joinpath(*parts).with_suffix(".olean"))
+            if stamp is not None:
+                break
+        stamps.append((module, *(stamp or (None, None))))
+        pending += read_imports(source)
+    return tuple(sorted(stamps))
+
+
+def build_targets(root: Path, module: str) -> list[str]:
+    """Smallest set of Lake targets that rebuilds ``module`` and every library module importing it.
+
+    Building a module builds its imports, so dependents imported by another
+    dependent are left out. Empty if neither ``module`` nor any module
+    importing it belongs to a ``lean_lib``: only a full build covers it.
+    """
+    modules = project_modules(root)
+    importers = _importers(modules)
+    dependents = _dependents(importers, module) & modules.keys()
+    return sorted(m for m in dependents if not importers.get(m, set()) & dependents)
+
+
+def _importers(modules: dict[str, Path]) -> dict[str, set[str]]:
+    """Import graph of ``modules``, reversed: module -> project modules importing it."""
+    importers: dict[str, set[str]] = {}
+    for name, path in modules.items():
+        for imported in read_imports(path):
+            importers.setdefault(imported, set()).add(name)
+    return importers
+
+
+def _dependents(importers: dict[str, set[str]], module: str) -> set[str]:
+    """``module`` and every module importing it, directly or not."""
+    dependents, stack = {module}, [module]
+    while stack:
+        for importer in importers.get(stack.pop(), ()):
+            if importer not in dependents:
+                dependents.add(importer)
+                stack.append(importer)
+    return dependents
+
+
+def parse_job_line(line: str) -> Optional[tuple[str, str, Optional[float]]]:
+    """``(module, status, seconds)`` of a Lake job line about a module, else ``None``.
+
+    ``status`` is ``failed`` for ``✖`` lines and ``built`` otherwise;
+    ``seconds`` is only known for ``Built`` lines.
+    """
+    match = _JOB.match(line)
+    if match is None or ":" in match.group(3):
+        return None
+    status = "failed" if match.group(1) == "✖" else "built"
+    timing = parse_built_line(line) if match.group(2) == "Built" else None
+    return match.group(3), status, timing["seconds"] if timing else None
+
+
+def parse_built_line(line: str) -> Optional[dict]:
+    """``{"target", "seconds"}`` of a ``[i/n] Built X (1.6s)`` line, else ``None``."""
+    match = _BUILT.search(line)
+    if match is None:
+        return None
+    seconds = float(match.group(2)) / (1000 if match.group(3) == "ms" else 1)
+    return {"target": match.group(1), "seconds": round(seconds, 3)}
+
+
+def parse_build_timings(lines: Iterable[str]) -> list[dict]:
+    """Build times of the ``Built`` lines in ``lines``, slowest first."""
+    timings = [t for t in map(parse_built_line, lines) if t is not None]
+    timings.sort(key=lambda t: -t["seconds"])
+    return timings
+
+
+def build_log_path(project_path: Path) -> Path:
+    """Full log of the latest streamed build of ``project_path``."""
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        cache_dir = Path(tempfile.gettempdir()) / "lean-lsp-mcp"
+    digest = hashlib.sha256(str(project_path).encode("utf-8")).hexdigest()[:32]
+    return cache_dir / "build" / f"{digest}.log"
+
+
+class BuildOutput:
+    """Output of one ``lake build``.
+
+    By default every line is kept. With a ``log_path`` (streaming builds)
+    memory stays bounded: only the last ``tail`` lines and up to
+    ``max_issues`` error and warning lines are kept, while the full output
+    goes to ``log_path``. The previous ``backups`` logs are kept as
+    ``<log_path>.1`` and so on.
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[Path] = None,
+        tail: int = 40,
+        max_issues: int = 200,
+        backups: int = 3,
+    ):
+        self.log_path = log_path
+        self.max_issues = max_issues
+        self.lines: deque[str] = deque(maxlen=tail if log_path is not None else None)
+        self.errors: list[str] = []
+        self.warnings: list[str] = []
+        self.dropped_issues = 0
+        self.timings: list[dict] = []
+        self.modules: dict[str, dict] = {}
+        self.jobs = 0
+        self.line_count = 0
+        self._log = None
+        if log_path is not None:
+            self._log = self._open_log(log_path, backups)
+
+    @staticmethod
+    def _open_log(path: Path, backups: int):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            for i in range(backups, 0, -1):
+                older = path.with_name(f"{path.name}.{i - 1}") if i > 1 else path
+                if older.exists():
+                    os.replace(older, path.with_name(f"{path.name}.{i}"))
+            return open(path, "w", encoding="utf-8")
+        except OSError as exc:
+            logger.warning("Cannot write build log `%s`: %s", path, exc)
+            return None
+
+    def add(self, line: str) -> None:
+        self.line_count += 1
+        self.lines.append(line)
+        if self._log is not None:
+            self._log.write(line + "\n")
+        if (timing := parse_built_line(line)) is not None:
+            self.timings.append(timing)
+        if (job := parse_job_line(line)) is not None:
+            module, status, seconds = job
+            entry = self.modules.setdefault(module, {"status": status, "seconds": None})
+            if status == "failed":
+                entry["status"] = "failed"
+            if seconds is not None:
+                entry["seconds"] = seconds
+        if (jobs := _JOBS.search(line)) is not None:
+            self.jobs = max(self.jobs, int(jobs.group(1)))
+        if self.log_path is None:
+            return
+        match = _ISSUE.match(line)
+        if match is not None:
+            issues = self.errors if match.group(1) in ("✖", "error:") else self.warnings
+            if len(issues) < self.max_issues:
+                issues.append(line)
+            else:
+                self.dropped_issues += 1
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def summary(self, slowest: int = 10) -> dict:
+        """Compact description of a streamed build (no complete output)."""
+        summary = {
+            "lines": self.line_count,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "slowest": sorted(self.timings, key=lambda t: -t["seconds"])[:slowest],
+            "tail": list(self.lines),
+        }
+        if self.dropped_issues:
+            summary["omitted_issues"] = self.dropped_issues
+        if self.log_path is not None:
+            summary["log_file"] = str(self.log_path)
+        return summary
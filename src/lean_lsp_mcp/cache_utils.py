@@ -0,0 +1,368 @@
+"""Content-addressed caches for results that only depend on file content and project setup."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+
+import orjson
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.file_utils import get_file_contents
+from lean_lsp_mcp.watch_utils import get_watcher
+
+
+logger = get_logger(__name__)
+
+_DEFAULT_CACHE_DIR = Path.home() / ".cache" / "lean-lsp-mcp"
+
+
+def get_cache_dir() -> Optional[Path]:
+    """Base directory for on-disk caches (``LEAN_LSP_CACHE_DIR``, ``none`` disables)."""
+    value = os.environ.get("LEAN_LSP_CACHE_DIR", "").strip()
+    if value.lower() == "none":
+        return None
+    return Path(value).expanduser() if value else _DEFAULT_CACHE_DIR
+
+
+def project_fingerprint(project_path: Path | str) -> str:
+    """Hash of the project root, its ``lean-toolchain`` and ``lake-manifest.json``.
+
+    Results computed by Lean stay valid as long as the file content and this
+    fingerprint are unchanged (modulo local dependencies, see :meth:`DiagnosticsCache.invalidate`).
+    """
+    project_path = Path(project_path)
+    digest = hashlib.sha256(str(project_path).encode("utf-8"))
+    for name in ("lean-toolchain", "lake-manifest.json"):
+        digest.update(b"\0")
+        try:
+            digest.update((project_path / name).read_bytes())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+_FINGERPRINTS: dict[Path, tuple[int, str]] = {}
+
+
+def file_stamp(project_path: Path | str, rel_path: str) -> Optional[tuple]:
+    """Watcher stamp of a project file; ``None`` unless changes are tracked exactly.
+
+    Results memoized under a stamp stay valid until the file or the project
+    setup changes, without reading or stat-ing the file again.
+    """
+    root = Path(project_path)
+    watcher = get_watcher(root)
+    return watcher.stamp(root / rel_path) if watcher else None
+
+
+def current_fingerprint(project_path: Path | str) -> str:
+    """:func:`project_fingerprint`, recomputed only after setup changes if the project is watched."""
+    root = Path(project_path)
+    watcher = get_watcher(root)
+    stamp = watcher.stamp(root) if watcher else None
+    if stamp is None:
+        return project_fingerprint(root)
+    memo = _FINGERPRINTS.get(root)
+    if memo is not None and memo[0] == stamp[0]:
+        return memo[1]
+    fingerprint = project_fingerprint(root)
+    _FINGERPRINTS[root] = (stamp[0], fingerprint)
+    return fingerprint
+
+
+def content_key(fingerprint: str, kind: str, content: str, imports: tuple = ()) -> str:
+    """Key for a result of ``kind`` (e.g. a relative path) computed from ``content``.
+
+    ``imports`` are the stamps of the project modules ``content`` imports (see
+    :func:`lean_lsp_mcp.build_utils.import_stamps`), so rebuilding one of them
+    changes the key.
+    """
+    content = content.replace("\r\n", "\n")
+    return hashlib.sha256(
+        f"{fingerprint}\0{kind}\0{imports!r}\0{content}".encode("utf-8")
+    ).hexdigest()
+
+
+def write_json_atomic(path: Path, value: Any) -> None:
+    """Write ``value`` as JSON to ``path`` without exposing partial files to readers."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(value))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class DiagnosticsCache:
+    """LRU cache of formatted diagnostics with an optional on-disk tier.
+
+    Entries are keyed by :func:`content_key` and grouped by project
+    fingerprint, so a project can be invalidated as a whole after a build.
+    Disk entries live in ``<disk_dir>/<fingerprint>/<key>.json`` and are
+    shared by all sessions and processes using the same directory.
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[Path] = None):
+        self.max_entries = max(0, max_entries)
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict[str, tuple[str, Any]] = OrderedDict()
+        self._file_keys: dict[str, tuple[tuple, str]] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_env(cls) -> "DiagnosticsCache":
+        size = int(os.environ.get("LEAN_LSP_DIAGNOSTICS_CACHE_SIZE", "256"))
+        disk_dir = None
+        if os.environ.get("LEAN_LSP_DIAGNOSTICS_DISK_CACHE", "").lower() in (
+            "1",
+            "true",
+            "yes",
+        ):
+            cache_dir = get_cache_dir()
+            disk_dir = cache_dir / "diagnostics" if cache_dir else None
+        return cls(max_entries=size, disk_dir=disk_dir)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.disk_dir is not None
+
+    def _disk_path(self, fingerprint: str, key: str) -> Optional[Path]:
+        if self.disk_dir is None:
+            return None
+        return self.disk_dir / fingerprint[:32] / f"{key}.json"
+
+    def get(self, fingerprint: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        path = self._disk_path(fingerprint, key)
+        if path is None:
+            return None
+        try:
+            value = orjson.loads(path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        self._remember(fingerprint, key, value)
+        return value
+
+    def put(self, fingerprint: str, key: str, value: Any) -> None:
+        self._remember(fingerprint, key, value)
+        path = self._disk_path(fingerprint, key)
+        if path is None:
+            return
+        try:
+            write_json_atomic(path, value)
+        except OSError as exc:
+            logger.warning("Failed to write diagnostics cache `%s`: %s", path, exc)
+
+    def _remember(self, fingerprint: str, key: str, value: Any) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = (fingerprint, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, fingerprint: str) -> None:
+        """Drop all entries of one project, e.g. after its dependencies were rebuilt."""
+        with self._lock:
+            stale = [k for k, (fp, _) in self._entries.items() if fp == fingerprint]
+            for key in stale:
+                del self._entries[key]
+
+        path = self._disk_path(fingerprint, "")
+        if path is not None:
+            shutil.rmtree(path.parent, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def file_key(
+        self,
+        project_path: Path | str,
+        rel_path: str,
+        stamp: Optional[tuple] = None,
+        imports: tuple = (),
+    ) -> Optional[tuple[str, str]]:
+        """``(fingerprint, key)`` for the current content of a project file.
+
+        With a watcher ``stamp`` (see :func:`file_stamp`) the key is memoized
+        until the file or one of its ``imports`` changes, so unchanged files are
+        not read and hashed again.
+        """
+        root = Path(project_path)
+        fingerprint = current_fingerprint(root)
+        memo_key = str(root / rel_path)
+        if stamp is not None:
+            with self._lock:
+                memo = self._file_keys.get(memo_key)
+            if memo is not None and memo[0] == (fingerprint, stamp, imports):
+                return fingerprint, memo[1]
+
+        try:
+            content = get_file_contents(memo_key)
+        except OSError:
+            return None
+        key = content_key(fingerprint, rel_path, content, imports)
+        if stamp is not None:
+            with self._lock:
+                if len(self._file_keys) > 4 * max(self.max_entries, 256):
+                    self._file_keys.clear()
+                self._file_keys[memo_key] = ((fingerprint, stamp, imports), key)
+        return fingerprint, key
+
+
+class OutlineCache:
+    """On-disk cache of file outlines, shared by all sessions.
+
+    One entry per project and file holds the outline with the hash, mtime
+    and size of the content it was built from. A file whose mtime and size
+    are unchanged is answered with a single read; otherwise its content hash
+    decides. Entries live under the project fingerprint, so toolchain or
+    dependency updates start from scratch.
+    """
+
+    def __init__(self, cache_dir: Optional[Path]):
+        self.cache_dir = cache_dir
+        # abs path -> ((fingerprint, watcher stamp), outline)
+        self._memo: dict[str, tuple[tuple, str]] = {}
+
+    @classmethod
+    def from_env(cls) -> "OutlineCache":
+        cache_dir = get_cache_dir()
+        return cls(cache_dir / "outline" if cache_dir else None)
+
+    def _entry_path(self, project_path: Path, rel_path: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        fingerprint = current_fingerprint(project_path)
+        name = hashlib.sha256(rel_path.encode("utf-8")).hexdigest()
+        return self.cache_dir / fingerprint[:32] / f"{name}.json"
+
+    def get(
+        self, project_path: Path | str, rel_path: str, stamp: Optional[tuple] = None
+    ) -> Optional[str]:
+        """Cached outline of the file's current content.
+
+        With a watcher ``stamp`` (see :func:`file_stamp`), an outline stored
+        under the same stamp is returned from memory without touching the disk.
+        """
+        project_path = Path(project_path)
+        entry_path = self._entry_path(project_path, rel_path)
+        if entry_path is None:
+            return None
+        if stamp is not None:
+            memo = self._memo.get(str(project_path / rel_path))
+            if memo is not None and memo[0] == (entry_path.parent.name, stamp):
+                return memo[1]
+        try:
+            entry = orjson.loads(entry_path.read_bytes())
+            stat = (project_path / rel_path).stat()
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+        if (
+            entry.get("mtime_ns") == stat.st_mtime_ns
+            and entry.get("size") == stat.st_size
+        ):
+            return entry["outline"]
+
+        try:
+            content = (project_path / rel_path).read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+        if _sha256(content) != entry.get("sha256"):
+            return None
+
+        # Touched but unchanged: remember the new mtime to skip hashing next time
+        self._write(entry_path, entry, stat)
+        return entry["outline"]
+
+    def put(
+        self,
+        project_path: Path | str,
+        rel_path: str,
+        content: str,
+        outline: str,
+        stamp: Optional[tuple] = None,
+    ) -> None:
+        """Store ``outline`` computed from ``content`` (the text Lean saw).
+
+        ``stamp`` must be taken before the outline was computed; a later change
+        of the file gets a new stamp, so the memo can never serve stale outlines.
+        """
+        project_path = Path(project_path)
+        entry_path = self._entry_path(project_path, rel_path)
+        if entry_path is None:
+            return
+        if stamp is not None:
+            if len(self._memo) > 4096:
+                self._memo.clear()
+            self._memo[str(project_path / rel_path)] = (
+                (entry_path.parent.name, stamp),
+                outline,
+            )
+        entry = {"sha256": _sha256(content), "outline": outline}
+        stat = None
+        try:
+            # Only trust mtime if the file on disk is what was outlined
+            if (
+                _sha256((project_path / rel_path).read_text(encoding="utf-8"))
+                == entry["sha256"]
+            ):
+                stat = (project_path / rel_path).stat()
+        except (OSError, UnicodeDecodeError):
+            pass
+        self._write(entry_path, entry, stat)
+
+    @staticmethod
+    def _write(entry_path: Path, entry: dict, stat: Optional[os.stat_result]) -> None:
+        entry = dict(entry)
+        entry["mtime_ns"] = stat.st_mtime_ns if stat else None
+        entry["size"] = stat.st_size if stat else None
+        try:
+            write_json_atomic(entry_path, entry)
+        except OSError as exc:
+            logger.warning("Failed to write outline cache `%s`: %s", entry_path, exc)
+
+    def invalidate(self, project_path: Path | str) -> None:
+        entry_path = self._entry_path(Path(project_path), "")
+        self._memo.clear()
+        if entry_path is not None:
+            shutil.rmtree(entry_path.parent, ignore_errors=True)
+
+
+def _sha256(content: str) -> str:
+    return hashlib.sha256(content.replace("\r\n", "\n").encode("utf-8")).hexdigest()
+
+
+def diagnostics_complete(client, path: str) -> bool:
+    """Whether Lean finished elaborating ``path`` without an RPC error.
+
+    Only complete diagnostics may be cached; a timed out check could miss errors.
+    """
+    worker_for = getattr(client, "worker_for", None)
+    if worker_for is not None:
+        client = worker_for(path)
+    opened = getattr(client, "opened_files", None)
+    if not isinstance(opened, dict):
+        return False
+    state = opened.get(path)
+    return bool(state is not None and state.complete and not state.error)
@@ -1,6 +1,10 @@
 import os
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from threading import Lock
+from threading import Lock, RLock, Thread
 
 from mcp.server.fastmcp import Context
 from mcp.server.fastmcp.utilities.logging import get_logger
@@ -8,45 +12,453 @@ from leanclient import LeanLSPClient
 
 from lean_lsp_mcp.file_utils import get_relative_file_path
 from lean_lsp_mcp.utils import OutputCapture
+from lean_lsp_mcp.watch_utils import get_watcher
 
 
 logger = get_logger(__name__)
-CLIENT_LOCK = Lock()
+CLIENT_LOCK = RLock()
+
+# LeanLSPClient methods whose first argument is a relative file path.
+# LeanWorkerPool routes these to the worker the file is pinned to.
+_FILE_METHODS = {
+    "open_file",
+    "update_file",
+    "update_file_content",
+    "get_diagnostics",
+    "get_file_content",
+    "get_goal",
+    "get_term_goal",
+    "get_hover",
+    "get_completions",
+    "get_declarations",
+    "get_definitions",
+    "get_references",
+    "get_type_definitions",
+    "get_document_symbols",
+    "get_document_highlights",
+    "get_semantic_tokens",
+    "get_folding_ranges",
+    "get_code_actions",
+    "get_info_trees",
+}
+
+
+def get_pool_size() -> int:
+    """Number of Lean language servers to run per project (``LEAN_LSP_POOL_SIZE``, default 1)."""
+    try:
+        return max(1, int(os.environ.get("LEAN_LSP_POOL_SIZE", "1")))
+    except ValueError:
+        logger.warning("Invalid LEAN_LSP_POOL_SIZE, falling back to a single worker")
+        return 1
+
+
+class _Worker:
+    def __init__(self, client: LeanLSPClient) -> None:
+        self.client = client
+        self.lock = RLock()
+        self.pending = 0  # Requests queued or running on this worker
+        # Pinned paths, least recently used first
+        self.pinned: OrderedDict[str, None] = OrderedDict()
+        # The client closes files beyond this anyway, older pins are dropped
+        max_open = getattr(client, "max_opened_files", None)
+        self.max_pins = max_open if isinstance(max_open, int) and max_open > 0 else 4
+
+
+class LeanWorkerPool:
+    """Several Lean language servers for one project behind the LeanLSPClient API.
+
+    Each file is pinned to the worker that first touched it, so its elaboration
+    state is reused. Files that are not pinned yet go to the least busy worker.
+    A worker keeps as many pins as it keeps files open; the least recently
+    used pin is dropped beyond that.
+    Requests to a single worker are serialized, requests to different workers
+    run concurrently.
+    """
+
+    def __init__(
+        self,
+        project_path: Path,
+        size: int,
+        prevent_cache_get: bool = False,
+    ) -> None:
+        self.project_path = Path(project_path).resolve()
+        # Only the first worker may fetch the Mathlib cache, the rest start in parallel
+        first = LeanLSPClient(
+            self.project_path, initial_build=False, prevent_cache_get=prevent_cache_get
+        )
+        with ThreadPoolExecutor(max_workers=max(1, size - 1)) as executor:
+            rest = list(
+                executor.map(
+                    lambda _: LeanLSPClient(
+                        self.project_path, initial_build=False, prevent_cache_get=True
+                    ),
+                    range(size - 1),
+                )
+            )
+        self._workers = [_Worker(c) for c in [first, *rest]]
+        self._pins: dict[str, _Worker] = {}
+        self._lock = Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def _acquire(self, path: str) -> _Worker:
+        """Return the worker for ``path``, pinning it if needed, and mark it busy."""
+        with self._lock:
+            worker = self._pins.get(path)
+            if worker is None:
+                worker = min(self._workers, key=lambda w: (w.pending, len(w.pinned)))
+                self._pins[path] = worker
+            worker.pinned[path] = None
+            worker.pinned.move_to_end(path)
+            while len(worker.pinned) > worker.max_pins:
+                evicted, _ = worker.pinned.popitem(last=False)
+                del self._pins[evicted]
+            worker.pending += 1
+        return worker
+
+    def _release(self, worker: _Worker) -> None:
+        with self._lock:
+            worker.pending -= 1
+
+    def _unpin(self, path: str) -> None:
+        with self._lock:
+            worker = self._pins.pop(path, None)
+            if worker is not None:
+                worker.pinned.pop(path, None)
+
+    def _call(self, path: str, method: str, *args, **kwargs):
+        worker = self._acquire(path)
+        try:
+            with worker.lock:
+                return getattr(worker.client, method)(path, *args, **kwargs)
+        finally:
+            self._release(worker)
+
+    @contextmanager
+    def lock_file(self, path: str):
+        """Hold the worker ``path`` is pinned to for a sequence of requests."""
+        worker = self._acquire(path)
+        try:
+            with worker.lock:
+                yield worker.client
+        finally:
+            self._release(worker)
+
+    def worker_for(self, path: str) -> LeanLSPClient:
+        """Return the client ``path`` is pinned to (pins it if necessary)."""
+        worker = self._acquire(path)
+        self._release(worker)
+        return worker.client
+
+    def open_files(self, paths: list[str], **kwargs) -> None:
+        for path in paths:
+            self._call(path, "open_file", **kwargs)
+
+    def close_files(self, paths: list[str], blocking: bool = True) -> None:
+        with self._lock:
+            missing = [p for p in paths if p not in self._pins]
+            groups: dict[int, tuple[_Worker, list[str]]] = {}
+            for path in paths:
+                if path in self._pins:
+                    worker = self._pins[path]
+                    groups.setdefault(id(worker), (worker, []))[1].append(path)
+        if missing:
+            raise FileNotFoundError(
+                f"Files {missing} are not open. Call open_files first."
+            )
+        for worker, group in groups.values():
+            with worker.lock:
+                worker.client.close_files(group, blocking=blocking)
+            for path in group:
+                self._unpin(path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._pins.clear()
+            for worker in self._workers:
+                worker.pinned.clear()
+        for worker in self._workers:
+            try:
+                worker.client.close()
+            except Exception as exc:  # pragma: no cover - close failures only logged
+                logger.warning(f"Failed to close Lean worker: {exc}")
+
+    def __getattr__(self, name: str):
+        workers = self.__dict__.get("_workers")
+        if not workers:
+            raise AttributeError(name)
+        if name in _FILE_METHODS:
+            return lambda path, *args, **kwargs: self._call(path, name, *args, **kwargs)
+        # Path helpers like _uri_to_abs do not depend on worker state
+        return getattr(workers[0].client, name)
+
+
+def _process_tree_rss(pid: int) -> int:
+    """Resident memory in bytes of a process and all its children (0 if unknown)."""
+    import psutil
+
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc, *proc.children(recursive=True)]
+    except psutil.Error:
+        return 0
+
+    total = 0
+    for p in procs:
+        try:
+            total += p.memory_info().rss
+        except psutil.Error:
+            continue
+    return total
+
+
+def client_memory(client) -> int:
+    """Resident memory in bytes of the Lean server processes behind ``client``."""
+    if isinstance(client, LeanWorkerPool):
+        return sum(client_memory(w.client) for w in client._workers)
+    process = getattr(client, "process", None)
+    pid = getattr(process, "pid", None)
+    return _process_tree_rss(pid) if isinstance(pid, int) else 0
+
+
+class ClientRegistry:
+    """Live Lean clients keyed by resolved project root, evicted least recently used first.
+
+    At most ``max_projects`` clients are kept. If ``memory_budget`` (bytes) is
+    set, older clients are also closed while the Lean servers together use
+    more memory than that. The most recently used client is never evicted.
+    """
+
+    def __init__(self, max_projects: int = 3, memory_budget: int | None = None):
+        self.max_projects = max(1, max_projects)
+        self.memory_budget = memory_budget
+        self._clients: OrderedDict[Path, LeanLSPClient] = OrderedDict()
+        self._budget_warned = False
+
+    @classmethod
+    def from_env(cls) -> "ClientRegistry":
+        """Configure from ``LEAN_LSP_MAX_PROJECTS`` and ``LEAN_LSP_MEMORY_BUDGET_MB``."""
+        try:
+            max_projects = int(os.environ.get("LEAN_LSP_MAX_PROJECTS", "3"))
+        except ValueError:
+            logger.warning("Invalid LEAN_LSP_MAX_PROJECTS, using 3")
+            max_projects = 3
+        try:
+            budget_mb = float(os.environ.get("LEAN_LSP_MEMORY_BUDGET_MB", "0"))
+        except ValueError:
+            logger.warning("Invalid LEAN_LSP_MEMORY_BUDGET_MB, ignoring it")
+            budget_mb = 0
+        budget = int(budget_mb * 1024 * 1024) if budget_mb > 0 else None
+        return cls(max_projects=max_projects, memory_budget=budget)
+
+    def __contains__(self, project_path: Path) -> bool:
+        return project_path in self._clients
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def get(self, project_path: Path) -> LeanLSPClient | None:
+        """Return the live client for ``project_path`` and mark it most recently used."""
+        client = self._clients.get(project_path)
+        if client is not None:
+            self._clients.move_to_end(project_path)
+        return client
+
+    def add(self, project_path: Path, client: LeanLSPClient) -> None:
+        """Register ``client`` as most recently used and evict clients over the limits."""
+        self._clients[project_path] = client
+        self._clients.move_to_end(project_path)
+        self._evict()
+
+    def pop(self, project_path: Path) -> LeanLSPClient | None:
+        """Remove and return the client for ``project_path`` without closing it."""
+        return self._clients.pop(project_path, None)
+
+    def clients(self) -> list[LeanLSPClient]:
+        return list(self._clients.values())
+
+    def _evict(self) -> None:
+        while len(self._clients) > self.max_projects:
+            self._close_oldest("project limit")
+
+        if self.memory_budget is None:
+            return
+        while len(self._clients) > 1:
+            used = sum(client_memory(c) for c in self._clients.values())
+            if used == 0:
+                if not self._budget_warned:
+                    logger.warning(
+                        "Cannot measure the memory of the Lean servers, "
+                        "LEAN_LSP_MEMORY_BUDGET_MB is not enforced"
+                    )
+                    self._budget_warned = True
+                break
+            if used <= self.memory_budget:
+                break
+            self._close_oldest(f"memory budget ({used // (1024 * 1024)} MB in use)")
+
+    def _close_oldest(self, reason: str, wait_idle: bool = True) -> None:
+        project_path, client = self._clients.popitem(last=False)
+        logger.info(f"Closing Lean client for {project_path}: {reason}")
+        if wait_idle:
+            # A tool may still be inside a request on the evicted client
+            close_when_idle(client)
+            return
+        try:
+            client.close()
+        except Exception as exc:  # pragma: no cover - close failures only logged
+            logger.warning(f"Failed to close Lean client for {project_path}: {exc}")
+
+    def close_all(self) -> None:
+        while self._clients:
+            self._close_oldest("shutdown", wait_idle=False)
+
+
+_CLIENT_LOCKS: "weakref.WeakKeyDictionary[object, RLock]" = weakref.WeakKeyDictionary()
+_CLIENT_LOCKS_GUARD = Lock()
+
+
+@contextmanager
+def lock_file(client, path: str):
+    """Serialize tool work on ``path`` while tools run concurrently in threads.
+
+    A LeanWorkerPool only locks the worker the file is pinned to, so files on
+    other workers keep progressing. A single LeanLSPClient is locked as a whole.
+    """
+    if isinstance(client, LeanWorkerPool):
+        with client.lock_file(path):
+            yield
+        return
+
+    with _CLIENT_LOCKS_GUARD:
+        lock = _CLIENT_LOCKS.setdefault(client, RLock())
+    with lock:
+        yield
+
+
+def close_when_idle(client) -> None:
+    """Close ``client`` in a background thread once no tool holds it via :func:`lock_file`."""
+    if isinstance(client, LeanWorkerPool):
+        locks = [worker.lock for worker in client._workers]
+    else:
+        with _CLIENT_LOCKS_GUARD:
+            locks = [_CLIENT_LOCKS.setdefault(client, RLock())]
+
+    def close() -> None:
+        with ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock)
+            try:
+                client.close()
+            except Exception as exc:  # pragma: no cover - close failures only logged
+                logger.warning(f"Failed to close replaced Lean client: {exc}")
+
+    Thread(target=close, name="lean-client-close", daemon=True).start()
+
+
+def get_client_registry(lifespan) -> ClientRegistry:
+    """Return the client registry of a lifespan context, creating it on first use."""
+    registry = getattr(lifespan, "client_registry", None)
+    if registry is None:
+        registry = ClientRegistry.from_env()
+        lifespan.client_registry = registry
+    return registry
+
+
+def create_client(project_path: Path, prevent_cache_get: bool = False) -> LeanLSPClient:
+    """Start the Lean server(s) of a project: a LeanWorkerPool if ``LEAN_LSP_POOL_SIZE`` > 1."""
+    pool_size = get_pool_size()
+    with OutputCapture() as output:
+        if pool_size > 1:
+            client = LeanWorkerPool(
+                project_path, pool_size, prevent_cache_get=prevent_cache_get
+            )
+        else:
+            client = LeanLSPClient(
+                project_path,
+                initial_build=False,
+                prevent_cache_get=prevent_cache_get,
+            )
+        logger.info(
+            f"Connected to {pool_size} Lean language server(s) at {project_path}"
+        )
+    build_output = output.get_output()
+    if build_output:
+        logger.debug(f"Build output: {build_output}")
+    return client
 
 
 def startup_client(ctx: Context):
     """Initialize the Lean LSP client if not already set up.
 
+    Clients of previously used projects stay alive in the client registry, so
+    switching back to a project reuses its warm Lean server.
+
     Args:
         ctx (Context): Context object.
     """
     with CLIENT_LOCK:
-        lean_project_path = ctx.request_context.lifespan_context.lean_project_path
+        lifespan = ctx.request_context.lifespan_context
+        lean_project_path = lifespan.lean_project_path
         if lean_project_path is None:
             raise ValueError("lean project path is not set.")
 
+        registry = get_client_registry(lifespan)
+
         # Check if already correct client
-        client: LeanLSPClient | None = ctx.request_context.lifespan_context.client
+        client: LeanLSPClient | None = lifespan.client
 
         if client is not None:
             # Both are Path objects now, direct comparison works
             if client.project_path == lean_project_path:
+                if lean_project_path not in registry:
+                    registry.add(lean_project_path, client)
+                else:
+                    registry.get(lean_project_path)
                 return  # Client already set up correctly - reuse it!
-            # Different project path - close old client
-            client.close()
+            # Different project path - keep the old client warm in the registry
+            if client.project_path not in registry:
+                registry.add(client.project_path, client)
+
+        cached = registry.get(lean_project_path)
+        if cached is not None:
+            lifespan.client = cached
+            return
 
         # Need to create a new client
         # In test environments, prevent repeated cache downloads
-        prevent_cache = bool(os.environ.get("LEAN_LSP_TEST_MODE"))
-        with OutputCapture() as output:
-            client = LeanLSPClient(
-                lean_project_path, initial_build=False, prevent_cache_get=prevent_cache
-            )
-            logger.info(f"Connected to Lean language server at {lean_project_path}")
-        build_output = output.get_output()
-        if build_output:
-            logger.debug(f"Build output: {build_output}")
-        ctx.request_context.lifespan_context.client = client
+        client = create_client(
+            lean_project_path,
+            prevent_cache_get=bool(os.environ.get("LEAN_LSP_TEST_MODE")),
+        )
+        registry.add(lean_project_path, client)
+        lifespan.client = client
+
+
+def swap_client(lifespan, project_path: Path, client: LeanLSPClient) -> None:
+    """Make ``client`` the (active) client of ``project_path``, replacing the current one.
+
+    Tools pick up either the old or the new client, never none: the swap
+    happens under :data:`CLIENT_LOCK` and the old client is only closed once
+    the tool calls using it are done.
+    """
+    with CLIENT_LOCK:
+        registry = get_client_registry(lifespan)
+        replaced = [registry.pop(project_path)]
+        active = lifespan.client
+        if active is not None and active.project_path == project_path:
+            replaced.append(active)
+        elif active is not None and active.project_path not in registry:
+            # Keep the previously active project warm, like startup_client
+            registry.add(active.project_path, active)
+        registry.add(project_path, client)
+        lifespan.client = client
+    for old in {
+        id(c): c for c in replaced if c is not None and c is not client
+    }.values():
+        close_when_idle(old)
 
 
 def valid_lean_project_path(path: Path | str) -> bool:
@@ -62,14 +474,45 @@ def valid_lean_project_path(path: Path | str) -> bool:
     return (path_obj / "lean-toolchain").is_file()
 
 
+# Files that decide which directory is a project root
+_ROOT_FILES = {"lean-toolchain", "lakefile.lean", "lakefile.toml"}
+
+
+def _watch_project_root(lifespan, project_path: Path) -> bool:
+    """Drop cached directories of ``project_path`` when its root files change.
+
+    Returns ``False`` if the project is not watched (``LEAN_LSP_WATCH=off``),
+    then nothing may be cached for it.
+    """
+    watcher = get_watcher(project_path)
+    if watcher is None:
+        return False
+    if project_path in lifespan.project_watches:
+        return True
+    lifespan.project_watches.add(project_path)
+
+    def on_change(paths: set[Path]) -> None:
+        # Root files, and directories which may have brought or taken one along
+        if any(p.name in _ROOT_FILES or not p.name.endswith(".lean") for p in paths):
+            cache = lifespan.project_cache
+            for directory, root in list(cache.items()):
+                if root == project_path:
+                    cache.pop(directory, None)
+
+    watcher.subscribe(on_change)
+    return True
+
+
 def infer_project_path(ctx: Context, file_path: str) -> Path | None:
     """Infer and cache the Lean project path for a file WITHOUT starting the client.
 
-    Walks up the directory tree to find a lean-toolchain file, caches the result.
+    Walks up the directory tree to find a lean-toolchain file and caches the result.
+    Cached directories of a project are dropped when the project's watcher reports
+    a changed lean-toolchain or lakefile.
     Sets ctx.request_context.lifespan_context.lean_project_path if found.
 
     Side effects when path changes:
-    - Next LSP tool will restart the client for the new project
+    - Next LSP tool will switch to the client for the new project (starting it if needed)
     - File content hashes will be cleared
 
     Args:
@@ -82,6 +525,7 @@ def infer_project_path(ctx: Context, file_path: str) -> Path | None:
     lifespan = ctx.request_context.lifespan_context
     if not hasattr(lifespan, "project_cache"):
         lifespan.project_cache = {}
+        lifespan.project_watches = set()
 
     abs_file_path = os.path.abspath(file_path)
     file_dir = os.path.dirname(abs_file_path)
@@ -95,15 +539,20 @@ def infer_project_path(ctx: Context, file_path: str) -> Path | None:
         lifespan.lean_project_path = project_path
 
         # Update all relevant directories in cache
-        for directory in set(cache_dirs + [str(project_path)]):
-            if directory:
-                lifespan.project_cache[directory] = project_path
+        if _watch_project_root(lifespan, project_path):
+            for directory in set(cache_dirs + [str(project_path)]):
+                if directory:
+                    lifespan.project_cache[directory] = project_path
 
         return project_path
 
-    # Fast path: current project already valid for this file
-    if lifespan.lean_project_path and set_project_path(
-        lifespan.lean_project_path, [file_dir]
+    # Fast path: current project already valid for this file (checked again
+    # only after its root files changed)
+    current = lifespan.lean_project_path
+    if (
+        current
+        and (str(current) in lifespan.project_cache or valid_lean_project_path(current))
+        and set_project_path(current, [file_dir])
     ):
         return lifespan.lean_project_path
 
@@ -113,13 +562,11 @@ def infer_project_path(ctx: Context, file_path: str) -> Path | None:
         cached_root = lifespan.project_cache.get(current_dir)
 
         if cached_root:
-            if result := set_project_path(Path(cached_root), [current_dir]):
+            if result := set_project_path(cached_root, [current_dir]):
                 return result
         elif valid_lean_project_path(current_dir):
             if result := set_project_path(Path(current_dir), [current_dir]):
                 return result
-        else:
-            lifespan.project_cache[current_dir] = ""  # Mark as checked
 
         current_dir = os.path.dirname(current_dir)
 
@@ -134,3 +581,17 @@ def setup_client_for_file(ctx: Context, file_path: str) -> str | None:
 
     startup_client(ctx)
     return get_relative_file_path(project_path, file_path)
+
+
+def get_file_client(ctx: Context, file_path: str) -> tuple[LeanLSPClient, str] | None:
+    """Set up the client for a file and return ``(client, relative path)``.
+
+    Unlike reading ``lifespan_context.client`` after :func:`setup_client_for_file`,
+    the returned client is guaranteed to belong to the file's project even when
+    tools for different projects run concurrently.
+    """
+    with CLIENT_LOCK:
+        rel_path = setup_client_for_file(ctx, file_path)
+        if rel_path is None:
+            return None
+        return ctx.request_context.lifespan_context.client, rel_path
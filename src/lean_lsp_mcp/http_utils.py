@@ -0,0 +1,237 @@
+"""Shared HTTP client and response cache for the external search services."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+import httpx
+import orjson
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.state_utils import SharedState, get_shared_state
+
+
+logger = get_logger(__name__)
+
+USER_AGENT = "lean-lsp-mcp/0.1"
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace so trivially different spellings share a cache entry.
+
+    Case is kept: loogle and Lean names are case sensitive.
+    """
+    return " ".join(query.split())
+
+
+class ResponseCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Values are stored serialized, so callers can mutate what they get back
+    without corrupting the cache. With a :class:`SharedState` store, entries
+    are also shared with other server processes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: float = 3600.0,
+        store: Optional[SharedState] = None,
+    ):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self.store = store
+        self._entries: OrderedDict[Hashable, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_entries=int(os.environ.get("LEAN_LSP_HTTP_CACHE_SIZE", "512")),
+            ttl=float(os.environ.get("LEAN_LSP_HTTP_CACHE_TTL", "3600")),
+            store=get_shared_state(),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return orjson.loads(entry[1])
+
+        if self.store is None or not self.enabled:
+            return None
+        data = self.store.get_response(self._store_key(key))
+        if data is None:
+            return None
+        # Another process fetched it; the local copy may live for a full TTL
+        self._remember(key, data)
+        return orjson.loads(data)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        data = orjson.dumps(value)
+        self._remember(key, data)
+        if self.store is not None:
+            self.store.put_response(
+                self._store_key(key), data, self.ttl, self.max_entries
+            )
+
+    def _remember(self, key: Hashable, data: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _store_key(key: Hashable) -> str:
+        return orjson.dumps(key).decode("utf-8")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_CLIENT: Optional[httpx.Client] = None
+_CLIENT_LOCK = threading.Lock()
+RESPONSE_CACHE = ResponseCache.from_env()
+
+
+def get_http_client() -> httpx.Client:
+    """Process-wide pooled client; keeps connections (and TLS sessions) alive between calls.
+
+    Connection failures are retried by the transport; HTTP errors are not.
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = httpx.Client(
+                headers={"User-Agent": USER_AGENT},
+                timeout=httpx.Timeout(20.0, connect=10.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                transport=httpx.HTTPTransport(retries=2),
+                follow_redirects=True,
+            )
+        return _CLIENT
+
+
+def close_http_client() -> None:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.close()
+            _CLIENT = None
+
+
+class RateLimitExceeded(Exception):
+    """Raised by an upstream guard to refuse a request that would exceed the budget."""
+
+
+_upstream_guard: ContextVar[Optional[Callable[[], Optional[float]]]] = ContextVar(
+    "upstream_guard", default=None
+)
+
+
+@contextmanager
+def upstream_guard(check: Callable[[], Optional[float]]) -> Iterator[None]:
+    """Call ``check`` before each real upstream request made in this context.
+
+    Cache hits and requests coalesced into another caller's do not call it,
+    so rate limits only count traffic that reaches the service. ``check``
+    raises :class:`RateLimitExceeded` to refuse the request, or returns the
+    seconds to wait before sending it.
+    """
+    token = _upstream_guard.set(check)
+    try:
+        yield
+    finally:
+        _upstream_guard.reset(token)
+
+
+class _Flight:
+    """One upstream request that concurrent identical searches wait for."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+
+_IN_FLIGHT: dict[Hashable, _Flight] = {}
+_IN_FLIGHT_LOCK = threading.Lock()
+
+
+def cached_fetch(
+    endpoint: str,
+    query: str,
+    num_results: int,
+    fetch: Callable[[httpx.Client], Any],
+) -> Any:
+    """Return ``fetch(client)`` for this search, from the cache if it was asked recently.
+
+    Identical searches running at the same time share a single call of
+    ``fetch`` (single-flight). ``fetch`` should return the final
+    JSON-compatible result; exceptions propagate to every waiting caller
+    and are never cached.
+    """
+    key = (endpoint, normalize_query(query), num_results)
+    while True:
+        cached = RESPONSE_CACHE.get(key)
+        if cached is not None:
+            logger.debug("HTTP cache hit for %s", endpoint)
+            return cached
+
+        with _IN_FLIGHT_LOCK:
+            flight = _IN_FLIGHT.get(key)
+            leader = flight is None
+            if leader:
+                flight = _IN_FLIGHT[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if isinstance(flight.error, RateLimitExceeded):
+                # Only the leader's budget was exhausted: try with our own
+                continue
+            if flight.error is not None:
+                raise flight.error
+            logger.debug("Joined in-flight request to %s", endpoint)
+            return orjson.loads(flight.value)
+
+        try:
+            check = _upstream_guard.get()
+            delay = check() if check else None
+            if delay:
+                # Only the request waits for its slot, the rest of the tool ran already
+                logger.info(
+                    "Waiting %.1fs for a rate limit slot for %s", delay, endpoint
+                )
+                time.sleep(delay)
+            value = fetch(get_http_client())
+            flight.value = orjson.dumps(value)
+            RESPONSE_CACHE.put(key, value)
+            return value
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with _IN_FLIGHT_LOCK:
+                del _IN_FLIGHT[key]
+            flight.done.set()
@@ -0,0 +1,544 @@
+"""Persistent declaration index backing ``lean_local_search``."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+import orjson
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.cache_utils import (
+    current_fingerprint,
+    get_cache_dir,
+    write_json_atomic,
+)
+from lean_lsp_mcp.search_utils import _get_lean_src_search_path
+from lean_lsp_mcp.watch_utils import ProjectWatcher, get_watcher
+
+
+logger = get_logger(__name__)
+
+_INDEX_VERSION = 1
+
+# Same declarations as the ripgrep pattern in ``search_utils.lean_local_search``
+_DECL_LINE = re.compile(
+    rb"^[ \t]*(theorem|lemma|def|axiom|class|instance|structure|inductive|abbrev|opaque)"
+    rb"[ \t]+([^\s:({\[]+)",
+    re.MULTILINE,
+)
+
+
+class Declaration(NamedTuple):
+    name: str
+    kind: str
+    file: str
+    line: int
+
+
+def _component_starts(name: str) -> list[int]:
+    """Offsets where a query may start matching: the name and each dotted component."""
+    return [0] + [i + 1 for i, c in enumerate(name) if c == "." and i + 1 < len(name)]
+
+
+def _matches_case(name: str, query: str) -> bool:
+    return any(name.startswith(query, i) for i in _component_starts(name))
+
+
+def scan_declarations(data: bytes) -> list[tuple[str, str, int]]:
+    """Return ``(name, kind, line)`` for every declaration line in ``data`` (0-indexed lines)."""
+    decls = []
+    line, offset = 0, 0
+    for m in _DECL_LINE.finditer(data):
+        line += data.count(b"\n", offset, m.start())
+        offset = m.start()
+        name = m.group(2).decode("utf-8", errors="replace").split("⦃")[0]
+        decls.append((name, m.group(1).decode("ascii"), line))
+    return decls
+
+
+# Segments of a name for initials matching: ``HasDerivAt`` -> Has, Deriv, At
+_SEGMENT = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z0-9'!?]+|[^\sA-Za-z0-9'!?_.]+")
+
+# Score tiers, higher ranks first
+EXACT, NAMESPACE_SUFFIX, PREFIX, COMPONENT_PREFIX, INITIALS, SUBSTRING, FUZZY = (
+    1000,
+    900,
+    700,
+    600,
+    400,
+    300,
+    200,
+)
+
+
+def _short_name(name: str) -> str:
+    return name.rsplit(".", 1)[-1]
+
+
+def _initials(name: str) -> str:
+    segments = _SEGMENT.findall(_short_name(name))
+    return "".join(s[0] for s in segments).lower() if len(segments) > 1 else ""
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"^{text}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance of ``a`` and ``b``, or ``max_distance + 1`` if larger."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            )
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+
+class _Postings:
+    """Search structures over one group of declarations.
+
+    Sorted ``(lowercase key, declaration id)`` arrays answer prefix queries on
+    name components and on segment initials; trigram postings over the short
+    (last component) names find substring and typo candidates.
+    """
+
+    def __init__(self, decls: list[Declaration]):
+        pairs = sorted(
+            (decl.name[start:].lower(), i)
+            for i, decl in enumerate(decls)
+            for start in _component_starts(decl.name)
+        )
+        self.decls = decls
+        self.keys = [key for key, _ in pairs]
+        self.ids = [i for _, i in pairs]
+
+        initials = sorted(
+            (key, i) for i, decl in enumerate(decls) if (key := _initials(decl.name))
+        )
+        self.initial_keys = [key for key, _ in initials]
+        self.initial_ids = [i for _, i in initials]
+        self._grams: Optional[dict[str, list[int]]] = None
+        self._gram_lock = threading.Lock()
+
+    def prefix(self, query: str) -> Iterator[tuple[str, Declaration]]:
+        query = query.lower()
+        for pos in range(bisect_left(self.keys, query), len(self.keys)):
+            key = self.keys[pos]
+            if not key.startswith(query):
+                return
+            yield key, self.decls[self.ids[pos]]
+
+    def initials(self, query: str, cap: int) -> Iterator[Declaration]:
+        pos = bisect_left(self.initial_keys, query)
+        end = min(len(self.initial_keys), pos + cap)
+        while pos < end and self.initial_keys[pos].startswith(query):
+            yield self.decls[self.initial_ids[pos]]
+            pos += 1
+
+    def _short_names(
+        self,
+    ) -> tuple[list[str], dict[str, list[int]], dict[str, list[int]]]:
+        # Built on first fuzzy query, exact and prefix queries never need them
+        with self._gram_lock:
+            if self._grams is None:
+                by_short: dict[str, list[int]] = {}
+                for i, decl in enumerate(self.decls):
+                    by_short.setdefault(_short_name(decl.name).lower(), []).append(i)
+                shorts = list(by_short)
+                grams: dict[str, list[int]] = {}
+                for sid, short in enumerate(shorts):
+                    for gram in _trigrams(short):
+                        grams.setdefault(gram, []).append(sid)
+                self._shorts, self._by_short, self._grams = shorts, by_short, grams
+            return self._shorts, self._by_short, self._grams
+
+    def fuzzy(
+        self, query: str, max_distance: int, cap: int
+    ) -> Iterator[tuple[int, Declaration]]:
+        """Yield ``(score, decl)`` for short names containing ``query`` or within ``max_distance`` edits."""
+        shorts, by_short, grams = self._short_names()
+        query_grams = _trigrams(query)
+
+        # Every edit destroys at most three trigrams of the query. Grams found
+        # in most names (``_le``, ``add``) are not counted to keep this fast.
+        stop = max(1000, len(shorts) // 20)
+        counted = [g for g in query_grams if len(grams.get(g, ())) <= stop]
+        skipped = len(query_grams) - len(counted)
+        threshold = max(1, len(query_grams) - 3 * max_distance - skipped)
+        counts: Counter[int] = Counter()
+        for gram in counted:
+            counts.update(grams.get(gram, ()))
+
+        for sid, shared in counts.most_common(cap):
+            if shared < threshold:
+                break
+            short = shorts[sid]
+            if query in short:
+                score = SUBSTRING - (len(short) - len(query))
+            else:
+                distance = edit_distance(query, short, max_distance)
+                if distance > max_distance:
+                    continue
+                score = FUZZY - 50 * distance
+            for i in by_short[short]:
+                yield score, self.decls[i]
+
+
+def _score_prefix(name: str, key: str, query: str) -> int:
+    """Score a component-prefix hit where ``key`` is the matched lowercase suffix of ``name``."""
+    extra = len(key) - len(query)
+    if extra == 0:
+        return EXACT if len(key) == len(name) else NAMESPACE_SUFFIX
+    tier = PREFIX if len(key) == len(name) else COMPONENT_PREFIX
+    return tier - min(extra, 99)
+
+
+class DeclarationIndex:
+    """Declarations of a project, its ``.lake`` packages and the Lean sources.
+
+    Files are parsed once and re-parsed only when their mtime or size
+    changes. Dependencies (``.lake`` and the Lean sources) are only rescanned
+    when the toolchain or manifest changes. Files reported by a
+    :class:`ProjectWatcher` are re-parsed; unless the watcher is exact, the
+    project's own files are also rescanned at most every ``refresh_interval``
+    seconds. The index
+    is persisted so restarts only pay for the stat calls.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        cache_path: Optional[Path] = None,
+        refresh_interval: float = 2.0,
+        watcher: Optional[ProjectWatcher] = None,
+    ):
+        self.root = root
+        self.cache_path = cache_path
+        self.refresh_interval = refresh_interval
+        self._watcher = watcher
+        self._dirty: set[Path] = set()
+        self._dirty_lock = threading.Lock()
+        if watcher is not None:
+            watcher.subscribe(self._on_change)
+        self._lock = threading.Lock()
+        self._building = False
+        self._loaded = False
+        self._fingerprint: Optional[str] = None
+        self._checked = 0.0
+        # file -> (group, mtime_ns, size, [(name, kind, line)])
+        self._files: dict[str, tuple[str, int, int, list]] = {}
+        self._postings: dict[str, _Postings] = {}
+
+    @classmethod
+    def for_root(cls, root: Path) -> "DeclarationIndex":
+        cache_dir = get_cache_dir()
+        cache_path = None
+        if cache_dir is not None:
+            digest = hashlib.sha256(str(root).encode("utf-8")).hexdigest()[:32]
+            cache_path = cache_dir / "index" / f"{digest}.json"
+        # Watch before the first scan so no change falls in between
+        return cls(root, cache_path, watcher=get_watcher(root))
+
+    def _on_change(self, paths: set[Path]) -> None:
+        with self._dirty_lock:
+            self._dirty |= paths
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded
+
+    def _roots(self) -> dict[str, list[Path]]:
+        deps = [self.root / ".lake"]
+        if lean_src := _get_lean_src_search_path():
+            deps.append(Path(lean_src))
+        return {"project": [self.root], "deps": deps}
+
+    def _display_path(self, path: Path) -> str:
+        try:
+            return str(path.relative_to(self.root))
+        except ValueError:
+            return str(path)
+
+    def _walk(
+        self, group: str, top: Path
+    ) -> Iterator[tuple[str, Path, os.stat_result]]:
+        for dirpath, dirnames, filenames in os.walk(top):
+            current = Path(dirpath)
+            # Build outputs and VCS data never contain sources we want
+            dirnames[:] = [
+                d
+                for d in dirnames
+                if d != ".git"
+                and not (d == "build" and current.name == ".lake")
+                and not (group == "project" and d == ".lake" and current == self.root)
+            ]
+            for filename in filenames:
+                if not filename.endswith(".lean") or filename.startswith("_mcp_"):
+                    continue
+                path = current / filename
+                try:
+                    yield self._display_path(path), path, path.stat()
+                except OSError:
+                    continue
+
+    def _load(self) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            data = orjson.loads(self.cache_path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return
+        if data.get("version") != _INDEX_VERSION:
+            return
+        self._fingerprint = data.get("fingerprint")
+        self._files = {
+            file: (group, mtime, size, [tuple(d) for d in decls])
+            for file, (group, mtime, size, decls) in data.get("files", {}).items()
+        }
+
+    def _save(self) -> None:
+        if self.cache_path is None:
+            return
+        data = {
+            "version": _INDEX_VERSION,
+            "fingerprint": self._fingerprint,
+            "files": self._files,
+        }
+        try:
+            write_json_atomic(self.cache_path, data)
+        except OSError as exc:
+            logger.warning(
+                "Failed to save declaration index `%s`: %s", self.cache_path, exc
+            )
+
+    def _rescan(self, group: str) -> bool:
+        """Re-parse changed files of ``group``; return whether anything changed."""
+        seen = set()
+        changed = False
+        for top in self._roots()[group]:
+            for file, path, stat in self._walk(group, top):
+                seen.add(file)
+                entry = self._files.get(file)
+                if entry and entry[1] == stat.st_mtime_ns and entry[2] == stat.st_size:
+                    continue
+                try:
+                    decls = scan_declarations(path.read_bytes())
+                except OSError:
+                    continue
+                self._files[file] = (group, stat.st_mtime_ns, stat.st_size, decls)
+                changed = True
+
+        stale = [
+            f for f, entry in self._files.items() if entry[0] == group and f not in seen
+        ]
+        for file in stale:
+            del self._files[file]
+        return changed or bool(stale)
+
+    def _group_of(self, path: Path) -> str:
+        return "deps" if path.is_relative_to(self.root / ".lake") else "project"
+
+    def _apply_changes(self, paths: set[Path]) -> set[str]:
+        """Re-parse files reported by the watcher; return the groups that changed."""
+        groups = set()
+        rescan = set()
+        for path in paths:
+            if not path.name.endswith(".lean"):
+                # Directory or setup change: fall back to a scan of the affected group
+                # (dependencies are not watched, they follow the fingerprint)
+                rescan.add(self._group_of(path))
+                continue
+            group = self._group_of(path)
+            file = self._display_path(path)
+            try:
+                stat = path.stat()
+                decls = scan_declarations(path.read_bytes())
+            except OSError:
+                if self._files.pop(file, None) is not None:
+                    groups.add(group)
+                continue
+            self._files[file] = (group, stat.st_mtime_ns, stat.st_size, decls)
+            groups.add(group)
+
+        for group in rescan:
+            self._rescan(group)
+        return groups | rescan
+
+    def _rebuild_postings(self, group: str) -> None:
+        decls = [
+            Declaration(name, kind, file, line)
+            for file, (g, _, _, entries) in self._files.items()
+            if g == group
+            for name, kind, line in entries
+        ]
+        self._postings[group] = _Postings(decls)
+
+    def refresh(self, force: bool = False) -> None:
+        """Bring the index up to date with the files on disk."""
+        with self._lock:
+            first = not self._loaded
+            if first:
+                self._load()
+
+            dirty = set()
+            if self._watcher is not None:
+                self._watcher.sync()
+                with self._dirty_lock:
+                    changed, self._dirty = self._dirty, set()
+                if not first:
+                    dirty |= self._apply_changes(changed)
+
+            fingerprint = current_fingerprint(self.root)
+            if fingerprint != self._fingerprint:
+                self._fingerprint = fingerprint
+                self._rescan("deps")
+                dirty.add("deps")
+
+            now = time.monotonic()
+            # Without exact stamps (polling, or watches not set up yet) check mtimes too
+            exact = self._watcher is not None and self._watcher.is_exact()
+            periodic = not exact and now - self._checked > self.refresh_interval
+            if force or first or periodic:
+                if self._rescan("project"):
+                    dirty.add("project")
+                self._checked = now
+
+            if dirty:
+                self._save()
+            for group in {"project", "deps"} if first else dirty:
+                self._rebuild_postings(group)
+            self._loaded = True
+
+    def build_in_background(self) -> None:
+        """Start building the index in a daemon thread unless already running."""
+        with self._lock:
+            if self._building or self._loaded:
+                return
+            self._building = True
+
+        def _build() -> None:
+            try:
+                self.refresh()
+                # Typo matching structures would otherwise be built by the first fuzzy query
+                for postings in list(self._postings.values()):
+                    postings._short_names()
+            except Exception as exc:  # pragma: no cover - logged for diagnosis
+                logger.warning(
+                    "Building declaration index for `%s` failed: %s", self.root, exc
+                )
+            finally:
+                self._building = False
+
+        threading.Thread(target=_build, name="lean-decl-index", daemon=True).start()
+
+    def files(self) -> dict[str, list[tuple[str, int, int]]]:
+        """``(file, mtime_ns, size)`` of the indexed files per group, after a refresh."""
+        self.refresh()
+        with self._lock:
+            groups: dict[str, list[tuple[str, int, int]]] = {"project": [], "deps": []}
+            for file, (group, mtime, size, _) in self._files.items():
+                groups[group].append((file, mtime, size))
+        for files in groups.values():
+            files.sort()
+        return groups
+
+    def search(self, query: str, limit: int = 32) -> list[dict[str, str]]:
+        """Declarations matching ``query``, best matches first.
+
+        Exact names rank first, then namespace suffixes (``add_comm`` finds
+        ``Nat.add_comm``), prefixes of the name or a dotted component, segment
+        initials (``hda`` finds ``HasDerivAt``), substrings and names within
+        one or two typos. Like ``rg --smart-case``, exact and prefix matches
+        ignore case unless the query has uppercase letters.
+        """
+        return self.search_many([query], limit)[query]
+
+    def search_many(
+        self, queries: list[str], limit: int = 32
+    ) -> dict[str, list[dict[str, str]]]:
+        """Like :meth:`search` for several queries, checking for changed files once."""
+        self.refresh()
+        postings = [
+            self._postings[g] for g in ("project", "deps") if g in self._postings
+        ]
+        return {query: rank_declarations(postings, query, limit) for query in queries}
+
+
+def rank_declarations(
+    postings: list[_Postings], query: str, limit: int
+) -> list[dict[str, str]]:
+    case_sensitive = query != query.lower()
+    lowered = query.lower()
+    # Enough prefix hits to find the shortest names among them
+    cap = max(limit * 20, 200)
+    best: dict[Declaration, tuple[int, int]] = {}
+
+    def consider(decl: Declaration, score: int, order: int) -> None:
+        if score > best.get(decl, (-1,))[0]:
+            best[decl] = (score, order)
+
+    for order, p in enumerate(postings):
+        for n, (key, decl) in enumerate(p.prefix(lowered)):
+            if n >= cap:
+                break
+            if case_sensitive and not _matches_case(decl.name, query):
+                continue
+            consider(decl, _score_prefix(decl.name, key, lowered), order)
+
+    # Loose matches compare the last component; a given namespace must still appear
+    short_query = _short_name(lowered)
+    namespace = lowered[: -len(short_query)] if short_query != lowered else ""
+
+    def in_namespace(decl: Declaration) -> bool:
+        return not namespace or namespace in decl.name.lower()
+
+    if len(best) < limit and len(short_query) >= 2:
+        for order, p in enumerate(postings):
+            for decl in p.initials(short_query, cap):
+                if in_namespace(decl):
+                    consider(decl, INITIALS, order)
+
+    if len(best) < limit and len(short_query) >= 3:
+        max_distance = 1 if len(short_query) <= 5 else 2
+        for order, p in enumerate(postings):
+            for score, decl in p.fuzzy(short_query, max_distance, cap):
+                if in_namespace(decl):
+                    consider(decl, score, order)
+
+    ranked = sorted(
+        best.items(),
+        key=lambda item: (-item[1][0], item[1][1], len(item[0].name), item[0].name),
+    )
+    return [
+        {"name": decl.name, "kind": decl.kind, "file": decl.file}
+        for decl, _ in ranked[:limit]
+    ]
+
+
+_INDEXES: dict[Path, DeclarationIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_declaration_index(root: Path) -> DeclarationIndex:
+    """Shared index for ``root`` (one per process, used by all sessions)."""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(root)
+        if index is None:
+            index = _INDEXES[root] = DeclarationIndex.for_root(root)
+        return index
@@ -7,6 +7,8 @@ INSTRUCTIONS = """## General Rules
 ## Key Tools
 - lean_file_outline: Concise skeleton of a file (imports, docstrings, declarations). Token efficient.
 - lean_local_search: Confirm declarations (theorems/lemmas/defs/etc.) exist. VERY USEFUL AND FAST!
+- lean_local_search_batch: Same as lean_local_search for a list of names in one call.
+- lean_local_semantic_search: Offline keyword / natural language search over the project and Mathlib. No rate limit.
 - lean_goal: Check proof state. USE OFTEN!
 - lean_diagnostic_messages: Understand current proof situation.
 - lean_hover_info: Documentation about terms and lean syntax.
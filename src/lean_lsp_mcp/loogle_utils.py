@@ -0,0 +1,347 @@
+"""Local loogle: constant and subexpression search over the project's environment.
+
+A Lean metaprogram imports the project's modules once per build and writes
+every declaration with the constants of its type to a JSON lines file. Queries
+are answered from an inverted index (constant -> declarations), so
+``lean_loogle`` is no longer bound to the public service and its rate limit.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from array import array
+from pathlib import Path
+from typing import Optional
+
+import orjson
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.build_utils import lean_libs
+from lean_lsp_mcp.cache_utils import get_cache_dir, project_fingerprint
+
+
+logger = get_logger(__name__)
+
+INDEXER_SOURCE = r"""import Lean
+open Lean Meta
+
+def entry (name module : Name) (type doc : String) (consts concl : Array Name) : Json :=
+  Json.mkObj [
+    ("name", toJson name.toString),
+    ("module", toJson module.toString),
+    ("type", toJson type),
+    ("doc", toJson doc),
+    ("consts", toJson (consts.map (·.toString))),
+    ("concl", toJson (concl.map (·.toString)))
+  ]
+
+def indexConstants (out : IO.FS.Handle) : MetaM Unit := do
+  let env ← getEnv
+  for (name, info) in env.constants.toList do
+    if name.isInternal || info.isUnsafe || isAuxRecursor env name || isNoConfusion env name then
+      continue
+    let some idx := env.getModuleIdxFor? name | continue
+    let module := env.header.moduleNames[idx.toNat]!
+    let type ← try pure (toString (← ppExpr info.type)) catch _ => pure ""
+    let doc := (← findDocString? env name).getD ""
+    let concl := info.type.getForallBody.getUsedConstants
+    out.putStrLn (entry name module type doc info.type.getUsedConstants concl).compress
+
+unsafe def main (args : List String) : IO UInt32 := do
+  let out ← IO.FS.Handle.mk args[0]! .write
+  let imports := (args.drop 1).toArray.map fun m => ({ module := m.toName } : Import)
+  initSearchPath (← findSysroot)
+  enableInitializersExecution
+  let env ← importModules imports {} (trustLevel := 1024)
+  let ctx : Core.Context := { fileName := "<loogle-index>", fileMap := default, maxHeartbeats := 0 }
+  discard <| (indexConstants out).run' |>.toIO ctx { env }
+  return 0
+"""
+
+# Notation whose head constant a subexpression query implicitly mentions
+_OPERATORS = {
+    "+": "HAdd.hAdd",
+    "-": "HSub.hSub",
+    "*": "HMul.hMul",
+    "/": "HDiv.hDiv",
+    "%": "HMod.hMod",
+    "^": "HPow.hPow",
+    "•": "HSMul.hSMul",
+    "∣": "Dvd.dvd",
+    "=": "Eq",
+    "≠": "Ne",
+    "≤": "LE.le",
+    "<": "LT.lt",
+    "∧": "And",
+    "∨": "Or",
+    "¬": "Not",
+    "↔": "Iff",
+    "∈": "Membership.mem",
+    "∩": "Inter.inter",
+    "∪": "Union.union",
+    "⊆": "HasSubset.Subset",
+    "∘": "Function.comp",
+    "∑": "Finset.sum",
+    "∏": "Finset.prod",
+    "⁻¹": "Inv.inv",
+    "√": "Real.sqrt",
+}
+_OPERATOR = re.compile(
+    "|".join(re.escape(op) for op in sorted(_OPERATORS, key=len, reverse=True))
+)
+_ARROWS = re.compile(r"->|→|<->|←|=>|↦")
+_IDENT = re.compile(r"(?<![?\w.])[^\W\d][\w.'!?]*")
+_STRING = re.compile(r'"([^"]*)"')
+
+
+def loogle_mode() -> str:
+    """``LEAN_LSP_LOOGLE``: ``remote`` (default) or ``local``."""
+    mode = os.environ.get("LEAN_LSP_LOOGLE", "remote").strip().lower()
+    return mode if mode in ("remote", "local") else "remote"
+
+
+def _split_terms(query: str) -> list[str]:
+    """Split a query at commas outside of brackets and strings."""
+    terms, depth, in_string, start = [], 0, False, 0
+    for i, c in enumerate(query):
+        if c == '"':
+            in_string = not in_string
+        elif not in_string and c in "([{⟨":
+            depth += 1
+        elif not in_string and c in ")]}⟩":
+            depth -= 1
+        elif not in_string and depth == 0 and c == ",":
+            terms.append(query[start:i])
+            start = i + 1
+    terms.append(query[start:])
+    return [t.strip() for t in terms if t.strip()]
+
+
+def default_imports(root: Path) -> list[str]:
+    """Root modules of the project's ``lean_lib`` targets, and ``Mathlib`` if it is a dependency."""
+    imports = []
+    for lib in lean_libs(root):
+        imports += [m for m in lib.roots if m not in imports]
+    if (root / ".lake" / "packages" / "mathlib").is_dir() and "Mathlib" not in imports:
+        imports.append("Mathlib")
+    return imports
+
+
+class LocalLoogle:
+    """Inverted index over the output of :data:`INDEXER_SOURCE`."""
+
+    def __init__(self, root: Path, index_path: Path, imports: list[str]):
+        self.root = root
+        self.index_path = index_path
+        self.imports = imports
+        self._lock = threading.Lock()
+        self._building = False
+        self._loaded = False
+        self.error: Optional[str] = None
+        self._names: list[str] = []
+        self._hits: list[bytes] = []
+        self._sizes: array = array("I")
+        self._consts: dict[str, array] = {}
+        self._concl: dict[str, array] = {}
+        self._by_short: Optional[dict[str, list[str]]] = None
+
+    @classmethod
+    def for_root(cls, root: Path) -> "LocalLoogle":
+        cache_dir = get_cache_dir()
+        if cache_dir is None:
+            cache_dir = Path(tempfile.gettempdir()) / "lean-lsp-mcp"
+        digest = project_fingerprint(root)[:32]
+        imports = [
+            m.strip()
+            for m in os.environ.get("LEAN_LSP_LOOGLE_IMPORTS", "").split(",")
+            if m.strip()
+        ]
+        if not imports:
+            imports = default_imports(root)
+        return cls(root, cache_dir / "loogle" / f"{digest}.jsonl", imports)
+
+    @property
+    def ready(self) -> bool:
+        """Whether queries can be answered locally (an empty index cannot answer any)."""
+        if not self.imports:
+            return False
+        if not self._loaded and self.index_path.exists():
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+        return self._loaded and bool(self._names)
+
+    def build(self) -> None:
+        """Run the indexer in the project's environment (``lake env lean --run``) and load it."""
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        script = self.index_path.with_suffix(".lean")
+        script.write_text(INDEXER_SOURCE, encoding="utf-8")
+        tmp = self.index_path.with_suffix(".tmp")
+        command = ["lake", "env", "lean", "--run", str(script), str(tmp), *self.imports]
+        logger.info("Building local loogle index: %s", " ".join(command))
+        result = subprocess.run(
+            command,
+            cwd=self.root,
+            capture_output=True,
+            text=True,
+            timeout=3600,
+            check=False,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                result.stderr.strip() or result.stdout.strip() or "indexer failed"
+            )
+        os.replace(tmp, self.index_path)
+        with self._lock:
+            self._load()
+
+    def build_in_background(self, force: bool = False) -> None:
+        """Start :meth:`build` unless it is running or failed before (``force`` retries)."""
+        with self._lock:
+            if self._building or (self.error is not None and not force):
+                return
+            if not self.imports:
+                self.error = (
+                    "No modules to index: the project has no lean_lib and no Mathlib."
+                )
+                return
+            self._building = True
+
+        def run() -> None:
+            try:
+                self.build()
+                self.error = None
+            except (OSError, RuntimeError, subprocess.SubprocessError) as exc:
+                self.error = str(exc)
+                logger.warning("Local loogle index failed: %s", exc)
+            finally:
+                with self._lock:
+                    self._building = False
+
+        threading.Thread(target=run, name="lean-loogle-index", daemon=True).start()
+
+    def _load(self) -> None:
+        names, hits, sizes = [], [], array("I")
+        consts: dict[str, array] = {}
+        concl: dict[str, array] = {}
+        try:
+            with open(self.index_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue
+                    decl = len(names)
+                    names.append(entry["name"])
+                    # Same shape as loogle.lean-lang.org hits (minus ``doc``, see ``lean_loogle``)
+                    hits.append(
+                        orjson.dumps({k: entry[k] for k in ("name", "type", "module")})
+                    )
+                    sizes.append(len(entry["consts"]))
+                    for const in entry["consts"]:
+                        consts.setdefault(const, array("I")).append(decl)
+                    for const in entry["concl"]:
+                        concl.setdefault(const, array("I")).append(decl)
+        except OSError as exc:
+            logger.warning(
+                "Cannot read local loogle index `%s`: %s", self.index_path, exc
+            )
+            return
+        self._names, self._hits, self._sizes = names, hits, sizes
+        self._consts, self._concl = consts, concl
+        self._by_short = None
+        self._loaded = True
+        logger.info("Loaded local loogle index with %d declarations", len(names))
+
+    def _resolve(self, ident: str) -> Optional[str]:
+        ident = ident.removeprefix("_root_.")
+        if ident in self._consts:
+            return ident
+        # Unambiguous last components resolve like an opened namespace (``sin``: ``Real.sin``)
+        if self._by_short is None:
+            by_short: dict[str, list[str]] = {}
+            for const in self._consts:
+                by_short.setdefault(const.rsplit(".", 1)[-1], []).append(const)
+            self._by_short = by_short
+        candidates = self._by_short.get(ident, [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _term_constants(self, term: str) -> tuple[set[str], Optional[str]]:
+        """Constants mentioned by a subexpression or type pattern, or an error."""
+        consts = {_OPERATORS[op] for op in _OPERATOR.findall(_ARROWS.sub(" ", term))}
+        for ident in _IDENT.findall(_STRING.sub(" ", term)):
+            if ident == "_":
+                continue
+            resolved = self._resolve(ident)
+            if resolved is not None:
+                consts.add(resolved)
+            elif len(ident) > 2 or ident[0].isupper():
+                # Short lowercase names are variables of the pattern
+                return set(), f"Unknown identifier '{ident}'"
+        return consts, None
+
+    def search(self, query: str, num_results: int = 8) -> list[dict] | str:
+        """Declarations matching all comma separated parts of ``query``.
+
+        Supported parts: constants (``Real.sin``), name substrings
+        (``"differ"``), subexpressions and type shapes (``_ * (_ ^ _)``,
+        ``(?a -> ?b) -> List ?a -> List ?b``) and conclusions (``⊢ _ < _``).
+        Patterns match by the constants they mention, a superset of what
+        loogle's unification finds.
+        """
+        if not self.ready:
+            return "Local loogle index is not built yet."
+        postings: list[array] = []
+        substrings: list[str] = []
+        for term in _split_terms(query):
+            conclusion = term.startswith(("⊢", "|-"))
+            if conclusion:
+                term = term.lstrip("⊢|-").strip()
+            elif (m := _STRING.fullmatch(term)) is not None:
+                substrings.append(m.group(1).lower())
+                continue
+            consts, error = self._term_constants(term)
+            if error:
+                return error
+            index = self._concl if conclusion else self._consts
+            postings.extend(index.get(c, array("I")) for c in consts)
+
+        if not postings and not substrings:
+            return "Query needs at least one constant or name substring."
+
+        if postings:
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for decls in postings[1:]:
+                candidates.intersection_update(decls)
+                if not candidates:
+                    break
+        else:
+            candidates = range(len(self._names))
+        matches = [
+            d
+            for d in candidates
+            if all(s in self._names[d].lower() for s in substrings)
+        ]
+        # Simplest statements first, like loogle's ordering by size
+        matches.sort(
+            key=lambda d: (self._sizes[d], len(self._names[d]), self._names[d])
+        )
+        return [orjson.loads(self._hits[d]) for d in matches[:num_results]]
+
+
+_LOOGLES: dict[Path, LocalLoogle] = {}
+_LOOGLES_LOCK = threading.Lock()
+
+
+def get_local_loogle(root: Path) -> LocalLoogle:
+    """Shared local loogle for ``root`` (one per process)."""
+    with _LOOGLES_LOCK:
+        loogle = _LOOGLES.get(root)
+        if loogle is None:
+            loogle = _LOOGLES[root] = LocalLoogle.for_root(root)
+        return loogle
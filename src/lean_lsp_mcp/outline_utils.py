@@ -1,41 +1,59 @@
+import os
 import re
+import uuid
+from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from leanclient import LeanLSPClient
-from leanclient.utils import DocumentContentChange
+
+from lean_lsp_mcp.client_utils import lock_file
 
 
 METHOD_KIND = {6, "method"}
 KIND_TAGS = {"namespace": "Ns"}
 
 
-def _get_info_trees(client: LeanLSPClient, path: str, symbols: List[Dict]) -> Dict[str, str]:
-    """Insert #info_trees commands, collect diagnostics, then revert changes."""
+def _get_info_trees(
+    client: LeanLSPClient, content: str, symbols: List[Dict]
+) -> Dict[str, str]:
+    """Elaborate a scratch copy with #info_trees commands and collect their diagnostics.
+
+    The user's document is never edited, so concurrent tools keep seeing the real file.
+    """
     if not symbols:
         return {}
 
+    lines = content.split("\n")
     symbol_by_line = {}
-    changes = []
-    for i, sym in enumerate(sorted(symbols, key=lambda s: s['range']['start']['line'])):
-        line = sym['range']['start']['line'] + i
-        symbol_by_line[line] = sym['name']
-        changes.append(DocumentContentChange("#info_trees in\n", [line, 0], [line, 0]))
-
-    client.update_file(path, changes)
-    diagnostics = client.get_diagnostics(path)
-
-    info_trees = {
+    for i, sym in enumerate(sorted(symbols, key=lambda s: s["range"]["start"]["line"])):
+        start = sym["range"]["start"]["line"]
+        symbol_by_line[start + i] = sym["name"]
+        lines.insert(start + i, "#info_trees in")
+
+    scratch = f"_mcp_outline_{uuid.uuid4().hex}.lean"
+    abs_path = Path(client.project_path) / scratch
+    with open(abs_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+    try:
+        with lock_file(client, scratch):
+            try:
+                client.open_file(scratch)
+            finally:
+                os.remove(abs_path)
+            try:
+                diagnostics = client.get_diagnostics(scratch)
+            finally:
+                client.close_files([scratch])
+    finally:
+        if abs_path.exists():
+            os.remove(abs_path)
+
+    return {
         symbol_by_line[diag['range']['start']['line']]: diag['message']
         for diag in diagnostics
         if diag['severity'] == 3 and diag['range']['start']['line'] in symbol_by_line
     }
 
-    # Revert in reverse order
-    client.update_file(path, [
-        DocumentContentChange("", [line, 0], [line + 1, 0])
-        for line in sorted(symbol_by_line.keys(), reverse=True)
-    ])
-    return info_trees
-
 
 def _extract_type(info: str, name: str) -> Optional[str]:
     """Extract type signature from info tree message."""
@@ -159,15 +177,19 @@ def _format_symbol(sym: Dict, type_sigs: Dict, fields_map: Dict, indent: int) ->
 
 
 def generate_outline(client: LeanLSPClient, path: str) -> str:
-    """Generate a concise outline of a Lean file showing structure and signatures."""
-    client.open_file(path)
-    content = client.get_file_content(path)
+    """Generate a concise outline of a Lean file showing structure and signatures.
+
+    Takes the file lock itself; do not call while holding it for ``path``.
+    """
+    with lock_file(client, path):
+        client.open_file(path)
+        content = client.get_file_content(path)
+        symbols = client.get_document_symbols(path)
 
     # Extract imports
     imports = [line.strip()[7:] for line in content.splitlines() 
                if line.strip().startswith("import ")]
 
-    symbols = client.get_document_symbols(path)
     if not symbols and not imports:
         return f"# {path}\n\n*No symbols or imports found*\n"
 
@@ -176,7 +198,7 @@ def generate_outline(client: LeanLSPClient, path: str) -> str:
 
     # Get info trees only for LSP symbols (not extracted declarations)
     lsp_methods = [s for s, _ in all_symbols if s.get('kind') in METHOD_KIND and '_keyword' not in s]
-    info_trees = _get_info_trees(client, path, lsp_methods)
+    info_trees = _get_info_trees(client, content, lsp_methods)
 
     # Extract type signatures and fields from info trees
     type_sigs = {name: sig for name, info in info_trees.items() 
@@ -0,0 +1,161 @@
+"""Rate limits for the external services, shared by all sessions (and optionally processes)."""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from lean_lsp_mcp.state_utils import SharedState, get_shared_state
+
+
+class RateLimiter:
+    """Generic cell rate algorithm (GCRA), equivalent to a token bucket.
+
+    Allows bursts of ``max_requests`` and then one request every
+    ``per_seconds / max_requests`` seconds. The state is a single timestamp
+    (the theoretical arrival time), so every call is O(1). Callers may
+    reserve a slot up to ``max_wait`` seconds in the future and sleep until
+    it starts instead of being rejected.
+    """
+
+    def __init__(
+        self,
+        max_requests: int,
+        per_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_requests = max(1, max_requests)
+        self.per_seconds = per_seconds
+        self.interval = per_seconds / self.max_requests
+        self.tolerance = per_seconds - self.interval
+        self._clock = clock
+        self._state = {
+            "tat": 0.0,
+            "allowed": 0,
+            "delayed": 0,
+            "rejected": 0,
+            "wait_seconds": 0.0,
+        }
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[dict]:
+        with self._lock:
+            yield self._state
+
+    def reserve(self, max_wait: float = 0.0) -> Optional[float]:
+        """Take a slot starting within ``max_wait`` seconds.
+
+        Returns the delay until the slot starts (``0.0`` if now), or ``None``
+        if no slot is free in time; nothing is taken in that case.
+        """
+        with self._locked() as state:
+            now = self._clock()
+            tat = max(state["tat"], now)
+            delay = max(0.0, tat - self.tolerance - now)
+            if delay > max_wait:
+                state["rejected"] += 1
+                return None
+            state["tat"] = tat + self.interval
+            state["allowed"] += 1
+            if delay > 0:
+                state["delayed"] += 1
+                state["wait_seconds"] += delay
+            return delay
+
+    def retry_after(self) -> float:
+        """Seconds until the next slot is free."""
+        with self._locked() as state:
+            return max(0.0, state["tat"] - self.tolerance - self._clock())
+
+    def stats(self) -> dict:
+        with self._locked() as state:
+            now = self._clock()
+            if state["tat"] <= now:
+                available = self.max_requests
+            else:
+                available = max(
+                    0,
+                    math.floor((now + self.tolerance - state["tat"]) / self.interval)
+                    + 1,
+                )
+            return {
+                "limit": f"{self.max_requests}/{self.per_seconds:g}s",
+                "available": available,
+                "allowed": state["allowed"],
+                "delayed": state["delayed"],
+                "rejected": state["rejected"],
+                "wait_seconds": round(state["wait_seconds"], 3),
+            }
+
+
+class SharedRateLimiter(RateLimiter):
+    """:class:`RateLimiter` whose bucket lives in a :class:`SharedState` database.
+
+    Every server process using the same database draws from the same
+    budget. Uses the wall clock, which unlike ``time.monotonic`` is
+    comparable between processes.
+    """
+
+    def __init__(
+        self,
+        store: SharedState,
+        category: str,
+        max_requests: int,
+        per_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(max_requests, per_seconds, clock=clock)
+        self.store = store
+        self.category = category
+
+    @contextmanager
+    def _locked(self) -> Iterator[dict]:
+        with self._lock, self.store.limiter(self.category) as state:
+            yield state
+
+
+# Shared by every session (AppContext.rate_limit), so many clients of one
+# server process cannot exceed a service's budget together. With
+# LEAN_LSP_SHARED_STATE the buckets are also shared between processes.
+RATE_LIMITERS: dict[str, RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(
+    limiters: dict[str, RateLimiter],
+    category: str,
+    max_requests: int,
+    per_seconds: float,
+) -> RateLimiter:
+    with _LIMITERS_LOCK:
+        limiter = limiters.get(category)
+        if limiter is None:
+            store = get_shared_state()
+            if store is not None:
+                limiter = SharedRateLimiter(store, category, max_requests, per_seconds)
+            else:
+                limiter = RateLimiter(max_requests, per_seconds)
+            limiters[category] = limiter
+        return limiter
+
+
+def rate_limit_stats(
+    limiters: dict[str, RateLimiter] = RATE_LIMITERS,
+) -> dict[str, dict]:
+    """Counters of all limiters, e.g. for monitoring a shared server."""
+    with _LIMITERS_LOCK:
+        items = list(limiters.items())
+    return {category: limiter.stats() for category, limiter in items}
+
+
+def max_wait_from_env() -> float:
+    """``LEAN_LSP_RATE_LIMIT_WAIT``: seconds a call may wait for a free slot (``0`` rejects)."""
+    try:
+        return max(0.0, float(os.environ.get("LEAN_LSP_RATE_LIMIT_WAIT", "0")))
+    except ValueError:
+        return 0.0
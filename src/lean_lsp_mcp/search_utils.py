@@ -2,12 +2,14 @@
 
 from __future__ import annotations
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
+from contextlib import closing
 from functools import lru_cache
 import platform
 import re
 import shutil
 import subprocess
+import tempfile
 from orjson import loads as _json_loads
 from pathlib import Path
 
@@ -49,6 +51,9 @@ def check_ripgrep_status() -> tuple[bool, str]:
     return False, "\n".join(lines)
 
 
+_DECL_PREFIX = r"^\s*(?:theorem|lemma|def|axiom|class|instance|structure|inductive|abbrev|opaque)\s+"
+
+
 def lean_local_search(
     query: str,
     limit: int = 32,
@@ -58,15 +63,146 @@ def lean_local_search(
     root = (project_root or Path.cwd()).resolve()
 
     pattern = (
-        rf"^\s*(?:theorem|lemma|def|axiom|class|instance|structure|inductive|abbrev|opaque)\s+"
+        rf"{_DECL_PREFIX}"
         rf"(?:[A-Za-z0-9_'.]+\.)*{re.escape(query)}[A-Za-z0-9_'.]*(?:\s|:)"
     )
 
-    command = [
+    errors: list[str] = []
+    matches = []
+    with closing(_iter_matches(pattern, root, errors)) as stream:
+        for match in stream:
+            matches.append(match)
+            if len(matches) >= limit:
+                break
+
+    if errors and not matches:
+        raise RuntimeError("\n".join(errors))
+
+    return matches
+
+
+def lean_local_search_batch(
+    queries: list[str],
+    limit: int = 32,
+    project_root: Path | None = None,
+) -> dict[str, list[dict[str, str]]]:
+    """Answer several :func:`lean_local_search` queries with a single ripgrep pass.
+
+    Each query keeps its own smart-case semantics and limit; the scan stops
+    once every query has ``limit`` matches.
+    """
+    root = (project_root or Path.cwd()).resolve()
+    queries = list(dict.fromkeys(queries))
+    results: dict[str, list[dict[str, str]]] = {q: [] for q in queries}
+    if not queries:
+        return results
+
+    alternatives = "|".join(re.escape(q) for q in queries)
+    pattern = (
+        rf"{_DECL_PREFIX}"
+        rf"(?:[A-Za-z0-9_'.]+\.)*(?:{alternatives})[A-Za-z0-9_'.]*(?:\s|:)"
+    )
+
+    errors: list[str] = []
+    open_queries = set(queries)
+    with closing(
+        _iter_matches(pattern, root, errors, case_flag="--ignore-case")
+    ) as stream:
+        for match in stream:
+            for query in list(open_queries):
+                if not _matches_query(match["name"], query):
+                    continue
+                results[query].append(match)
+                if len(results[query]) >= limit:
+                    open_queries.discard(query)
+            if not open_queries:
+                break
+
+    if errors and not any(results.values()):
+        raise RuntimeError("\n".join(errors))
+
+    return results
+
+
+def _matches_query(name: str, query: str) -> bool:
+    """Whether ``query`` starts ``name`` or one of its dotted components (smart case)."""
+    if query == query.lower():
+        name = name.lower()
+    starts = [0] + [i + 1 for i, c in enumerate(name) if c == "."]
+    return any(name.startswith(query, i) for i in starts)
+
+
+def _iter_matches(
+    pattern: str, root: Path, errors: list[str], case_flag: str = "--smart-case"
+) -> Iterator[dict[str, str]]:
+    """Yield declaration matches while ripgrep is still running.
+
+    One process per tree scans the project and the Lean sources concurrently.
+    Closing the generator kills the processes; errors of processes that
+    finished on their own are appended to ``errors``.
+    """
+    paths = [str(root)]
+    if lean_src := _get_lean_src_search_path():
+        paths.append(lean_src)
+
+    # stderr goes to a file: a full stderr pipe would block ripgrep while we
+    # wait for its stdout
+    stderr_files = [
+        tempfile.TemporaryFile("w+", encoding="utf-8", errors="replace") for _ in paths
+    ]
+    processes = [
+        subprocess.Popen(
+            _rg_command(pattern, path, case_flag),
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            cwd=str(root),
+        )
+        for path, stderr_file in zip(paths, stderr_files)
+    ]
+
+    try:
+        for process in processes:
+            for line in process.stdout:
+                if (
+                    not line.strip()
+                    or (event := _json_loads(line)).get("type") != "match"
+                ):
+                    continue
+
+                data = event["data"]
+                parts = data["lines"]["text"].lstrip().split(maxsplit=2)
+                if len(parts) < 2:
+                    continue
+
+                decl_kind, decl_name = parts[0], parts[1].rstrip(":")
+                file_path = Path(data["path"]["text"])
+                abs_path = (
+                    file_path
+                    if file_path.is_absolute()
+                    else (root / file_path).resolve()
+                )
+
+                try:
+                    display_path = str(abs_path.relative_to(root))
+                except ValueError:
+                    display_path = str(file_path)
+
+                yield {"name": decl_name, "kind": decl_kind, "file": display_path}
+            # Output is complete, let it exit so its errors are reported
+            process.wait()
+    finally:
+        errors.extend(_stop_processes(processes, stderr_files))
+
+
+def _rg_command(pattern: str, path: str, case_flag: str = "--smart-case") -> list[str]:
+    return [
         "rg",
         "--json",
         "--no-ignore",
-        "--smart-case",
+        case_flag,
         "--hidden",
         "--color",
         "never",
@@ -78,47 +214,27 @@ def lean_local_search(
         "-g",
         "!.lake/build/**",
         pattern,
-        str(root),
+        path,
     ]
 
-    if lean_src := _get_lean_src_search_path():
-        command.append(lean_src)
-
-    result = subprocess.run(command, capture_output=True, text=True, cwd=str(root))
-
-    matches = []
-    for line in result.stdout.splitlines():
-        if not line or (event := _json_loads(line)).get("type") != "match":
-            continue
-
-        data = event["data"]
-        parts = data["lines"]["text"].lstrip().split(maxsplit=2)
-        if len(parts) < 2:
-            continue
-
-        decl_kind, decl_name = parts[0], parts[1].rstrip(":")
-        file_path = Path(data["path"]["text"])
-        abs_path = (
-            file_path if file_path.is_absolute() else (root / file_path).resolve()
-        )
 
-        try:
-            display_path = str(abs_path.relative_to(root))
-        except ValueError:
-            display_path = str(file_path)
-
-        matches.append({"name": decl_name, "kind": decl_kind, "file": display_path})
-
-        if len(matches) >= limit:
-            break
-
-    if result.returncode not in (0, 1) and not matches:
-        error_msg = f"ripgrep exited with code {result.returncode}"
-        if result.stderr:
-            error_msg += f"\n{result.stderr}"
-        raise RuntimeError(error_msg)
-
-    return matches
+def _stop_processes(processes: list[subprocess.Popen], stderr_files: list) -> list[str]:
+    """Kill searches that are still running and return errors of finished ones."""
+    errors = []
+    for process, stderr_file in zip(processes, stderr_files):
+        stopped_early = process.poll() is None
+        if stopped_early:
+            process.kill()
+        process.communicate()
+        with stderr_file:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().strip()
+        if not stopped_early and process.returncode not in (0, 1):
+            error_msg = f"ripgrep exited with code {process.returncode}"
+            if stderr:
+                error_msg += f"\n{stderr}"
+            errors.append(error_msg)
+    return errors
 
 
 @lru_cache(maxsize=1)
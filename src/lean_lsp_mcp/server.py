@@ -5,35 +5,77 @@ import time
 from typing import List, Optional, Dict
 from contextlib import asynccontextmanager
 from collections.abc import AsyncIterator
-from dataclasses import dataclass
-import urllib
+from dataclasses import dataclass, field
 import orjson
 import functools
 import subprocess
 import uuid
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from pathlib import Path
 import json
-from google import genai
-from google.genai import types
-from openai import OpenAI
 
 from mcp.server.fastmcp import Context, FastMCP
 from mcp.server.fastmcp.utilities.logging import get_logger, configure_logging
 from mcp.server.auth.settings import AuthSettings
-from leanclient import LeanLSPClient, DocumentContentChange
-
+from leanclient import LeanLSPClient
+
+from lean_lsp_mcp.bm25_utils import get_local_semantic_search, numpy_available
+from lean_lsp_mcp.build_utils import (
+    BuildOutput,
+    BuildState,
+    build_log_path,
+    build_targets,
+    format_duration,
+    changed_oleans,
+    import_stamps,
+    module_name,
+    olean_snapshot,
+    parse_build_timings,
+    parse_imports,
+    read_imports,
+)
+from lean_lsp_mcp.cache_utils import (
+    DiagnosticsCache,
+    OutlineCache,
+    content_key,
+    current_fingerprint,
+    diagnostics_complete,
+    file_stamp,
+    project_fingerprint,
+)
 from lean_lsp_mcp.client_utils import (
-    setup_client_for_file,
+    CLIENT_LOCK,
+    ClientRegistry,
+    LeanWorkerPool,
+    create_client,
+    get_client_registry,
+    get_file_client,
+    lock_file,
     startup_client,
+    swap_client,
     infer_project_path,
 )
-from lean_lsp_mcp.file_utils import get_file_contents
+from lean_lsp_mcp.file_utils import get_file_contents, get_relative_file_path
+from lean_lsp_mcp.http_utils import RateLimitExceeded, cached_fetch, upstream_guard
+from lean_lsp_mcp.index_utils import get_declaration_index
 from lean_lsp_mcp.instructions import INFORAML_SOLUTION_PROMPT, GOLF_PROMPT, INSTRUCTIONS, VERIFY_PROMPT, REFINEMENT_PROMPT_TEMPLATE, INFORMAL_LLM_CREATE_LEAN_SKETCH
-from lean_lsp_mcp.search_utils import check_ripgrep_status, lean_local_search
+from lean_lsp_mcp.search_utils import (
+    check_ripgrep_status,
+    lean_local_search,
+    lean_local_search_batch,
+)
+from lean_lsp_mcp.loogle_utils import get_local_loogle, loogle_mode
 from lean_lsp_mcp.outline_utils import generate_outline
+from lean_lsp_mcp.rate_limit_utils import (
+    RATE_LIMITERS,
+    RateLimiter,
+    get_rate_limiter,
+    max_wait_from_env,
+    rate_limit_stats,
+)
+from lean_lsp_mcp.snapshot_utils import WarmDocuments, import_header, replace_line
 from lean_lsp_mcp.utils import (
-    OutputCapture,
     deprecated,
     extract_range,
     filter_diagnostics_by_position,
@@ -42,6 +84,7 @@ from lean_lsp_mcp.utils import (
     format_goal,
     format_line,
     get_declaration_range,
+    offload,
     OptionalTokenVerifier,
 )
 
@@ -141,8 +184,14 @@ def log_tool_execution(func):
 class AppContext:
     lean_project_path: Path | None
     client: LeanLSPClient | None
-    rate_limit: Dict[str, List[int]]
+    rate_limit: Dict[str, RateLimiter]
     lean_search_available: bool
+    client_registry: ClientRegistry = field(default_factory=ClientRegistry.from_env)
+    warm_documents: WarmDocuments = field(default_factory=WarmDocuments)
+    diagnostics_cache: DiagnosticsCache = field(
+        default_factory=DiagnosticsCache.from_env
+    )
+    outline_cache: OutlineCache = field(default_factory=OutlineCache.from_env)
 
 
 @asynccontextmanager
@@ -157,24 +206,19 @@ async def app_lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
         context = AppContext(
             lean_project_path=lean_project_path,
             client=None,
-            rate_limit={
-                "leandex": [],
-                "loogle": [],
-                "leanfinder": [],
-                "lean_state_search": [],
-                "hammer_premise": [],
-                "gemini_code_golf": [],
-                "gemini_informal_prover": [],
-                "gpt_informal_prover": [],
-                "discussion_partner": [],
-            },
+            rate_limit=RATE_LIMITERS,
             lean_search_available=_RG_AVAILABLE,
         )
         yield context
     finally:
+        stats = rate_limit_stats(context.rate_limit)
+        if stats:
+            logger.info(f"Rate limits: {stats}")
         logger.info("Closing Lean LSP client")
 
-        if context.client:
+        registered = context.client_registry.clients()
+        context.client_registry.close_all()
+        if context.client and context.client not in registered:
             context.client.close()
 
 
@@ -198,10 +242,25 @@ mcp = FastMCP(**mcp_kwargs)
 
 
 # Rate limiting: n requests per m seconds
-def rate_limited(category: str, max_requests: int, per_seconds: int):
+def rate_limited(
+    category: str,
+    max_requests: int,
+    per_seconds: int,
+    upstream: bool = False,
+    max_wait: Optional[float] = None,
+):
+    """Limit calls of a tool to ``max_requests`` per ``per_seconds`` seconds.
+
+    The budget is shared by all sessions. A call waits up to ``max_wait``
+    seconds (default ``LEAN_LSP_RATE_LIMIT_WAIT``, ``0``) for a free slot
+    before it is rejected. With ``upstream=True`` only real requests to the
+    external service count (see :func:`upstream_guard`): cached and coalesced
+    answers are free, and a wait delays just the request.
+    """
+
     def decorator(func):
         @functools.wraps(func)
-        def wrapper(*args, **kwargs):
+        async def wrapper(*args, **kwargs):
             ctx = kwargs.get("ctx")
             if ctx is None:
                 if not args:
@@ -209,18 +268,50 @@ def rate_limited(category: str, max_requests: int, per_seconds: int):
                         "rate_limited wrapper requires ctx as a keyword argument or the first positional argument"
                     )
                 ctx = args[0]
-            rate_limit = ctx.request_context.lifespan_context.rate_limit
-            current_time = int(time.time())
-            rate_limit[category] = [
-                timestamp
-                for timestamp in rate_limit[category]
-                if timestamp > current_time - per_seconds
-            ]
-            if len(rate_limit[category]) >= max_requests:
-                logger.warning(f"🚫 {func.__name__}: Rate limited") 
-                return f"Tool limit exceeded: {max_requests} requests per {per_seconds} s. Try again later."
-            rate_limit[category].append(current_time)
-            return func(*args, **kwargs)
+            limiter = get_rate_limiter(
+                ctx.request_context.lifespan_context.rate_limit,
+                category,
+                max_requests,
+                per_seconds,
+            )
+            wait = max_wait_from_env() if max_wait is None else max_wait
+
+            def rejection() -> str:
+                logger.warning(f"🚫 {func.__name__}: Rate limited")
+                return (
+                    f"Tool limit exceeded: {max_requests} requests per {per_seconds} s. "
+                    f"Try again in {limiter.retry_after():.0f} s."
+                )
+
+            async def sleep(delay: float) -> None:
+                # Only this call waits; the tool executor and event loop stay free
+                logger.info(f"⏳ {func.__name__}: waiting {delay:.1f}s for rate limit")
+                await asyncio.sleep(delay)
+
+            if not upstream:
+                delay = limiter.reserve(wait)
+                if delay is None:
+                    return rejection()
+                if delay > 0:
+                    await sleep(delay)
+                return await func(*args, **kwargs)
+
+            # The check runs in the tool's worker thread, right before a real
+            # request: cached_fetch waits there for the slot, so only the
+            # request is delayed and the tool body runs once.
+            rejected = []
+
+            def check() -> float:
+                delay = limiter.reserve(wait)
+                if delay is None:
+                    rejected.append(rejection())
+                    raise RateLimitExceeded(rejected[0])
+                return delay
+
+            with upstream_guard(check):
+                result = await func(*args, **kwargs)
+            # The tool reports the exception as its own error, replace it
+            return rejected[0] if rejected else result
 
         wrapper.__doc__ = f"Limit: {max_requests}req/{per_seconds}s. " + wrapper.__doc__
         return wrapper
@@ -232,20 +323,31 @@ def rate_limited(category: str, max_requests: int, per_seconds: int):
 @mcp.tool("lean_build")
 @log_tool_execution
 async def lsp_build(
-    ctx: Context, lean_project_path: str = None, clean: bool = False
-) -> str:
+    ctx: Context,
+    lean_project_path: str = None,
+    clean: bool = False,
+    target: Optional[str] = None,
+    stream: bool = False,
+) -> str | Dict:
     """Build the Lean project and restart the LSP Server.
 
-    Use only if needed (e.g. new imports).
+    Use only if needed (e.g. new imports). The server is only restarted if
+    modules were rebuilt.
 
     Args:
         lean_project_path (str, optional): Path to the Lean project. If not provided, it will be inferred from previous tool calls.
         clean (bool, optional): Run `lake clean` before building. Attention: Only use if it is really necessary! It can take a long time! Defaults to False.
+        target (str, optional): Only build this file or module (e.g. `MyProject.Basic`) and the library modules importing it. Builds the whole project if neither belongs to a `lean_lib`. Defaults to the whole project.
+        stream (bool, optional): Send every log line as a progress notification and return a compact summary (errors, warnings, slowest modules, last lines, log file) instead of the full output. Recommended for large projects. Defaults to False.
 
     Returns:
-        str: Build output or error msg
+        str | Dict: Build output or error msg. With `target`: built targets, per-module build times (slowest first) and output. With `stream`: summary
     """
-    logger.info(f"🔧 Tool: lean_build(lean_project_path={lean_project_path}, clean={clean})")
+    logger.info(
+        f"🔧 Tool: lean_build(lean_project_path={lean_project_path}, clean={clean}, target={target}, stream={stream})"
+    )
+    if not lean_project_path and target and target.endswith(".lean"):
+        infer_project_path(ctx, target)
     if not lean_project_path:
         lean_project_path_obj = ctx.request_context.lifespan_context.lean_project_path
     else:
@@ -255,41 +357,69 @@ async def lsp_build(
     if lean_project_path_obj is None:
         return "Lean project path not known yet. Provide `lean_project_path` explicitly or call a tool that infers it (e.g. `lean_file_contents`) before running `lean_build`."
 
+    targets = []
+    if target:
+        module = module_name(lean_project_path_obj, target)
+        if module is None:
+            return f"`{target}` is not part of the project `{lean_project_path_obj}`."
+        targets = await asyncio.to_thread(build_targets, lean_project_path_obj, module)
+
     build_output = ""
+    lifespan_context = ctx.request_context.lifespan_context
+    registry = get_client_registry(lifespan_context)
+    state = BuildState.for_project(lean_project_path_obj)
+    notes = []
+    if target and not targets:
+        notes.append(
+            f"`{target}` belongs to no `lean_lib` of the lakefile, built the whole project."
+        )
+    output = BuildOutput(build_log_path(lean_project_path_obj) if stream else None)
     try:
-        client: LeanLSPClient = ctx.request_context.lifespan_context.client
-        if client:
-            ctx.request_context.lifespan_context.client = None
-            client.close()
-
         if clean:
-            subprocess.run(["lake", "clean"], cwd=lean_project_path_obj, check=False)
+            await asyncio.to_thread(
+                subprocess.run,
+                ["lake", "clean"],
+                cwd=lean_project_path_obj,
+                check=False,
+            )
             logger.info("Ran `lake clean`")
-
-        # Fetch cache
-        subprocess.run(
-            ["lake", "exe", "cache", "get"], cwd=lean_project_path_obj, check=False
-        )
+        oleans_before = await asyncio.to_thread(olean_snapshot, lean_project_path_obj)
+
+        # Fetch cache, unless the manifest and toolchain are unchanged since the last fetch
+        if clean or state.needs_cache_get():
+            result = await asyncio.to_thread(
+                subprocess.run,
+                ["lake", "exe", "cache", "get"],
+                cwd=lean_project_path_obj,
+                check=False,
+            )
+            if result.returncode == 0:
+                state.record_cache_get()
+        else:
+            notes.append(
+                "Skipped `lake exe cache get`: manifest and toolchain unchanged."
+            )
 
         # Run build with progress reporting
+        started = time.monotonic()
         process = await asyncio.create_subprocess_exec(
             "lake",
             "build",
             "--verbose",
+            *targets,
             cwd=lean_project_path_obj,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.STDOUT,
         )
 
-        output_lines = []
-
+        current_job, total_jobs = 0, None
         while True:
             line = await process.stdout.readline()
             if not line:
                 break
 
             line_str = line.decode("utf-8", errors="replace").rstrip()
-            output_lines.append(line_str)
+            output.add(line_str)
 
             # Parse progress: look for pattern like "[2/8]" or "[10/100]"
             match = re.search(r"\[(\d+)/(\d+)\]", line_str)
@@ -303,35 +433,140 @@ async def lsp_build(
                     r"\[\d+/\d+\]\s+(.+?)(?:\s+\(\d+\.?\d*[ms]+\))?$", line_str
                 )
                 description = desc_match.group(1) if desc_match else "Building"
+                eta = state.eta(current_job, total_jobs)
+                if eta is not None:
+                    description += f" (about {format_duration(eta)} left)"
 
                 # Report progress using dynamic totals from Lake
                 await ctx.report_progress(
                     progress=current_job, total=total_jobs, message=description
                 )
+            elif stream:
+                await ctx.report_progress(
+                    progress=current_job, total=total_jobs, message=line_str
+                )
 
         await process.wait()
+        output.close()
+        await asyncio.to_thread(
+            state.record_build,
+            output.modules,
+            output.jobs,
+            time.monotonic() - started,
+            process.returncode,
+            targets,
+        )
+        changed = changed_oleans(
+            oleans_before,
+            await asyncio.to_thread(olean_snapshot, lean_project_path_obj),
+        )
+
+        def invalidate_caches() -> None:
+            # Rebuilt local modules can change diagnostics and types of unchanged files
+            lifespan_context.diagnostics_cache.invalidate(
+                project_fingerprint(lean_project_path_obj)
+            )
+            lifespan_context.outline_cache.invalidate(lean_project_path_obj)
 
         if process.returncode != 0:
-            build_output = "\n".join(output_lines)
+            if changed:
+                invalidate_caches()
+            if stream:
+                return {
+                    "status": "failed",
+                    "returncode": process.returncode,
+                    **output.summary(),
+                }
+            build_output = output.text()
             raise Exception(f"Build failed with return code {process.returncode}")
 
-        # Start LSP client (without initial build since we just did it)
-        with OutputCapture():
-            client = LeanLSPClient(
-                lean_project_path_obj, initial_build=False, prevent_cache_get=True
+        if changed and loogle_mode() == "local":
+            get_local_loogle(lean_project_path_obj).build_in_background(force=True)
+
+        # Only the client of the project being built is replaced, and only if
+        # it would otherwise keep serving outdated imports
+        def running_client() -> Optional[LeanLSPClient]:
+            # CLIENT_LOCK can be held by a tool worker, never wait for it on the event loop
+            with CLIENT_LOCK:
+                client = registry.get(lean_project_path_obj)
+                active = lifespan_context.client
+                if active is not None and active.project_path == lean_project_path_obj:
+                    client = active
+                if client is not None and not changed:
+                    lifespan_context.client = client
+                return client
+
+        client = await asyncio.to_thread(running_client)
+        if client is not None and not changed:
+            notes.append("No .olean files changed, kept the running Lean server.")
+        else:
+            # The running client keeps serving tool calls until the new one is up
+            # (started without initial build since we just did it)
+            client = await asyncio.to_thread(
+                create_client, lean_project_path_obj, prevent_cache_get=True
             )
-
-        logger.info("Built project and re-started LSP client")
-
-        ctx.request_context.lifespan_context.client = client
-        build_output = "\n".join(output_lines)
+            await asyncio.to_thread(
+                swap_client, lifespan_context, lean_project_path_obj, client
+            )
+            logger.info("Built project and swapped in a new LSP client")
+        if changed:
+            # After the swap, so nothing the old client computes in between is kept
+            invalidate_caches()
+
+        if stream:
+            summary = {"status": "built", **output.summary(), "notes": notes}
+            if targets:
+                summary["targets"] = targets
+            return summary
+        build_output = "\n".join([*output.lines, *notes])
+        if targets:
+            return {
+                "targets": targets,
+                "modules": parse_build_timings(output.lines),
+                "output": build_output,
+            }
         return build_output
     except Exception as e:
-        return f"Error during build:\n{str(e)}\n{build_output}"
+        return f"Error during build:\n{str(e)}\n{build_output or output.text()}"
+    finally:
+        output.close()
+
+
+@mcp.tool("lean_build_report")
+@offload
+@log_tool_execution
+def build_report(
+    ctx: Context, lean_project_path: str = None, num_results: int = 10
+) -> Dict | str:
+    """What is slow to build and what needs rebuilding, from the builds recorded by lean_build.
+
+    Instant, does not run Lake.
+
+    Args:
+        lean_project_path (str, optional): Path to the Lean project. If not provided, it will be inferred from previous tool calls.
+        num_results (int, optional): Max slowest modules. Defaults to 10.
+
+    Returns:
+        Dict | str: ``{"last_build", "slowest", "failed", "stale"}`` or error msg. ``stale`` lists project modules to rebuild with the reason
+    """
+    logger.info(f"🔧 Tool: lean_build_report(lean_project_path={lean_project_path})")
+    resolved_root = _resolve_search_root(ctx, lean_project_path)
+    if isinstance(resolved_root, str):
+        return resolved_root
+
+    state = BuildState.for_project(resolved_root)
+    runs = state.data.get("runs", [])
+    return {
+        "last_build": runs[-1] if runs else None,
+        "slowest": state.slowest(num_results),
+        "failed": state.failed(),
+        "stale": state.stale(),
+    }
 
 
 # File level tools
 @mcp.tool("lean_file_contents")
+@offload
 @deprecated
 @log_tool_execution
 def file_contents(ctx: Context, file_path: str, annotate_lines: bool = True) -> str:
@@ -371,10 +606,11 @@ def file_contents(ctx: Context, file_path: str, annotate_lines: bool = True) ->
 
 
 @mcp.tool("lean_file_outline")
+@offload
 def file_outline(ctx: Context, file_path: str) -> str:
     """Get a concise outline showing imports and declarations with type signatures (theorems, defs, classes, structures).
 
-    Highly useful and token-efficient. Slow-ish.
+    Highly useful and token-efficient. Slow-ish on first use, cached until the file changes.
 
     Args:
         file_path (str): Abs path to Lean file
@@ -382,15 +618,38 @@ def file_outline(ctx: Context, file_path: str) -> str:
     Returns:
         str: Markdown formatted outline or error msg
     """
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    cache = ctx.request_context.lifespan_context.outline_cache
+    # Answer unchanged files without starting (or switching to) a Lean client
+    project_path = infer_project_path(ctx, file_path)
+    rel_path = project_path and get_relative_file_path(project_path, file_path)
+    if rel_path:
+        outline = cache.get(project_path, rel_path, file_stamp(project_path, rel_path))
+        if outline is not None:
+            return outline
+
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    return generate_outline(client, rel_path)
+    client, rel_path = setup
+    stamp = file_stamp(client.project_path, rel_path)
+    outline = cache.get(client.project_path, rel_path, stamp)
+    if outline is not None:
+        return outline
+
+    outline = generate_outline(client, rel_path)
+    try:
+        with lock_file(client, rel_path):
+            content = client.get_file_content(rel_path)
+    except FileNotFoundError:
+        # Closed by another tool meanwhile, the next call outlines again
+        return outline
+    cache.put(client.project_path, rel_path, content, outline, stamp)
+    return outline
 
 
 @mcp.tool("lean_diagnostic_messages")
+@offload
 @log_tool_execution
 def diagnostic_messages(
     ctx: Context,
@@ -407,46 +666,73 @@ def diagnostic_messages(
         List[str] | str: Diagnostic msgs or error msg
     """
     logger.info(f"🔧 Tool: lean_diagnostic_messages(file_path={file_path})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-
-
-    # Convert 1-indexed to 0-indexed for leanclient
-    start_line_0 =  None
-    end_line_0 =  None
-    timeout_second = 300
-    start_time = time.time()
-
-    # should be long enough to avoid misrejection
-    timeout_second = 300
-    start_time = time.time()
-    diagnostics = client.get_diagnostics(
+    client, rel_path = setup
+    cache = ctx.request_context.lifespan_context.diagnostics_cache
+    fingerprint = current_fingerprint(client.project_path)
+    imports = import_stamps(
+        client.project_path, read_imports(client.project_path / rel_path)
+    )
+    file_key = cache.file_key(
+        client.project_path,
         rel_path,
-        start_line=start_line_0,
-        end_line=end_line_0,
-        inactivity_timeout = timeout_second,
+        file_stamp(client.project_path, rel_path),
+        imports,
     )
-    end_time = time.time()
-    duration = end_time - start_time
-    if duration >= timeout_second - 0.5:
-        logger.warning(f"🚫 lean_diagnostic_messages: Timeout after {duration} seconds")
-        message = "Timeout: Lean diagnostic messages took too long to compute.\n"
-        message += "Refactor your code, try more efficient methods, and reduce brute-force enumeration."
-        try:
-            client.close_files([rel_path])
-        except Exception as exc:
-            logger.warning(f"Failed to close file {rel_path} after timeout: {exc}")
+    if file_key is not None:
+        cached = cache.get(*file_key)
+        if cached is not None:
+            return cached
+
+    with lock_file(client, rel_path):
         client.open_file(rel_path)
-        return [message]
 
-    return format_diagnostics(diagnostics)
+
+        # Convert 1-indexed to 0-indexed for leanclient
+        start_line_0 = None
+        end_line_0 = None
+        timeout_second = 300
+        start_time = time.time()
+
+        # should be long enough to avoid misrejection
+        timeout_second = 300
+        start_time = time.time()
+        diagnostics = client.get_diagnostics(
+            rel_path,
+            start_line=start_line_0,
+            end_line=end_line_0,
+            inactivity_timeout=timeout_second,
+        )
+        end_time = time.time()
+        duration = end_time - start_time
+        if duration >= timeout_second - 0.5:
+            logger.warning(
+                f"🚫 lean_diagnostic_messages: Timeout after {duration} seconds"
+            )
+            message = "Timeout: Lean diagnostic messages took too long to compute.\n"
+            message += "Refactor your code, try more efficient methods, and reduce brute-force enumeration."
+            try:
+                client.close_files([rel_path])
+            except Exception as exc:
+                logger.warning(f"Failed to close file {rel_path} after timeout: {exc}")
+            client.open_file(rel_path)
+            return [message]
+
+        formatted = format_diagnostics(diagnostics)
+        if diagnostics_complete(client, rel_path):
+            # Key by the content Lean actually checked, the file may have changed meanwhile
+            key = content_key(
+                fingerprint, rel_path, client.get_file_content(rel_path), imports
+            )
+            cache.put(fingerprint, key, formatted)
+        return formatted
 
 
 @mcp.tool("lean_goal")
+@offload
 @log_tool_execution
 def goal(ctx: Context, file_path: str, line: int, column: Optional[int] = None) -> str:
     """Get the proof goals (proof state) at a specific location in a Lean file.
@@ -465,40 +751,42 @@ def goal(ctx: Context, file_path: str, line: int, column: Optional[int] = None)
         str: Goal(s) or error msg
     """
     logger.info(f"🔧 Tool: lean_goal(file_path={file_path}, line={line}, column={column})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-    content = client.get_file_content(rel_path)
-
-    if column is None:
-        lines = content.splitlines()
-        if line < 1 or line > len(lines):
-            return "Line number out of range. Try elsewhere?"
-        column_end = len(lines[line - 1])
-        column_start = next(
-            (i for i, c in enumerate(lines[line - 1]) if not c.isspace()), 0
-        )
-        goal_start = client.get_goal(rel_path, line - 1, column_start)
-        goal_end = client.get_goal(rel_path, line - 1, column_end)
+    client, rel_path = setup
+    with lock_file(client, rel_path):
+        client.open_file(rel_path)
+        content = client.get_file_content(rel_path)
+
+        if column is None:
+            lines = content.splitlines()
+            if line < 1 or line > len(lines):
+                return "Line number out of range. Try elsewhere?"
+            column_end = len(lines[line - 1])
+            column_start = next(
+                (i for i, c in enumerate(lines[line - 1]) if not c.isspace()), 0
+            )
+            goal_start = client.get_goal(rel_path, line - 1, column_start)
+            goal_end = client.get_goal(rel_path, line - 1, column_end)
 
-        if goal_start is None and goal_end is None:
-            return f"No goals on line:\n{lines[line - 1]}\nTry another line?"
+            if goal_start is None and goal_end is None:
+                return f"No goals on line:\n{lines[line - 1]}\nTry another line?"
 
-        start_text = format_goal(goal_start, "No goals at line start.")
-        end_text = format_goal(goal_end, "No goals at line end.")
-        return f"Goals on line:\n{lines[line - 1]}\nBefore:\n{start_text}\nAfter:\n{end_text}"
+            start_text = format_goal(goal_start, "No goals at line start.")
+            end_text = format_goal(goal_end, "No goals at line end.")
+            return f"Goals on line:\n{lines[line - 1]}\nBefore:\n{start_text}\nAfter:\n{end_text}"
 
-    else:
-        goal = client.get_goal(rel_path, line - 1, column - 1)
-        f_goal = format_goal(goal, "Not a valid goal position. Try elsewhere?")
-        f_line = format_line(content, line, column)
-        return f"Goals at:\n{f_line}\n{f_goal}"
+        else:
+            goal = client.get_goal(rel_path, line - 1, column - 1)
+            f_goal = format_goal(goal, "Not a valid goal position. Try elsewhere?")
+            f_line = format_line(content, line, column)
+            return f"Goals at:\n{f_line}\n{f_goal}"
 
 
 @mcp.tool("lean_term_goal")
+@offload
 @log_tool_execution
 def term_goal(
     ctx: Context, file_path: str, line: int, column: Optional[int] = None
@@ -514,30 +802,32 @@ def term_goal(
         str: Expected type or error msg
     """
     logger.info(f"🔧 Tool: lean_term_goal(file_path={file_path}, line={line}, column={column})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-    content = client.get_file_content(rel_path)
-    if column is None:
-        lines = content.splitlines()
-        if line < 1 or line > len(lines):
-            return "Line number out of range. Try elsewhere?"
-        column = len(content.splitlines()[line - 1])
-
-    term_goal = client.get_term_goal(rel_path, line - 1, column - 1)
-    f_line = format_line(content, line, column)
-    if term_goal is None:
-        return f"Not a valid term goal position:\n{f_line}\nTry elsewhere?"
-    rendered = term_goal.get("goal", None)
-    if rendered is not None:
-        rendered = rendered.replace("```lean\n", "").replace("\n```", "")
-    return f"Term goal at:\n{f_line}\n{rendered or 'No term goal found.'}"
+    client, rel_path = setup
+    with lock_file(client, rel_path):
+        client.open_file(rel_path)
+        content = client.get_file_content(rel_path)
+        if column is None:
+            lines = content.splitlines()
+            if line < 1 or line > len(lines):
+                return "Line number out of range. Try elsewhere?"
+            column = len(content.splitlines()[line - 1])
+
+        term_goal = client.get_term_goal(rel_path, line - 1, column - 1)
+        f_line = format_line(content, line, column)
+        if term_goal is None:
+            return f"Not a valid term goal position:\n{f_line}\nTry elsewhere?"
+        rendered = term_goal.get("goal", None)
+        if rendered is not None:
+            rendered = rendered.replace("```lean\n", "").replace("\n```", "")
+        return f"Term goal at:\n{f_line}\n{rendered or 'No term goal found.'}"
 
 
 @mcp.tool("lean_hover_info")
+@offload
 @log_tool_execution
 def hover(ctx: Context, file_path: str, line: int, column: int) -> str:
     """Get hover info (docs for syntax, variables, functions, etc.) at a specific location in a Lean file.
@@ -551,35 +841,48 @@ def hover(ctx: Context, file_path: str, line: int, column: int) -> str:
         str: Hover info or error msg
     """
     logger.info(f"🔧 Tool: lean_hover_info(file_path={file_path}, line={line}, column={column})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-    file_content = client.get_file_content(rel_path)
-    hover_info = client.get_hover(rel_path, line - 1, column - 1)
-    if hover_info is None:
-        f_line = format_line(file_content, line, column)
-        return f"No hover information at position:\n{f_line}\nTry elsewhere?"
-
-    # Get the symbol and the hover information
-    h_range = hover_info.get("range")
-    symbol = extract_range(file_content, h_range)
-    info = hover_info["contents"].get("value", "No hover information available.")
-    info = info.replace("```lean\n", "").replace("\n```", "").strip()
-
-    # Add diagnostics if available
-    diagnostics = client.get_diagnostics(rel_path)
-    filtered = filter_diagnostics_by_position(diagnostics, line - 1, column - 1)
+    client, rel_path = setup
+    with lock_file(client, rel_path):
+        client.open_file(rel_path)
+        file_content = client.get_file_content(rel_path)
+        hover_info = client.get_hover(rel_path, line - 1, column - 1)
+        if hover_info is None:
+            f_line = format_line(file_content, line, column)
+            return f"No hover information at position:\n{f_line}\nTry elsewhere?"
+
+        # Get the symbol and the hover information
+        h_range = hover_info.get("range")
+        symbol = extract_range(file_content, h_range)
+        info = hover_info["contents"].get("value", "No hover information available.")
+        info = info.replace("```lean\n", "").replace("\n```", "").strip()
+
+        # Add diagnostics if available
+        cache = ctx.request_context.lifespan_context.diagnostics_cache
+        fingerprint = current_fingerprint(client.project_path)
+        imports = import_stamps(client.project_path, parse_imports(file_content))
+        key = content_key(
+            fingerprint, f"{rel_path}:{line}:{column}", file_content, imports
+        )
+        formatted = cache.get(fingerprint, key)
+        if formatted is None:
+            diagnostics = client.get_diagnostics(rel_path)
+            filtered = filter_diagnostics_by_position(diagnostics, line - 1, column - 1)
+            formatted = format_diagnostics(filtered)
+            if diagnostics_complete(client, rel_path):
+                cache.put(fingerprint, key, formatted)
 
-    msg = f"Hover info `{symbol}`:\n{info}"
-    if filtered:
-        msg += "\n\nDiagnostics\n" + "\n".join(format_diagnostics(filtered))
-    return msg
+        msg = f"Hover info `{symbol}`:\n{info}"
+        if formatted:
+            msg += "\n\nDiagnostics\n" + "\n".join(formatted)
+        return msg
 
 
 @mcp.tool("lean_completions")
+@offload
 @log_tool_execution
 def completions(
     ctx: Context, file_path: str, line: int, column: int, max_completions: int = 32
@@ -601,55 +904,57 @@ def completions(
         str: List of possible completions or error msg
     """
     logger.info(f"🔧 Tool: lean_completions(file_path={file_path}, line={line}, column={column}, max={max_completions})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-    content = client.get_file_content(rel_path)
-    completions = client.get_completions(rel_path, line - 1, column - 1)
-    formatted = [c["label"] for c in completions if "label" in c]
-    f_line = format_line(content, line, column)
-
-    if not formatted:
-        return f"No completions at position:\n{f_line}\nTry elsewhere?"
-
-    # Find the sort term: The last word/identifier before the cursor
-    lines = content.splitlines()
-    prefix = ""
-    if 0 < line <= len(lines):
-        text_before_cursor = lines[line - 1][: column - 1] if column > 0 else ""
-        if not text_before_cursor.endswith("."):
-            prefix = re.split(r"[\s()\[\]{},:;.]+", text_before_cursor)[-1].lower()
-
-    # Sort completions: prefix matches first, then contains, then alphabetical
-    if prefix:
-
-        def sort_key(item):
-            item_lower = item.lower()
-            if item_lower.startswith(prefix):
-                return (0, item_lower)
-            elif prefix in item_lower:
-                return (1, item_lower)
-            else:
-                return (2, item_lower)
-
-        formatted.sort(key=sort_key)
-    else:
-        formatted.sort(key=str.lower)
+    client, rel_path = setup
+    with lock_file(client, rel_path):
+        client.open_file(rel_path)
+        content = client.get_file_content(rel_path)
+        completions = client.get_completions(rel_path, line - 1, column - 1)
+        formatted = [c["label"] for c in completions if "label" in c]
+        f_line = format_line(content, line, column)
+
+        if not formatted:
+            return f"No completions at position:\n{f_line}\nTry elsewhere?"
+
+        # Find the sort term: The last word/identifier before the cursor
+        lines = content.splitlines()
+        prefix = ""
+        if 0 < line <= len(lines):
+            text_before_cursor = lines[line - 1][: column - 1] if column > 0 else ""
+            if not text_before_cursor.endswith("."):
+                prefix = re.split(r"[\s()\[\]{},:;.]+", text_before_cursor)[-1].lower()
+
+        # Sort completions: prefix matches first, then contains, then alphabetical
+        if prefix:
+
+            def sort_key(item):
+                item_lower = item.lower()
+                if item_lower.startswith(prefix):
+                    return (0, item_lower)
+                elif prefix in item_lower:
+                    return (1, item_lower)
+                else:
+                    return (2, item_lower)
+
+            formatted.sort(key=sort_key)
+        else:
+            formatted.sort(key=str.lower)
 
-    # Truncate if too many results
-    if len(formatted) > max_completions:
-        remaining = len(formatted) - max_completions
-        formatted = formatted[:max_completions] + [
-            f"{remaining} more, keep typing to filter further"
-        ]
-    completions_text = "\n".join(formatted)
-    return f"Completions at:\n{f_line}\n{completions_text}"
+        # Truncate if too many results
+        if len(formatted) > max_completions:
+            remaining = len(formatted) - max_completions
+            formatted = formatted[:max_completions] + [
+                f"{remaining} more, keep typing to filter further"
+            ]
+        completions_text = "\n".join(formatted)
+        return f"Completions at:\n{f_line}\n{completions_text}"
 
 
 @mcp.tool("lean_declaration_file")
+@offload
 @log_tool_execution
 def declaration_file(ctx: Context, file_path: str, symbol: str) -> str:
     """Get the file contents where a symbol/lemma/class/structure is declared.
@@ -666,45 +971,129 @@ def declaration_file(ctx: Context, file_path: str, symbol: str) -> str:
         str: File contents or error msg
     """
     logger.info(f"🔧 Tool: lean_declaration_file(file_path={file_path}, symbol='{symbol}')")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-    orig_file_content = client.get_file_content(rel_path)
+    client, rel_path = setup
+    with lock_file(client, rel_path):
+        client.open_file(rel_path)
+        orig_file_content = client.get_file_content(rel_path)
 
-    # Find the first occurence of the symbol (line and column) in the file,
-    position = find_start_position(orig_file_content, symbol)
-    if not position:
-        return f"Symbol `{symbol}` (case sensitive) not found in file `{rel_path}`. Add it first, then try again."
+        # Find the first occurence of the symbol (line and column) in the file,
+        position = find_start_position(orig_file_content, symbol)
+        if not position:
+            return f"Symbol `{symbol}` (case sensitive) not found in file `{rel_path}`. Add it first, then try again."
 
-    declaration = client.get_declarations(
-        rel_path, position["line"], position["column"]
-    )
+        declaration = client.get_declarations(
+            rel_path, position["line"], position["column"]
+        )
 
-    if len(declaration) == 0:
-        return f"No declaration available for `{symbol}`."
+        if len(declaration) == 0:
+            return f"No declaration available for `{symbol}`."
 
-    # Load the declaration file
-    declaration = declaration[0]
-    uri = declaration.get("targetUri")
-    if not uri:
-        uri = declaration.get("uri")
+        # Load the declaration file
+        declaration = declaration[0]
+        uri = declaration.get("targetUri")
+        if not uri:
+            uri = declaration.get("uri")
 
-    abs_path = client._uri_to_abs(uri)
-    if not os.path.exists(abs_path):
-        return f"Could not open declaration file `{abs_path}` for `{symbol}`."
+        abs_path = client._uri_to_abs(uri)
+        if not os.path.exists(abs_path):
+            return f"Could not open declaration file `{abs_path}` for `{symbol}`."
 
-    file_content = get_file_contents(abs_path)
+        file_content = get_file_contents(abs_path)
 
-    return f"Declaration of `{symbol}`:\n{file_content}"
+        return f"Declaration of `{symbol}`:\n{file_content}"
+
+
+def _attempt_copies(
+    client: LeanLSPClient, copies: List[str], line: int, snippets: Dict[str, str]
+) -> Dict[str, str]:
+    """Elaborate snippet copies on one Lean server, opened in batches so they run in parallel."""
+    results = {}
+    batch_size = max(1, getattr(client, "max_opened_files", 4))
+    for start in range(0, len(copies), batch_size):
+        batch = copies[start : start + batch_size]
+        client.open_files(batch)
+        try:
+            for copy_path in batch:
+                snippet_str = snippets[copy_path]
+                diag = client.get_diagnostics(copy_path)
+                formatted_diag = "\n".join(
+                    format_diagnostics(diag, select_line=line - 1)
+                )
+                goal = client.get_goal(copy_path, line - 1, len(snippet_str))
+                formatted_goal = format_goal(goal, "Missing goal")
+                results[copy_path] = (
+                    f"{snippet_str}:\n {formatted_goal}\n\n{formatted_diag}"
+                )
+        finally:
+            try:
+                client.close_files(batch)
+            except Exception as exc:  # pragma: no cover - close failures only logged
+                logger.warning("Failed to close multi_attempt copies: %s", exc)
+    return results
+
+
+def _multi_attempt_parallel(
+    client: LeanLSPClient, rel_path: str, line: int, snippets: List[str]
+) -> List[str]:
+    """Evaluate every snippet at once in temporary copies of the file.
+
+    Copies are spread across the workers of a LeanWorkerPool. Each Lean server
+    also elaborates its open copies concurrently, so even a single server
+    handles up to ``max_opened_files`` snippets at a time.
+    """
+    project_path = Path(client.project_path)
+    content = get_file_contents(str(project_path / rel_path))
+
+    copy_snippets: Dict[str, str] = {}
+    for snippet in snippets:
+        snippet_str = snippet.rstrip("\n")
+        copy_path = f"_mcp_attempt_{uuid.uuid4().hex}.lean"
+        with open(project_path / copy_path, "w", encoding="utf-8") as f:
+            f.write(replace_line(content, line, snippet_str))
+        copy_snippets[copy_path] = snippet_str
+
+    try:
+        copies = list(copy_snippets)
+        if isinstance(client, LeanWorkerPool):
+            groups: Dict[int, List[str]] = {}
+            for copy_path in copies:
+                groups.setdefault(id(client.worker_for(copy_path)), []).append(
+                    copy_path
+                )
+            batches = list(groups.values())
+        else:
+            batches = [copies]
+
+        def run_batch(batch: List[str]) -> Dict[str, str]:
+            with lock_file(client, batch[0]):
+                return _attempt_copies(client, batch, line, copy_snippets)
+
+        results: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            for batch_results in executor.map(run_batch, batches):
+                results.update(batch_results)
+        return [results[copy_path] for copy_path in copies]
+    finally:
+        for copy_path in copy_snippets:
+            try:
+                os.remove(project_path / copy_path)
+            except OSError as exc:
+                logger.warning("Failed to remove `%s`: %s", copy_path, exc)
 
 
 @mcp.tool("lean_multi_attempt")
+@offload
 @log_tool_execution
 def multi_attempt(
-    ctx: Context, file_path: str, line: int, snippets: List[str]
+    ctx: Context,
+    file_path: str,
+    line: int,
+    snippets: List[str],
+    parallel: bool = False,
 ) -> List[str] | str:
     """Try multiple Lean code snippets at a line and get the goal state and diagnostics for each.
 
@@ -720,52 +1109,57 @@ def multi_attempt(
         file_path (str): Abs path to Lean file
         line (int): Line number (1-indexed)
         snippets (List[str]): List of snippets (3+ are recommended)
+        parallel (bool, optional): Evaluate all snippets at once in temporary copies of the file (uses the saved file). Defaults to False.
 
     Returns:
         List[str] | str: Diagnostics and goal states or error msg
     """
-    logger.info(f"🔧 Tool: lean_multi_attempt(file_path={file_path}, line={line}, snippets_count={len(snippets)})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    logger.info(
+        f"🔧 Tool: lean_multi_attempt(file_path={file_path}, line={line}, snippets_count={len(snippets)}, parallel={parallel})"
+    )
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-
+    client, rel_path = setup
+    if parallel and snippets:
+        try:
+            return _multi_attempt_parallel(client, rel_path, line, snippets)
+        except OSError as e:
+            return f"Error preparing parallel attempts for `{rel_path}`:\n{str(e)}"
+
+    # Snippets go into a warm copy of the file: Lean keeps everything above
+    # the line elaborated between snippets and across calls.
+    warm = ctx.request_context.lifespan_context.warm_documents
+    key = f"multi_attempt:{rel_path}"
+    attempt_path = warm.path_for(client, key)
     try:
-        client.open_file(rel_path)
-
-        results = []
-        # Avoid mutating caller-provided snippets; normalize locally per attempt
-        for snippet in snippets:
-            snippet_str = snippet.rstrip("\n")
-            payload = f"{snippet_str}\n"
-            # Create a DocumentContentChange for the snippet
-            change = DocumentContentChange(
-                payload,
-                [line - 1, 0],
-                [line, 0],
-            )
-            # Apply the change to the file, capture diagnostics and goal state
-            client.update_file(rel_path, [change])
-            diag = client.get_diagnostics(rel_path)
-            formatted_diag = "\n".join(format_diagnostics(diag, select_line=line - 1))
-            # Use the snippet text length without any trailing newline for the column
-            goal = client.get_goal(rel_path, line - 1, len(snippet_str))
-            formatted_goal = format_goal(goal, "Missing goal")
-            results.append(f"{snippet_str}:\n {formatted_goal}\n\n{formatted_diag}")
+        content = get_file_contents(str(Path(client.project_path) / rel_path))
+        with lock_file(client, attempt_path):
+            results = []
+            # Avoid mutating caller-provided snippets; normalize locally per attempt
+            for snippet in snippets:
+                snippet_str = snippet.rstrip("\n")
+                # Apply the snippet, capture diagnostics and goal state
+                warm.update(client, key, replace_line(content, line, snippet_str))
+                diag = client.get_diagnostics(attempt_path)
+                formatted_diag = "\n".join(
+                    format_diagnostics(diag, select_line=line - 1)
+                )
+                # Use the snippet text length without any trailing newline for the column
+                goal = client.get_goal(attempt_path, line - 1, len(snippet_str))
+                formatted_goal = format_goal(goal, "Missing goal")
+                results.append(f"{snippet_str}:\n {formatted_goal}\n\n{formatted_diag}")
 
-        return results
+            return results
+    except OSError as e:
+        return f"Error preparing attempts for `{rel_path}`:\n{str(e)}"
     finally:
-        try:
-            client.close_files([rel_path])
-        except Exception as exc:  # pragma: no cover - close failures only logged
-            logger.warning(
-                "Failed to close `%s` after multi_attempt: %s", rel_path, exc
-            )
+        warm.close_evicted()
 
 
 @mcp.tool("lean_run_code")
+@offload
 @log_tool_execution
 def run_code(ctx: Context, code: str) -> List[str] | str:
     """Run a complete, self-contained code snippet and return diagnostics.
@@ -785,56 +1179,42 @@ def run_code(ctx: Context, code: str) -> List[str] | str:
     if lean_project_path is None:
         return "No valid Lean project path found. Run another tool (e.g. `lean_file_contents`) first to set it up."
 
-    # Use a unique snippet filename to avoid collisions under concurrency
-    rel_path = f"_mcp_snippet_{uuid.uuid4().hex}.lean"
-    abs_path = lean_project_path / rel_path
+    cache = lifespan_context.diagnostics_cache
+    fingerprint = current_fingerprint(lean_project_path)
+    imports = import_stamps(Path(lean_project_path), parse_imports(code))
+    key = content_key(fingerprint, "run_code", code, imports)
+    diagnostics = cache.get(fingerprint, key)
+    if diagnostics is not None:
+        return (
+            diagnostics
+            if diagnostics
+            else "No diagnostics found for the code snippet (compiled successfully)."
+        )
 
+    with CLIENT_LOCK:
+        startup_client(ctx)
+        client: LeanLSPClient | None = lifespan_context.client
+    if client is None:
+        return "Failed to initialize Lean client for run_code."
+
+    # Snippets with the same imports share a warm document, so the header and
+    # unchanged leading declarations are not elaborated again.
+    warm = lifespan_context.warm_documents
+    warm_key = f"run_code:{import_header(code)}"
+    rel_path = warm.path_for(client, warm_key)
     try:
-        with open(abs_path, "w", encoding="utf-8") as f:
-            f.write(code)
-    except Exception as e:
+        with lock_file(client, rel_path):
+            warm.update(client, warm_key, code)
+            diagnostics = format_diagnostics(
+                client.get_diagnostics(rel_path, inactivity_timeout=15.0)
+            )
+            if diagnostics_complete(client, rel_path):
+                cache.put(fingerprint, key, diagnostics)
+    except OSError as e:
+        abs_path = lean_project_path / rel_path
         return f"Error writing code snippet to file `{abs_path}`:\n{str(e)}"
-
-    client: LeanLSPClient | None = lifespan_context.client
-    diagnostics: List[str] | str = []
-    close_error: str | None = None
-    remove_error: str | None = None
-    opened_file = False
-
-    try:
-        if client is None:
-            startup_client(ctx)
-            client = lifespan_context.client
-            if client is None:
-                return "Failed to initialize Lean client for run_code."
-
-        assert client is not None  # startup_client guarantees an initialized client
-        client.open_file(rel_path)
-        opened_file = True
-        diagnostics = format_diagnostics(
-            client.get_diagnostics(rel_path, inactivity_timeout=15.0)
-        )
     finally:
-        if opened_file:
-            try:
-                client.close_files([rel_path])
-            except Exception as exc:  # pragma: no cover - close failures only logged
-                close_error = str(exc)
-                logger.warning("Failed to close `%s` after run_code: %s", rel_path, exc)
-        try:
-            os.remove(abs_path)
-        except FileNotFoundError:
-            pass
-        except Exception as e:
-            remove_error = str(e)
-            logger.warning(
-                "Failed to remove temporary Lean snippet `%s`: %s", abs_path, e
-            )
-
-    if remove_error:
-        return f"Error removing temporary file `{abs_path}`:\n{remove_error}"
-    if close_error:
-        return f"Error closing temporary Lean document `{rel_path}`:\n{close_error}"
+        warm.close_evicted()
 
     return (
         diagnostics
@@ -844,6 +1224,7 @@ def run_code(ctx: Context, code: str) -> List[str] | str:
 
 
 @mcp.tool("lean_local_search")
+@offload
 @log_tool_execution
 def local_search(
     ctx: Context, query: str, limit: int = 10, project_root: str | None = None
@@ -851,7 +1232,8 @@ def local_search(
     """Confirm declarations exist in the current workspace to prevent hallucinating APIs.
 
     VERY USEFUL AND FAST!
-    Pass a short prefix (e.g. ``map_mul``); the metadata shows the declaration kind and file.
+    Pass a name or short prefix (e.g. ``map_mul``); the metadata shows the declaration kind and file.
+    Results are ranked: exact names, namespace suffixes, prefixes, initials (``hda`` for ``HasDerivAt``), substrings, then names with typos.
     The index spans theorems, lemmas, defs, classes, instances, structures, inductives, abbrevs, and opaque decls.
 
     Args:
@@ -862,9 +1244,103 @@ def local_search(
         List[Dict[str, str]] | str: Matches as ``{"name", "kind", "file"}`` or error message.
     """
     logger.info(f"🔧 Tool: lean_local_search(query='{query}', limit={limit})")
-    if not _RG_AVAILABLE:
-        return _RG_MESSAGE
+    resolved_root = _resolve_search_root(ctx, project_root)
+    if isinstance(resolved_root, str):
+        return resolved_root
+
+    index = get_declaration_index(resolved_root)
+    if not index.ready:
+        if not _RG_AVAILABLE:
+            # Without ripgrep the first query waits for the index
+            return index.search(query.strip(), limit)
+        # Answer with ripgrep while the index is built
+        index.build_in_background()
+        try:
+            return lean_local_search(
+                query=query.strip(), limit=limit, project_root=resolved_root
+            )
+        except RuntimeError as exc:
+            return f"lean_local_search error:\n{exc}"
+
+    return index.search(query.strip(), limit)
+
+
+@mcp.tool("lean_local_search_batch")
+@offload
+@log_tool_execution
+def local_search_batch(
+    ctx: Context,
+    queries: List[str],
+    limit: int = 10,
+    project_root: str | None = None,
+) -> Dict[str, List[Dict[str, str]]] | str:
+    """Check many declaration names at once, e.g. all lemmas a proof plan relies on.
 
+    Same matching and ranking as lean_local_search, but one call and one pass for all queries.
+
+    Args:
+        queries (List[str]): Declaration names or prefixes.
+        limit (int): Max matches per query (default 10).
+
+    Returns:
+        Dict[str, List[Dict[str, str]]] | str: Matches per query as ``{"name", "kind", "file"}`` or error message.
+    """
+    logger.info(
+        f"🔧 Tool: lean_local_search_batch(queries_count={len(queries)}, limit={limit})"
+    )
+    resolved_root = _resolve_search_root(ctx, project_root)
+    if isinstance(resolved_root, str):
+        return resolved_root
+
+    queries = [q.strip() for q in queries]
+    index = get_declaration_index(resolved_root)
+    if not index.ready and _RG_AVAILABLE:
+        index.build_in_background()
+        try:
+            return lean_local_search_batch(
+                queries=queries, limit=limit, project_root=resolved_root
+            )
+        except RuntimeError as exc:
+            return f"lean_local_search_batch error:\n{exc}"
+
+    return index.search_many(queries, limit)
+
+
+@mcp.tool("lean_local_semantic_search")
+@offload
+@log_tool_execution
+def local_semantic_search(
+    ctx: Context, query: str, num_results: int = 5, project_root: str | None = None
+) -> List[Dict] | str:
+    """Offline search of theorems and definitions by natural language or keywords.
+
+    Ranks declarations of the project and its Lake packages (Mathlib) by BM25
+    over names, signatures and docstrings. No network, no rate limit; a
+    keyword-level alternative to leandex / leanfinder.
+    The first call per project builds the index (can take a minute for Mathlib).
+
+    Args:
+        query (str): Keywords or a short statement, e.g. "sum of two even numbers is even"
+        num_results (int, optional): Max results. Defaults to 5.
+
+    Returns:
+        List[Dict] | str: Matches as ``{"name", "kind", "file", "line", "signature", "doc", "score"}`` or error msg
+    """
+    logger.info(
+        f"🔧 Tool: lean_local_semantic_search(query='{query}', num_results={num_results})"
+    )
+    if not numpy_available():
+        return "Local semantic search needs numpy: pip install 'lean-lsp-mcp[local-search]'"
+    resolved_root = _resolve_search_root(ctx, project_root)
+    if isinstance(resolved_root, str):
+        return resolved_root
+
+    results = get_local_semantic_search(resolved_root).search(query, num_results)
+    return results if results else "No results found."
+
+
+def _resolve_search_root(ctx: Context, project_root: str | None) -> Path | str:
+    """Project root for local search (updates the stored one) or an error message."""
     lifespan = ctx.request_context.lifespan_context
     stored_root = lifespan.lean_project_path
 
@@ -881,18 +1357,13 @@ def local_search(
 
     if resolved_root is None:
         return "Lean project path not set. Call a file-based tool (like lean_file_contents) first to set the project path."
-
-    try:
-        return lean_local_search(
-            query=query.strip(), limit=limit, project_root=resolved_root
-        )
-    except RuntimeError as exc:
-        return f"lean_local_search error:\n{exc}"
+    return resolved_root
 
 
 @mcp.tool("lean_leandex")
+# @rate_limited("leandex", max_requests=3, per_seconds=30, upstream=True)
+@offload
 @log_tool_execution
-# @rate_limited("leandex", max_requests=3, per_seconds=30)
 def leandex(ctx: Context, query: str, num_results: int = 5) -> List[Dict] | str:
     """Search for theorems and definitions using leandex.
 
@@ -931,28 +1402,34 @@ def leandex(ctx: Context, query: str, num_results: int = 5) -> List[Dict] | str:
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36 Edg/141.0.0.0",
         }
 
-        with requests.get(url, headers=headers, params=params, stream=True) as resp:
-            for line in resp.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
+        def fetch(http: httpx.Client) -> List[Dict]:
+            with http.stream(
+                "GET", url, headers=headers, params=params, timeout=60
+            ) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
 
-                if line.startswith("data:"):
-                    data = line.removeprefix("data:").strip()
+                    if line.startswith("data:"):
+                        data = line.removeprefix("data:").strip()
 
             data = json.loads(data)
             results = data["data"]["search_results"]
 
             for result in results:
                 result["primary_declaration"] = result["primary_declaration"]["lean_name"]
-                
             return results
 
+        return cached_fetch(url, query, num_results, fetch)
+
     except Exception as e:
         return f"leandex error:\n{str(e)}"
 
 @mcp.tool("lean_loogle")
+@rate_limited("loogle", max_requests=3, per_seconds=30, upstream=True)
+@offload
 @log_tool_execution
-@rate_limited("loogle", max_requests=3, per_seconds=30)
 def loogle(ctx: Context, query: str, num_results: int = 8) -> List[dict] | str:
     """Search for definitions and theorems using loogle.
 
@@ -973,29 +1450,40 @@ def loogle(ctx: Context, query: str, num_results: int = 8) -> List[dict] | str:
         List[dict] | str: Search results or error msg
     """
     logger.info(f"🔧 Tool: lean_loogle(query='{query}', num_results={num_results})")
+    project_path = ctx.request_context.lifespan_context.lean_project_path
+    if loogle_mode() == "local" and project_path is not None:
+        local = get_local_loogle(project_path)
+        if local.ready:
+            # Answered in-process, does not count towards the rate limit
+            results = local.search(query, num_results)
+            return results if results else "No results found."
+        logger.info("Local loogle index not ready, asking loogle.lean-lang.org")
+        local.build_in_background()
+
     try:
-        req = urllib.request.Request(
-            f"https://loogle.lean-lang.org/json?q={urllib.parse.quote(query)}",
-            headers={"User-Agent": "lean-lsp-mcp/0.1"},
-            method="GET",
-        )
+        url = "https://loogle.lean-lang.org/json"
 
-        with urllib.request.urlopen(req, timeout=20) as response:
-            results = orjson.loads(response.read())
+        def fetch(http: httpx.Client) -> List[dict] | None:
+            response = http.get(url, params={"q": query})
+            response.raise_for_status()
+            results = orjson.loads(response.content)
+            if "hits" not in results:
+                return None
 
-        if "hits" not in results:
-            return "No results found."
+            results = results["hits"][:num_results]
+            for result in results:
+                result.pop("doc", None)
+            return results
 
-        results = results["hits"][:num_results]
-        for result in results:
-            result.pop("doc", None)
-        return results
+        results = cached_fetch(url, query, num_results, fetch)
+        return results if results is not None else "No results found."
     except Exception as e:
         return f"loogle error:\n{str(e)}"
 
 
 @mcp.tool("lean_leanfinder")
-@rate_limited("leanfinder", max_requests=10, per_seconds=30)
+@rate_limited("leanfinder", max_requests=10, per_seconds=30, upstream=True)
+@offload
 def leanfinder(ctx: Context, query: str, num_results: int = 5) -> List[Dict] | str:
     """Search Mathlib theorems/definitions semantically by mathematical concept or proof state using Lean Finder.
 
@@ -1015,18 +1503,19 @@ def leanfinder(ctx: Context, query: str, num_results: int = 5) -> List[Dict] | s
         List[Dict] | str: List of Lean statement objects (full name, formal statement, informal statement) or error msg
     """
     try:
-        headers = {"User-Agent": "lean-lsp-mcp/0.1", "Content-Type": "application/json"}
+        headers = {"Content-Type": "application/json"}
         request_url = (
             "https://bxrituxuhpc70w8w.us-east-1.aws.endpoints.huggingface.cloud"
         )
         payload = orjson.dumps({"inputs": query, "top_k": int(num_results)})
-        req = urllib.request.Request(
-            request_url, data=payload, headers=headers, method="POST"
-        )
 
-        results = []
-        with urllib.request.urlopen(req, timeout=30) as response:
-            data = orjson.loads(response.read())
+        def fetch(http: httpx.Client) -> List[Dict]:
+            response = http.post(
+                request_url, content=payload, headers=headers, timeout=30
+            )
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+            results = []
             for result in data["results"]:
                 if (
                     "https://leanprover-community.github.io/mathlib4_docs"
@@ -1040,15 +1529,18 @@ def leanfinder(ctx: Context, query: str, num_results: int = 5) -> List[Dict] | s
                     "informal_statement": result["informal_statement"],
                 }
                 results.append(obj)
+            return results
 
+        results = cached_fetch(request_url, query, num_results, fetch)
         return results if results else "Lean Finder: No results parsed"
     except Exception as e:
         return f"Lean Finder Error:\n{str(e)}"
 
 
 @mcp.tool("lean_state_search")
+@rate_limited("lean_state_search", max_requests=3, per_seconds=30, upstream=True)
+@offload
 @log_tool_execution
-@rate_limited("lean_state_search", max_requests=3, per_seconds=30)
 def state_search(
     ctx: Context, file_path: str, line: int, column: int, num_results: int = 5
 ) -> List | str:
@@ -1066,34 +1558,39 @@ def state_search(
         List | str: Search results or error msg
     """
     logger.info(f"🔧 Tool: lean_state_search(file_path={file_path}, line={line}, column={column}, num_results={num_results})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-    file_contents = client.get_file_content(rel_path)
-    goal = client.get_goal(rel_path, line - 1, column - 1)
+    client, rel_path = setup
+    with lock_file(client, rel_path):
+        client.open_file(rel_path)
+        file_contents = client.get_file_content(rel_path)
+        goal = client.get_goal(rel_path, line - 1, column - 1)
 
     f_line = format_line(file_contents, line, column)
     if not goal or not goal.get("goals"):
         return f"No goals found:\n{f_line}\nTry elsewhere?"
 
-    goal = urllib.parse.quote(goal["goals"][0])
+    goal = goal["goals"][0]
 
     try:
-        url = os.getenv("LEAN_STATE_SEARCH_URL", "https://premise-search.com")
-        req = urllib.request.Request(
-            f"{url}/api/search?query={goal}&results={num_results}&rev=v4.22.0",
-            headers={"User-Agent": "lean-lsp-mcp/0.1"},
-            method="GET",
+        url = (
+            os.getenv("LEAN_STATE_SEARCH_URL", "https://premise-search.com")
+            + "/api/search"
         )
 
-        with urllib.request.urlopen(req, timeout=20) as response:
-            results = orjson.loads(response.read())
+        def fetch(http: httpx.Client) -> List:
+            response = http.get(
+                url, params={"query": goal, "results": num_results, "rev": "v4.22.0"}
+            )
+            response.raise_for_status()
+            results = orjson.loads(response.content)
+            for result in results:
+                result.pop("rev")
+            return results
 
-        for result in results:
-            result.pop("rev")
+        results = cached_fetch(url, goal, num_results, fetch)
         # Very dirty type mix
         results.insert(0, f"Results for line:\n{f_line}")
         return results
@@ -1102,8 +1599,9 @@ def state_search(
 
 
 @mcp.tool("lean_hammer_premise")
+@rate_limited("hammer_premise", max_requests=3, per_seconds=30, upstream=True)
+@offload
 @log_tool_execution
-@rate_limited("hammer_premise", max_requests=3, per_seconds=30)
 def hammer_premise(
     ctx: Context, file_path: str, line: int, column: int, num_results: int = 32
 ) -> List[str] | str:
@@ -1119,14 +1617,15 @@ def hammer_premise(
         List[str] | str: List of relevant premises or error message
     """
     logger.info(f"🔧 Tool: lean_hammer_premise(file_path={file_path}, line={line}, column={column}, num_results={num_results})")
-    rel_path = setup_client_for_file(ctx, file_path)
-    if not rel_path:
+    setup = get_file_client(ctx, file_path)
+    if setup is None:
         return "Invalid Lean file path: Unable to start LSP server or load file"
 
-    client: LeanLSPClient = ctx.request_context.lifespan_context.client
-    client.open_file(rel_path)
-    file_contents = client.get_file_content(rel_path)
-    goal = client.get_goal(rel_path, line - 1, column - 1)
+    client, rel_path = setup
+    with lock_file(client, rel_path):
+        client.open_file(rel_path)
+        file_contents = client.get_file_content(rel_path)
+        goal = client.get_goal(rel_path, line - 1, column - 1)
 
     f_line = format_line(file_contents, line, column)
     if not goal or not goal.get("goals"):
@@ -1139,21 +1638,18 @@ def hammer_premise(
     }
 
     try:
-        url = os.getenv("LEAN_HAMMER_URL", "http://leanpremise.net")
-        req = urllib.request.Request(
-            url + "/retrieve",
-            headers={
-                "User-Agent": "lean-lsp-mcp/0.1",
-                "Content-Type": "application/json",
-            },
-            method="POST",
-            data=orjson.dumps(data),
-        )
+        url = os.getenv("LEAN_HAMMER_URL", "http://leanpremise.net") + "/retrieve"
 
-        with urllib.request.urlopen(req, timeout=20) as response:
-            results = orjson.loads(response.read())
+        def fetch(http: httpx.Client) -> List[str]:
+            response = http.post(
+                url,
+                content=orjson.dumps(data),
+                headers={"Content-Type": "application/json"},
+            )
+            response.raise_for_status()
+            return [result["name"] for result in orjson.loads(response.content)]
 
-        results = [result["name"] for result in results]
+        results = cached_fetch(url, data["state"], num_results, fetch)
         results.insert(0, f"Results for line:\n{f_line}")
         return results
     except Exception as e:
@@ -1161,6 +1657,7 @@ def hammer_premise(
 
 
 @mcp.tool("gemini_code_golf")
+@offload
 @log_tool_execution
 def gemini_code_golf(
     ctx: Context,
@@ -1199,6 +1696,10 @@ def gemini_code_golf(
 
     try:
         # 配置Gemini
+        # The LLM SDKs take most of the server's import time, load them on first use
+        from google import genai
+        from google.genai import types
+
         client = genai.Client(api_key = api_key)
 
         # 生成回复
@@ -1241,6 +1742,7 @@ def _log_gemini_prover_call(math_problem: str, solution: str, verification: str)
         logger.warning(f"Failed to log gemini prover call: {e}")
 
 @mcp.tool("gemini_informal_prover")
+@offload
 @log_tool_execution
 def gemini_informal_prover(
     ctx: Context,
@@ -1284,6 +1786,9 @@ def gemini_informal_prover(
     # 配置尝试次数
     max_attempts = 10  # generator和verifier都有3次机会
 
+    from google import genai
+    from google.genai import types
+
     client = genai.Client(api_key=api_key)
 
     solution = None
@@ -1390,6 +1895,7 @@ def _log_gpt_prover_call(math_problem: str, solution: str, verification: str):
         logger.warning(f"Failed to log gpt prover call: {e}")
 
 @mcp.tool("gpt_informal_prover")
+@offload
 @log_tool_execution
 def gpt_informal_prover(
     ctx: Context,
@@ -1433,6 +1939,8 @@ def gpt_informal_prover(
     # 配置尝试次数
     max_attempts = 3
 
+    from openai import OpenAI
+
     client = OpenAI(api_key=api_key)
 
     solution = None
@@ -1524,6 +2032,7 @@ def gpt_informal_prover(
         # 否则继续下一轮refinement
 
 @mcp.tool("discussion_partner")
+@offload
 @log_tool_execution
 def discussion_partner(
     ctx: Context,
@@ -1573,6 +2082,9 @@ def discussion_partner(
             return "Error: Please set the GEMINI_API_KEY environment variable."
 
         try:
+            from google import genai
+            from google.genai import types
+
             client = genai.Client(api_key=api_key)
             response = client.models.generate_content(
                 model=actual_model,
@@ -1597,6 +2109,8 @@ def discussion_partner(
             return "Error: Please set the OPENAI_API_KEY environment variable."
 
         try:
+            from openai import OpenAI
+
             client = OpenAI(api_key=api_key)
             response = client.responses.create(
                 model=actual_model,
@@ -0,0 +1,165 @@
+"""Warm scratch documents that reuse Lean's elaborated prefix across tool calls."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+from leanclient import LeanLSPClient, DocumentContentChange
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.client_utils import lock_file
+
+
+logger = get_logger(__name__)
+
+_HEADER_LINE = re.compile(r"^\s*(?:import\s|prelude\b|--|$)")
+
+
+def import_header(code: str) -> str:
+    """Return the leading import block of ``code`` (imports, blank and comment lines)."""
+    header = []
+    for line in code.splitlines(keepends=True):
+        if not _HEADER_LINE.match(line):
+            break
+        header.append(line)
+    return "".join(header)
+
+
+def _split_lines(text: str) -> list[str]:
+    """Split like LSP does (on ``\\n`` only), keeping line endings."""
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def replace_line(content: str, line: int, text: str) -> str:
+    """Replace line ``line`` (1-indexed) of ``content`` with ``text``, appending past the end."""
+    lines = _split_lines(content)
+    if line - 1 < len(lines):
+        lines[line - 1] = f"{text}\n"
+    else:
+        lines.append(f"{text}\n")
+    return "".join(lines)
+
+
+def minimal_change(old: str, new: str) -> DocumentContentChange | None:
+    """Build a single change replacing only the lines that differ between ``old`` and ``new``.
+
+    Lean re-elaborates a document from the first changed position, so sending
+    the smallest change keeps the header and all unchanged leading commands.
+    """
+    if old == new:
+        return None
+
+    old_lines = _split_lines(old)
+    new_lines = _split_lines(new)
+
+    prefix = 0
+    limit = min(len(old_lines), len(new_lines))
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+
+    suffix = 0
+    limit -= prefix
+    while (
+        suffix < limit
+        and old_lines[-1 - suffix] == new_lines[-1 - suffix]
+        and old_lines[-1 - suffix].endswith("\n")
+    ):
+        suffix += 1
+
+    # A last line without newline ends at its length (UTF-16 units) instead of the next line start
+    end = [len(old_lines) - suffix, 0]
+    if suffix == 0 and old_lines and not old_lines[-1].endswith("\n"):
+        end = [len(old_lines) - 1, len(old_lines[-1].encode("utf-16-le")) // 2]
+
+    text = "".join(new_lines[prefix : len(new_lines) - suffix])
+    return DocumentContentChange(text, [prefix, 0], end)
+
+
+class WarmDocuments:
+    """Scratch documents kept open in the Lean server between tool calls.
+
+    Each key (e.g. an import header or a source file) maps to one document.
+    Updating it with :func:`minimal_change` lets Lean reuse the elaborated
+    imports and every unchanged command before the edit, so repeated checks
+    only pay for the part that changed. Documents are only needed on disk
+    while they are opened. The oldest documents are closed beyond
+    ``max_documents`` to leave room for the user's files.
+    """
+
+    def __init__(self, max_documents: int = 2):
+        self.max_documents = max(1, max_documents)
+        self._documents: OrderedDict[str, LeanLSPClient] = OrderedDict()
+        self._evicted: list[tuple[str, LeanLSPClient]] = []
+        self._lock = Lock()
+
+    @staticmethod
+    def document_path(project_path: Path, key: str) -> str:
+        digest = hashlib.sha1(f"{project_path}\0{key}".encode("utf-8")).hexdigest()
+        return f"_mcp_warm_{digest[:16]}.lean"
+
+    def update(self, client: LeanLSPClient, key: str, content: str) -> str:
+        """Make the document for ``key`` hold ``content`` and return its relative path.
+
+        Call while holding :func:`lock_file` for :meth:`path_for`, then
+        :meth:`close_evicted` once the lock is released.
+        """
+        project_path = Path(client.project_path)
+        rel_path = self.document_path(project_path, key)
+
+        try:
+            old = client.get_file_content(rel_path)
+        except FileNotFoundError:
+            old = None
+
+        if old is None:
+            abs_path = project_path / rel_path
+            with open(abs_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            try:
+                client.open_file(rel_path)
+            finally:
+                try:
+                    os.remove(abs_path)
+                except OSError as exc:
+                    logger.warning("Failed to remove `%s`: %s", abs_path, exc)
+        elif change := minimal_change(old, content):
+            client.update_file(rel_path, [change])
+
+        self._touch(client, rel_path)
+        return rel_path
+
+    def path_for(self, client: LeanLSPClient, key: str) -> str:
+        return self.document_path(Path(client.project_path), key)
+
+    def _touch(self, client: LeanLSPClient, rel_path: str) -> None:
+        with self._lock:
+            self._documents[rel_path] = client
+            self._documents.move_to_end(rel_path)
+            while len(self._documents) > self.max_documents:
+                self._evicted.append(self._documents.popitem(last=False))
+
+    def close_evicted(self) -> None:
+        """Close documents pushed out by :meth:`update`.
+
+        Call after releasing the file lock, so two threads never wait on
+        each other's workers.
+        """
+        with self._lock:
+            evicted, self._evicted = self._evicted, []
+
+        for path, owner in evicted:
+            try:
+                with lock_file(owner, path):
+                    owner.close_files([path])
+            except Exception as exc:
+                # Already closed by leanclient or its client was shut down
+                logger.debug("Warm document `%s` not closed: %s", path, exc)
@@ -0,0 +1,172 @@
+"""Optional SQLite store that lets several server processes share limits and caches."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+from lean_lsp_mcp.cache_utils import get_cache_dir
+
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS limiters (
+    category TEXT PRIMARY KEY,
+    tat REAL NOT NULL,
+    allowed INTEGER NOT NULL,
+    delayed INTEGER NOT NULL,
+    rejected INTEGER NOT NULL,
+    wait_seconds REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    used REAL NOT NULL,
+    value BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+"""
+
+LIMITER_FIELDS = ("tat", "allowed", "delayed", "rejected", "wait_seconds")
+
+
+class SharedState:
+    """Rate limiter buckets and search responses in one SQLite file.
+
+    The database runs in WAL mode, so readers never block; every limiter
+    update is a ``BEGIN IMMEDIATE`` transaction, which serializes the
+    read-modify-write across processes. Each thread uses its own connection.
+    """
+
+    def __init__(self, path: Path, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedState"]:
+        """Store at ``<LEAN_LSP_CACHE_DIR>/state.sqlite3`` if ``LEAN_LSP_SHARED_STATE`` is set."""
+        if os.environ.get("LEAN_LSP_SHARED_STATE", "").lower() not in (
+            "1",
+            "true",
+            "yes",
+        ):
+            return None
+        cache_dir = get_cache_dir()
+        if cache_dir is None:
+            logger.warning(
+                "LEAN_LSP_SHARED_STATE needs LEAN_LSP_CACHE_DIR, not sharing state"
+            )
+            return None
+        try:
+            return cls(cache_dir / "state.sqlite3")
+        except (OSError, sqlite3.Error) as exc:
+            logger.warning("Shared state unavailable, using process memory: %s", exc)
+            return None
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are started explicitly
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        yield conn
+
+    @contextmanager
+    def limiter(self, category: str) -> Iterator[dict]:
+        """Lock the bucket of ``category`` across processes and yield its fields.
+
+        Changes to the yielded dict are written back when the block exits
+        without an exception.
+        """
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tat, allowed, delayed, rejected, wait_seconds FROM limiters WHERE category = ?",
+                    (category,),
+                ).fetchone()
+                state = dict(zip(LIMITER_FIELDS, row or (0.0, 0, 0, 0, 0.0)))
+                yield state
+                conn.execute(
+                    "INSERT OR REPLACE INTO limiters VALUES (?, ?, ?, ?, ?, ?)",
+                    (category, *(state[f] for f in LIMITER_FIELDS)),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get_response(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        try:
+            with self._connection() as conn:
+                row = conn.execute(
+                    "SELECT value FROM responses WHERE key = ? AND expires > ?",
+                    (key, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE responses SET used = ? WHERE key = ?", (now, key)
+                    )
+        except sqlite3.Error as exc:
+            logger.warning("Shared response cache read failed: %s", exc)
+            return None
+        return row[0] if row else None
+
+    def put_response(
+        self, key: str, value: bytes, ttl: float, max_entries: int
+    ) -> None:
+        now = time.time()
+        try:
+            with self._connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                        (key, now + ttl, now, value),
+                    )
+                    # Drop expired entries, then the least recently used beyond the limit
+                    conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                        (max_entries,),
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as exc:
+            logger.warning("Shared response cache write failed: %s", exc)
+
+
+_SHARED_STATE: Optional[SharedState] = None
+_SHARED_STATE_LOADED = False
+_SHARED_STATE_LOCK = threading.Lock()
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """Process-wide :class:`SharedState`, or ``None`` if sharing is disabled."""
+    global _SHARED_STATE, _SHARED_STATE_LOADED
+    with _SHARED_STATE_LOCK:
+        if not _SHARED_STATE_LOADED:
+            _SHARED_STATE = SharedState.from_env()
+            _SHARED_STATE_LOADED = True
+        return _SHARED_STATE
@@ -1,7 +1,12 @@
+import asyncio
+import contextvars
+import functools
 import os
 import secrets
 import sys
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Callable
 
 from mcp.server.auth.provider import AccessToken, TokenVerifier
@@ -353,3 +358,41 @@ def deprecated(func_or_msg: str | Callable | None = None) -> Callable:
         return _decorator
 
     return _decorator(func_or_msg)
+
+
+_EXECUTOR: ThreadPoolExecutor | None = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Shared, bounded thread pool for blocking tool work (``LEAN_LSP_TOOL_THREADS``, default 8)."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            try:
+                max_workers = max(1, int(os.environ.get("LEAN_LSP_TOOL_THREADS", "8")))
+            except ValueError:
+                max_workers = 8
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="lean-tool"
+            )
+        return _EXECUTOR
+
+
+def offload(func: Callable) -> Callable:
+    """Turn a blocking tool into an async one that runs on the shared tool executor.
+
+    Keeps the event loop free while Lean elaborates, so other sessions and
+    requests make progress. The wrapped signature is preserved for FastMCP.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Context variables (e.g. upstream_guard) carry over into the worker
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            get_tool_executor(), functools.partial(context.run, func, *args, **kwargs)
+        )
+
+    return wrapper
@@ -0,0 +1,350 @@
+"""Watch Lean projects for file changes (inotify on Linux, polling elsewhere).
+
+Only the project's own sources are watched: ``.lake`` (packages and build
+output) and other hidden directories are skipped. Dependencies change
+with ``lake-manifest.json``, which is watched.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from mcp.server.fastmcp.utilities.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+# Files whose change affects the project setup rather than a single module
+STRUCTURE_FILES = {
+    "lean-toolchain",
+    "lake-manifest.json",
+    "lakefile.lean",
+    "lakefile.toml",
+}
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_watched_file(name: str) -> bool:
+    """Lean sources and project setup files, ignoring the server's scratch files."""
+    if name in STRUCTURE_FILES:
+        return True
+    return name.endswith(".lean") and not name.startswith("_mcp_")
+
+
+def _skip_dir(parent: Path, name: str) -> bool:
+    return name.startswith(".")
+
+
+def walk_dirs(root: Path) -> Iterator[Path]:
+    """Directories of ``root`` that can contain project sources (skips ``.lake``, ``.git``, ...)."""
+    for dirpath, dirnames, _ in os.walk(root):
+        current = Path(dirpath)
+        dirnames[:] = [d for d in dirnames if not _skip_dir(current, d)]
+        yield current
+
+
+class ProjectWatcher:
+    """Tracks changed files below a project root, including ``.lake/packages``.
+
+    Subscribers receive sets of changed paths (files, or directories that
+    were created, moved or removed). Every changed file gets a new version,
+    and :attr:`generation` grows on setup file, directory or overflow events.
+    :meth:`stamp` combines both so callers can memoize per file version.
+
+    Only ``exact`` watchers (inotify) can be synced on demand; polling
+    watchers report changes with a delay, so their stamps are ``None``.
+    Watches are set up by the watcher's thread, and stamps are ``None``
+    until that is done (see :meth:`is_exact`).
+    """
+
+    exact = False
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.generation = 0
+        self._versions: dict[str, int] = {}
+        self._subscribers: list[Callable[[set[Path]], None]] = []
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, callback: Callable[[set[Path]], None]) -> None:
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def sync(self) -> None:
+        """Process events that already happened (no-op for polling watchers)."""
+
+    def is_exact(self) -> bool:
+        """Whether every change is known once :meth:`sync` returns."""
+        return self.exact and self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def stamp(self, path: Path | str) -> Optional[tuple[int, int]]:
+        """Version of ``path`` as of now, or ``None`` if changes may not be known yet."""
+        if not self.is_exact():
+            return None
+        self.sync()
+        with self._lock:
+            return self.generation, self._versions.get(str(path), 0)
+
+    def _publish(self, changed: set[Path], structural: bool = False) -> None:
+        if not changed and not structural:
+            return
+        with self._lock:
+            for path in changed:
+                key = str(path)
+                self._versions[key] = self._versions.get(key, 0) + 1
+                if path.name in STRUCTURE_FILES or not path.name.endswith(".lean"):
+                    structural = True
+            if structural:
+                self.generation += 1
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(changed)
+            except (
+                Exception
+            ) as exc:  # pragma: no cover - subscriber bugs must not stop watching
+                logger.warning("File watcher subscriber failed: %s", exc)
+
+    def start(self) -> "ProjectWatcher":
+        self._thread = threading.Thread(
+            target=self._main, name=f"lean-watch-{self.root.name}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def _main(self) -> None:
+        try:
+            self._setup()
+        except OSError as exc:
+            # E.g. fs.inotify.max_user_watches exhausted: stamps stay None
+            logger.warning("Cannot watch `%s`: %s", self.root, exc)
+            return
+        self._ready.set()
+        self._run()
+
+    def _setup(self) -> None:
+        """Install the watches (in the watcher's thread, not in a tool call)."""
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:  # pragma: no cover - implemented by backends
+        raise NotImplementedError
+
+
+class InotifyWatcher(ProjectWatcher):
+    """Linux inotify watcher with one watch per source directory."""
+
+    exact = True
+
+    def __init__(self, root: Path):
+        super().__init__(root)
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: dict[int, Path] = {}
+
+    def _setup(self) -> None:
+        with self._lock:
+            for directory in walk_dirs(self.root):
+                self._add_watch(directory)
+        # Changes made while the watches were added are unknown: subscribers rescan
+        self._publish({self.root}, structural=True)
+
+    def _add_watch(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), ctypes.c_uint32(_WATCH_MASK)
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return  # Removed meanwhile
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+        self._dirs[wd] = directory
+
+    def sync(self) -> None:
+        with self._lock:
+            changed, structural = set(), False
+            while True:
+                try:
+                    data = os.read(self._fd, 65536)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    return
+                structural |= self._parse(data, changed)
+        self._publish(changed, structural)
+
+    def _parse(self, data: bytes, changed: set[Path]) -> bool:
+        structural = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            raw_name = data[
+                offset + _EVENT_HEADER.size : offset + _EVENT_HEADER.size + length
+            ]
+            offset += _EVENT_HEADER.size + length
+            name = os.fsdecode(raw_name.rstrip(b"\0"))
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost: report the root so subscribers rescan
+                changed.add(self.root)
+                structural = True
+                continue
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / name
+
+            if mask & _IN_ISDIR:
+                if _skip_dir(directory, name):
+                    continue
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    for sub in walk_dirs(path):
+                        try:
+                            self._add_watch(sub)
+                        except OSError as exc:
+                            logger.warning("Cannot watch `%s`: %s", sub, exc)
+                changed.add(path)
+                structural = True
+            elif is_watched_file(name):
+                changed.add(path)
+        return structural
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+            except (OSError, ValueError):
+                return
+            if ready:
+                self.sync()
+
+    def stop(self) -> None:
+        super().stop()
+        with self._lock:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+
+
+class PollingWatcher(ProjectWatcher):
+    """Portable fallback that compares mtimes and sizes every ``interval`` seconds."""
+
+    def __init__(self, root: Path, interval: float = 2.0):
+        super().__init__(root)
+        self.interval = interval
+        self._snapshot: Optional[dict[Path, tuple[int, int]]] = None
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        snapshot = {}
+        for directory in walk_dirs(self.root):
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if not is_watched_file(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _setup(self) -> None:
+        self.poll()
+
+    def poll(self) -> None:
+        """Compare with the previous scan and publish the differences (the first scan is the baseline)."""
+        snapshot = self._scan()
+        if self._snapshot is None:
+            self._snapshot = snapshot
+            return
+        changed = {
+            path
+            for path in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(path) != self._snapshot.get(path)
+        }
+        self._snapshot = snapshot
+        self._publish(changed)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+
+def watch_mode() -> str:
+    """``LEAN_LSP_WATCH``: ``auto`` (default), ``poll`` or ``off``."""
+    mode = os.environ.get("LEAN_LSP_WATCH", "auto").strip().lower()
+    return mode if mode in ("auto", "poll", "off") else "auto"
+
+
+_WATCHERS: dict[Path, Optional[ProjectWatcher]] = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def get_watcher(root: Path) -> Optional[ProjectWatcher]:
+    """Shared watcher for ``root``, started on first use; ``None`` if watching is off."""
+    with _WATCHERS_LOCK:
+        if root in _WATCHERS:
+            return _WATCHERS[root]
+
+        mode = watch_mode()
+        watcher: Optional[ProjectWatcher] = None
+        if mode == "auto" and sys.platform.startswith("linux"):
+            try:
+                watcher = InotifyWatcher(root)
+            except (OSError, AttributeError) as exc:
+                # E.g. fs.inotify.max_user_instances reached
+                logger.info(
+                    "inotify unavailable for `%s` (%s), polling instead", root, exc
+                )
+        if watcher is None and mode != "off":
+            watcher = PollingWatcher(root)
+
+        _WATCHERS[root] = watcher.start() if watcher else None
+        return _WATCHERS[root]
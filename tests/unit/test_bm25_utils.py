@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import orjson
+import pytest
+
+from lean_lsp_mcp import index_utils
+from lean_lsp_mcp.bm25_utils import (
+    Bm25Index,
+    LocalSemanticSearch,
+    extract_documents,
+    tokenize,
+)
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture(autouse=True)
+def isolated_index(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(index_utils, "_get_lean_src_search_path", lambda: None)
+    monkeypatch.setattr(index_utils, "_INDEXES", {})
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_tokenize_splits_lean_names() -> None:
+    assert tokenize("Nat.add_comm HasDerivAt") == [
+        "nat",
+        "add",
+        "comm",
+        "has",
+        "deriv",
+        "at",
+    ]
+    assert tokenize("the sums of primes") == ["sum", "prime"]
+
+
+def test_extract_documents() -> None:
+    source = (
+        "/-- Addition is\n  commutative. -/\n"
+        "@[simp]\n"
+        "theorem add_comm' (a b : Nat) :\n    a + b = b + a := by\n  omega\n"
+        "def noDoc : Nat := 1\n"
+    )
+    assert extract_documents(source.encode()) == [
+        (
+            "add_comm'",
+            "theorem",
+            3,
+            "theorem add_comm' (a b : Nat) : a + b = b + a",
+            "Addition is commutative.",
+        ),
+        ("noDoc", "def", 6, "def noDoc : Nat", ""),
+    ]
+
+
+def test_local_semantic_search_ranks_and_refreshes(tmp_path: Path) -> None:
+    _write(
+        tmp_path / "Basic.lean",
+        "/-- The sum of two even numbers is even. -/\n"
+        "theorem even_add_even (h : Even a) (h' : Even b) : Even (a + b) := sorry\n"
+        "/-- Multiplication of natural numbers is commutative. -/\n"
+        "theorem Nat.mul_comm' (a b : Nat) : a * b = b * a := sorry\n",
+    )
+    _write(
+        tmp_path / ".lake/packages/lib/Lib.lean",
+        "theorem prime_two : Nat.Prime 2 := sorry\n",
+    )
+    search = LocalSemanticSearch(tmp_path, tmp_path / "cache")
+
+    results = search.search("sum of even numbers", limit=2)
+    assert results[0]["name"] == "even_add_even"
+    assert results[0]["doc"] == "The sum of two even numbers is even."
+    # Abbreviations in names match full words
+    assert (
+        search.search("commutativity of multiplication", 1)[0]["name"]
+        == "Nat.mul_comm'"
+    )
+    assert search.search("prime", 5)[0]["file"].endswith("Lib.lean")
+    assert search.search("zzz", 5) == []
+
+    deps = search._indexes["deps"]
+    _write(tmp_path / "Basic.lean", "theorem odd_mul_odd : True := trivial\n")
+    index_utils.get_declaration_index(tmp_path).refresh(force=True)
+    assert search.search("odd", 1)[0]["name"] == "odd_mul_odd"
+    # Only the changed group was rebuilt
+    assert search._indexes["deps"] is deps
+
+    # Another process loads the stored arrays instead of rebuilding
+    reloaded = LocalSemanticSearch(tmp_path, tmp_path / "cache")
+    assert reloaded.search("odd", 1)[0]["name"] == "odd_mul_odd"
+    assert len(list((tmp_path / "cache").glob("project-*"))) == 1
+
+
+def test_groups_share_one_idf(tmp_path: Path) -> None:
+    # Documents of equal length, so only the IDF differs between groups
+    project = ["alpha_one", "gamma_two"]
+    deps = ["alpha_three", "beta_four", "beta_five", "delta_six"]
+    _write(
+        tmp_path / "Basic.lean",
+        "".join(f"theorem {n} : True := trivial\n" for n in project),
+    )
+    _write(
+        tmp_path / ".lake/packages/lib/Lib.lean",
+        "".join(f"theorem {n} : True := trivial\n" for n in deps),
+    )
+    search = LocalSemanticSearch(tmp_path, tmp_path / "cache")
+    results = search.search("alpha", 5)
+
+    combined = Bm25Index.build(
+        [[n, "theorem", "", 1, f"theorem {n} : True", ""] for n in project + deps],
+        tmp_path / "combined",
+        "",
+    )
+    expected = {doc[0]: round(score, 3) for score, doc in combined.search("alpha", 5)}
+    assert {r["name"]: r["score"] for r in results} == expected
+    assert results[0]["score"] == results[1]["score"]
+
+    # Documents are stored next to the arrays, not in the metadata
+    meta = next((tmp_path / "cache").glob("project-*")) / "meta.json"
+    assert "docs" not in orjson.loads(meta.read_bytes())
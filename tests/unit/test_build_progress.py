@@ -2,11 +2,21 @@
 
 from __future__ import annotations
 
+import asyncio
+import threading
+from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
-from lean_lsp_mcp.server import lsp_build
+from lean_lsp_mcp.client_utils import CLIENT_LOCK, LeanWorkerPool
+from lean_lsp_mcp.server import build_report, lsp_build
+
+
+@pytest.fixture(autouse=True)
+def _build_state_dir(tmp_path, monkeypatch):
+    """Keep the recorded build state of the fake projects out of the user's cache."""
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", str(tmp_path / "cache"))
 
 
 @pytest.mark.asyncio
@@ -66,8 +76,7 @@ Build completed successfully (8 jobs).
 
     with (
         patch("lean_lsp_mcp.server.asyncio.create_subprocess_exec", mock_subprocess),
-        patch("lean_lsp_mcp.server.LeanLSPClient", return_value=mock_client),
-        patch("lean_lsp_mcp.server.OutputCapture"),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient", return_value=mock_client),
         patch("lean_lsp_mcp.server.subprocess.run"),
     ):
         await lsp_build(mock_ctx, lean_project_path="/fake/path")
@@ -148,8 +157,7 @@ Done.
 
     with (
         patch("lean_lsp_mcp.server.asyncio.create_subprocess_exec", mock_subprocess),
-        patch("lean_lsp_mcp.server.LeanLSPClient", return_value=mock_client),
-        patch("lean_lsp_mcp.server.OutputCapture"),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient", return_value=mock_client),
         patch("lean_lsp_mcp.server.subprocess.run"),
     ):
         result = await lsp_build(mock_ctx, lean_project_path="/fake/path")
@@ -161,3 +169,365 @@ Done.
         assert len(progress_calls) == 0, (
             "Should not report progress when no markers are present"
         )
+
+
+@pytest.mark.asyncio
+async def test_lean_build_noop_keeps_client_and_skips_cache_get(tmp_path, monkeypatch):
+    """A rebuild without new .olean files neither refetches the cache nor restarts Lean."""
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", str(tmp_path / "cache"))
+    project = tmp_path / "proj"
+    project.mkdir()
+    (project / "lean-toolchain").write_text("leanprover/lean4:v4.20.0\n")
+    (project / "lake-manifest.json").write_text('{"packages": []}\n')
+
+    running = MagicMock()
+    running.project_path = project.resolve()
+    mock_ctx = MagicMock()
+    mock_ctx.request_context.lifespan_context.client = running
+    mock_ctx.report_progress = AsyncMock()
+
+    def make_process(*args, **kwargs):
+        process = MagicMock()
+        process.returncode = 0
+        process.wait = AsyncMock()
+        process.stdout.readline = AsyncMock(return_value=b"")
+        return process
+
+    run = MagicMock(return_value=MagicMock(returncode=0))
+    with (
+        patch(
+            "lean_lsp_mcp.server.asyncio.create_subprocess_exec",
+            AsyncMock(side_effect=make_process),
+        ),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient") as client_cls,
+        patch("lean_lsp_mcp.server.subprocess.run", run),
+    ):
+        first = await lsp_build(mock_ctx, lean_project_path=str(project))
+        second = await lsp_build(mock_ctx, lean_project_path=str(project))
+
+    assert run.call_count == 1
+    assert "Skipped `lake exe cache get`" in second
+    assert "kept the running Lean server" in first
+    client_cls.assert_not_called()
+    running.close.assert_not_called()
+    assert mock_ctx.request_context.lifespan_context.client is running
+
+
+@pytest.mark.asyncio
+async def test_lean_build_target_builds_dependents_and_returns_timings(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    project = tmp_path / "proj"
+    (project / "Proj").mkdir(parents=True)
+    (project / "Proj" / "Basic.lean").write_text("import Mathlib\n")
+    (project / "Proj" / "Main.lean").write_text("import Proj.Basic\n")
+    (project / "lakefile.toml").write_text(
+        'name = "proj"\n\n[[lean_lib]]\nname = "Proj"\n'
+    )
+
+    mock_ctx = MagicMock()
+    mock_ctx.request_context.lifespan_context.client = None
+    mock_ctx.report_progress = AsyncMock()
+
+    lines = [
+        b"\xe2\x84\xb9 [1/2] Built Proj.Basic (412ms)\n",
+        b"\xe2\x84\xb9 [2/2] Built Proj.Main (2.5s)\n",
+    ]
+
+    async def mock_readline():
+        return lines.pop(0) if lines else b""
+
+    mock_process = MagicMock()
+    mock_process.returncode = 0
+    mock_process.wait = AsyncMock()
+    mock_process.stdout.readline = mock_readline
+    mock_subprocess = AsyncMock(return_value=mock_process)
+
+    with (
+        patch("lean_lsp_mcp.server.asyncio.create_subprocess_exec", mock_subprocess),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient"),
+        patch("lean_lsp_mcp.server.subprocess.run"),
+    ):
+        result = await lsp_build(
+            mock_ctx,
+            lean_project_path=str(project),
+            target=str(project / "Proj" / "Basic.lean"),
+        )
+
+    assert mock_subprocess.call_args.args == ("lake", "build", "--verbose", "Proj.Main")
+    assert result["targets"] == ["Proj.Main"]
+    assert result["modules"] == [
+        {"target": "Proj.Main", "seconds": 2.5},
+        {"target": "Proj.Basic", "seconds": 0.412},
+    ]
+    assert "Built Proj.Main" in result["output"]
+
+    # A file outside every lean_lib is only covered by a full build
+    (project / "Scratch.lean").write_text("import Proj.Main\n")
+    with (
+        patch("lean_lsp_mcp.server.asyncio.create_subprocess_exec", mock_subprocess),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient"),
+        patch("lean_lsp_mcp.server.subprocess.run"),
+    ):
+        result = await lsp_build(
+            mock_ctx, lean_project_path=str(project), target="Scratch.lean"
+        )
+
+    assert mock_subprocess.call_args.args == ("lake", "build", "--verbose")
+    assert "belongs to no `lean_lib`" in result
+
+
+@pytest.mark.asyncio
+async def test_lean_build_serves_from_old_client_until_swap(tmp_path, monkeypatch):
+    """The running client stays active during the build and is replaced afterwards."""
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    project = (tmp_path / "proj").resolve()
+    project.mkdir()
+    lib = project / ".lake" / "build" / "lib"
+
+    running = MagicMock()
+    running.project_path = project
+    lifespan = MagicMock()
+    lifespan.client = running
+    lifespan.client_registry = None
+    mock_ctx = MagicMock()
+    mock_ctx.request_context.lifespan_context = lifespan
+    mock_ctx.report_progress = AsyncMock()
+
+    seen_during_build = []
+
+    async def mock_readline():
+        if not seen_during_build:
+            seen_during_build.append(lifespan.client)
+            lib.mkdir(parents=True)
+            (lib / "Proj.olean").write_bytes(b"olean")
+            return b"\xe2\x84\xb9 [1/1] Built Proj (1.0s)\n"
+        return b""
+
+    mock_process = MagicMock()
+    mock_process.returncode = 0
+    mock_process.wait = AsyncMock()
+    mock_process.stdout.readline = mock_readline
+
+    replacement = MagicMock()
+    replacement.project_path = project
+    with (
+        patch(
+            "lean_lsp_mcp.server.asyncio.create_subprocess_exec",
+            AsyncMock(return_value=mock_process),
+        ),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient", return_value=replacement),
+        patch("lean_lsp_mcp.server.subprocess.run"),
+    ):
+        await lsp_build(mock_ctx, lean_project_path=str(project))
+
+    assert seen_during_build == [running]
+    assert lifespan.client is replacement
+    assert lifespan.client_registry.get(project) is replacement
+    for _ in range(500):
+        if running.close.called:
+            break
+        await asyncio.sleep(0.01)
+    running.close.assert_called_once()
+    replacement.close.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_lean_build_swap_does_not_block_event_loop(tmp_path, monkeypatch):
+    """A worker holding CLIENT_LOCK delays the swap, not every other tool."""
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    project = (tmp_path / "proj").resolve()
+    lib = project / ".lake" / "build" / "lib"
+    lib.mkdir(parents=True)
+
+    lifespan = MagicMock()
+    lifespan.client = None
+    lifespan.client_registry = None
+    mock_ctx = MagicMock()
+    mock_ctx.request_context.lifespan_context = lifespan
+    mock_ctx.report_progress = AsyncMock()
+
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with CLIENT_LOCK:
+            locked.set()
+            release.wait(5)
+
+    async def mock_readline():
+        if not locked.is_set():
+            (lib / "Proj.olean").write_bytes(b"olean")
+            threading.Thread(target=hold_lock, daemon=True).start()
+            locked.wait(5)
+        return b""
+
+    mock_process = MagicMock()
+    mock_process.returncode = 0
+    mock_process.wait = AsyncMock()
+    mock_process.stdout.readline = mock_readline
+
+    with (
+        patch(
+            "lean_lsp_mcp.server.asyncio.create_subprocess_exec",
+            AsyncMock(return_value=mock_process),
+        ),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient"),
+        patch("lean_lsp_mcp.server.subprocess.run"),
+    ):
+        build = asyncio.create_task(lsp_build(mock_ctx, lean_project_path=str(project)))
+        await asyncio.sleep(0.1)
+        # The loop keeps running while the build waits for the lock
+        assert locked.is_set() and not build.done()
+        release.set()
+        await asyncio.wait_for(build, 5)
+
+    assert lifespan.client is not None
+
+
+@pytest.mark.asyncio
+async def test_lean_build_stream_reports_lines_and_returns_summary(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", str(tmp_path / "cache"))
+    project = tmp_path / "proj"
+    project.mkdir()
+
+    mock_ctx = MagicMock()
+    mock_ctx.request_context.lifespan_context.client = None
+    mock_ctx.report_progress = AsyncMock()
+
+    lines = [
+        b"info: fetching dependencies\n",
+        b"\xe2\x9c\x96 [1/2] Building Proj.Bad\n",
+        b"error: ./Proj/Bad.lean:1:0: unexpected token\n",
+        b"error: build failed\n",
+    ]
+
+    async def mock_readline():
+        return lines.pop(0) if lines else b""
+
+    mock_process = MagicMock()
+    mock_process.returncode = 1
+    mock_process.wait = AsyncMock()
+    mock_process.stdout.readline = mock_readline
+
+    with (
+        patch(
+            "lean_lsp_mcp.server.asyncio.create_subprocess_exec",
+            AsyncMock(return_value=mock_process),
+        ),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient"),
+        patch("lean_lsp_mcp.server.subprocess.run"),
+    ):
+        result = await lsp_build(mock_ctx, lean_project_path=str(project), stream=True)
+
+    messages = [
+        call.kwargs["message"] for call in mock_ctx.report_progress.call_args_list
+    ]
+    assert messages == [
+        "info: fetching dependencies",
+        "Building Proj.Bad",
+        "error: ./Proj/Bad.lean:1:0: unexpected token",
+        "error: build failed",
+    ]
+    assert result["status"] == "failed"
+    assert result["errors"] == [
+        "✖ [1/2] Building Proj.Bad",
+        "error: ./Proj/Bad.lean:1:0: unexpected token",
+        "error: build failed",
+    ]
+    assert "unexpected token" in Path(result["log_file"]).read_text()
+
+
+@pytest.mark.asyncio
+async def test_lean_build_records_modules_for_eta_and_report(tmp_path):
+    project = (tmp_path / "proj").resolve()
+    (project / "Proj").mkdir(parents=True)
+    (project / "Proj" / "Basic.lean").write_text("def x := 1\n")
+
+    mock_ctx = MagicMock()
+    mock_ctx.request_context.lifespan_context.client = None
+    mock_ctx.report_progress = AsyncMock()
+
+    def make_process(*args, **kwargs):
+        lines = [
+            b"\xe2\x84\xb9 [1/2] Built Proj.Basic (3.5s)\n",
+            b"\xe2\x84\xb9 [2/2] Built Proj (10ms)\n",
+        ]
+
+        async def readline():
+            return lines.pop(0) if lines else b""
+
+        process = MagicMock()
+        process.returncode = 0
+        process.wait = AsyncMock()
+        process.stdout.readline = readline
+        return process
+
+    with (
+        patch(
+            "lean_lsp_mcp.server.asyncio.create_subprocess_exec",
+            AsyncMock(side_effect=make_process),
+        ),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient"),
+        patch("lean_lsp_mcp.server.subprocess.run"),
+    ):
+        await lsp_build(mock_ctx, lean_project_path=str(project))
+        messages = [
+            c.kwargs["message"] for c in mock_ctx.report_progress.call_args_list
+        ]
+        assert not any("left)" in m for m in messages)
+
+        mock_ctx.report_progress.reset_mock()
+        await lsp_build(mock_ctx, lean_project_path=str(project))
+        messages = [
+            c.kwargs["message"] for c in mock_ctx.report_progress.call_args_list
+        ]
+        assert messages[0].startswith("Built Proj.Basic (about ")
+
+    report = await build_report(mock_ctx)
+    assert report["last_build"]["jobs"] == 2
+    assert report["slowest"][0]["module"] == "Proj.Basic"
+    assert report["slowest"][0]["seconds"] == 3.5
+    assert report["failed"] == []
+    assert report["stale"] == []
+
+
+@pytest.mark.asyncio
+async def test_lean_build_replacement_keeps_pool_size(tmp_path, monkeypatch):
+    monkeypatch.setenv("LEAN_LSP_POOL_SIZE", "2")
+    project = (tmp_path / "proj").resolve()
+    project.mkdir()
+    lib = project / ".lake" / "build" / "lib"
+
+    mock_ctx = MagicMock()
+    mock_ctx.request_context.lifespan_context.client = None
+    mock_ctx.request_context.lifespan_context.client_registry = None
+    mock_ctx.report_progress = AsyncMock()
+
+    async def mock_readline():
+        if not lib.exists():
+            lib.mkdir(parents=True)
+            (lib / "Proj.olean").write_bytes(b"olean")
+        return b""
+
+    mock_process = MagicMock()
+    mock_process.returncode = 0
+    mock_process.wait = AsyncMock()
+    mock_process.stdout.readline = mock_readline
+
+    with (
+        patch(
+            "lean_lsp_mcp.server.asyncio.create_subprocess_exec",
+            AsyncMock(return_value=mock_process),
+        ),
+        patch("lean_lsp_mcp.client_utils.LeanLSPClient") as client_cls,
+        patch("lean_lsp_mcp.server.subprocess.run"),
+    ):
+        await lsp_build(mock_ctx, lean_project_path=str(project))
+
+    client = mock_ctx.request_context.lifespan_context.client
+    assert isinstance(client, LeanWorkerPool)
+    assert client.size == 2
+    assert client_cls.call_count == 2
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from lean_lsp_mcp.build_utils import (
+    BuildOutput,
+    BuildState,
+    build_targets,
+    changed_oleans,
+    format_duration,
+    import_stamps,
+    lean_libs,
+    module_name,
+    olean_snapshot,
+    parse_build_timings,
+    parse_job_line,
+    project_modules,
+    read_imports,
+)
+
+
+def _project(root: Path) -> Path:
+    (root / "lean-toolchain").write_text("leanprover/lean4:v4.20.0\n")
+    (root / "lake-manifest.json").write_text('{"packages": []}\n')
+    return root
+
+
+@pytest.mark.parametrize("cache_dir", ["dir", "none"])
+def test_cache_get_is_skipped_until_manifest_changes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, cache_dir: str
+) -> None:
+    monkeypatch.setenv(
+        "LEAN_LSP_CACHE_DIR", str(tmp_path / "cache") if cache_dir == "dir" else "none"
+    )
+    (tmp_path / "proj").mkdir()
+    root = _project(tmp_path / "proj")
+    assert BuildState.for_project(root).needs_cache_get()
+
+    BuildState.for_project(root).record_cache_get()
+    assert not BuildState.for_project(root).needs_cache_get()
+
+    (root / "lake-manifest.json").write_text('{"packages": [{"name": "mathlib"}]}\n')
+    assert BuildState.for_project(root).needs_cache_get()
+
+
+def test_olean_snapshot_detects_rebuilt_modules(tmp_path: Path) -> None:
+    lib = tmp_path / ".lake" / "build" / "lib" / "Proj"
+    dep = tmp_path / ".lake" / "packages" / "dep" / ".lake" / "build" / "lib"
+    lib.mkdir(parents=True)
+    dep.mkdir(parents=True)
+    (lib / "A.olean").write_bytes(b"a")
+    (lib / "A.ilean").write_bytes(b"a")
+    (dep / "Dep.olean").write_bytes(b"d")
+
+    before = olean_snapshot(tmp_path)
+    assert sorted(Path(p).name for p in before) == ["A.olean", "Dep.olean"]
+    assert changed_oleans(before, olean_snapshot(tmp_path)) == []
+
+    stat = os.stat(lib / "A.olean")
+    (lib / "A.olean").write_bytes(b"a2")
+    os.utime(lib / "A.olean", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    (lib / "B.olean").write_bytes(b"b")
+    assert changed_oleans(before, olean_snapshot(tmp_path)) == [
+        str(lib / "A.olean"),
+        str(lib / "B.olean"),
+    ]
+
+
+def _write(root: Path, module: str, imports: list[str]) -> None:
+    path = root / (module.replace(".", "/") + ".lean")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    header = "".join(f"import {m}\n" for m in imports)
+    path.write_text(f"{header}\ndef x := 1\nimport NotAnImport\n")
+
+
+def test_read_imports(tmp_path: Path) -> None:
+    path = tmp_path / "A.lean"
+    path.write_text(
+        "/- Copyright\n  notice -/\nmodule\n\n-- comment\n"
+        "import Mathlib.Data.Nat  -- trailing\npublic import B C\nimport all D\n"
+        "\nnamespace A\nimport E\n"
+    )
+    assert read_imports(path) == ["Mathlib.Data.Nat", "B", "C", "D"]
+    assert read_imports(tmp_path / "missing.lean") == []
+
+
+_LAKEFILE = """import Lake
+open Lake DSL
+
+package «proj» where
+  -- comment
+
+@[default_target]
+lean_lib «Proj» where
+  leanOptions := #[⟨`autoImplicit, false⟩]
+
+lean_lib Extra where
+  srcDir := "extra"
+  roots := #[`Extra]
+  globs := #[.submodules `Extra.Tactics, `Extra.Main]
+
+lean_exe main where
+  root := `Main
+"""
+
+
+def test_build_targets_cover_module_and_dependents(tmp_path: Path) -> None:
+    _write(tmp_path, "Proj.Basic", ["Mathlib"])
+    _write(tmp_path, "Proj.Lemmas", ["Proj.Basic"])
+    _write(tmp_path, "Proj.Main", ["Proj.Lemmas", "Proj.Basic"])
+    _write(tmp_path, "Proj.Other", ["Proj.Basic"])
+    _write(tmp_path, "Proj.Unrelated", ["Mathlib"])
+    _write(tmp_path, ".lake/packages/dep/Dep", ["Proj.Basic"])
+    (tmp_path / "lakefile.lean").write_text(_LAKEFILE)
+
+    assert build_targets(tmp_path, "Proj.Basic") == ["Proj.Main", "Proj.Other"]
+    assert build_targets(tmp_path, "Proj.Main") == ["Proj.Main"]
+    assert build_targets(tmp_path, "Mathlib") == [
+        "Proj.Main",
+        "Proj.Other",
+        "Proj.Unrelated",
+    ]
+
+
+def test_import_stamps_follow_project_imports(tmp_path: Path) -> None:
+    (tmp_path / "lakefile.lean").write_text(_LAKEFILE)
+    _write(tmp_path, "Proj.Basic", ["Mathlib"])
+    _write(tmp_path, "Proj.Lemmas", ["Proj.Basic"])
+    _write(tmp_path, "Proj.Other", [])
+    olean = tmp_path / ".lake/build/lib/lean/Proj/Basic.olean"
+    olean.parent.mkdir(parents=True)
+    olean.write_bytes(b"v1")
+
+    stamps = import_stamps(tmp_path, ["Proj.Lemmas", "Mathlib.Data.Nat"])
+    stat = olean.stat()
+    assert stamps == (
+        ("Proj.Basic", stat.st_mtime_ns, stat.st_size),
+        ("Proj.Lemmas", None, None),
+    )
+
+    olean.write_bytes(b"rebuilt")
+    assert import_stamps(tmp_path, ["Proj.Lemmas"]) != stamps
+    assert import_stamps(tmp_path, ["Mathlib"]) == ()
+
+
+def test_build_targets_follow_lakefile_libraries(tmp_path: Path) -> None:
+    (tmp_path / "lakefile.lean").write_text(_LAKEFILE)
+    _write(tmp_path, "Proj.Basic", [])
+    _write(tmp_path / "extra", "Extra.Tactics.Simp", ["Proj.Basic"])
+    _write(tmp_path / "extra", "Extra.Main", ["Extra.Tactics.Simp"])
+    # Outside every lib: an executable root and a scratch file
+    _write(tmp_path, "Main", ["Proj.Basic"])
+    _write(tmp_path, "Scratch.Test", ["Extra.Main"])
+
+    assert sorted(project_modules(tmp_path)) == [
+        "Extra.Main",
+        "Extra.Tactics.Simp",
+        "Proj.Basic",
+    ]
+    assert build_targets(tmp_path, "Proj.Basic") == ["Extra.Main"]
+    assert (
+        module_name(tmp_path, "extra/Extra/Tactics/Simp.lean") == "Extra.Tactics.Simp"
+    )
+    # No library builds it: only a full build does
+    assert build_targets(tmp_path, module_name(tmp_path, "Scratch/Test.lean")) == []
+    assert build_targets(tmp_path, "Main") == []
+
+
+def test_lean_libs_from_lakefile_toml(tmp_path: Path) -> None:
+    (tmp_path / "lakefile.toml").write_text(
+        'name = "proj"\nsrcDir = "src"\n\n[[lean_lib]]\nname = "Proj"\n\n'
+        '[[lean_lib]]\nname = "Extra"\nroots = ["Extra"]\nglobs = ["Extra.+", "Other"]\n'
+    )
+    libs = {lib.name: lib for lib in lean_libs(tmp_path)}
+    assert libs["Proj"].src_dir == tmp_path / "src" / "."
+    assert libs["Proj"].contains("Proj.Basic")
+    assert not libs["Proj"].contains("Project")
+    assert libs["Extra"].globs == [("submodules", "Extra"), ("one", "Other")]
+    assert libs["Extra"].contains("Other")
+    assert not libs["Extra"].contains("Other.Sub")
+
+
+def test_module_name(tmp_path: Path) -> None:
+    assert module_name(tmp_path, "Proj.Basic") == "Proj.Basic"
+    assert module_name(tmp_path, str(tmp_path / "Proj" / "Basic.lean")) == "Proj.Basic"
+    assert module_name(tmp_path, "Proj/Basic.lean") == "Proj.Basic"
+    assert module_name(tmp_path / "sub", str(tmp_path / "Other.lean")) is None
+
+
+def test_parse_build_timings() -> None:
+    lines = [
+        "✔ [1/8] Ran test:extraDep",
+        "ℹ [2/8] Built TestProject.Basic (1.6s)",
+        "ℹ [3/8] Built TestProject (412ms)",
+        "ℹ [5/8] Built Main:c.o (with exports) (1.3s)",
+        "Build completed successfully (8 jobs).",
+    ]
+    assert parse_build_timings(lines) == [
+        {"target": "TestProject.Basic", "seconds": 1.6},
+        {"target": "Main:c.o", "seconds": 1.3},
+        {"target": "TestProject", "seconds": 0.412},
+    ]
+
+
+def test_build_output_keeps_all_lines_by_default() -> None:
+    output = BuildOutput()
+    for i in range(100):
+        output.add(f"line {i}")
+    assert len(output.lines) == 100
+    assert output.text().startswith("line 0\nline 1")
+
+
+def test_streamed_build_output_is_bounded_and_logged(tmp_path: Path) -> None:
+    log = tmp_path / "build.log"
+    log.write_text("previous build\n")
+
+    output = BuildOutput(log, tail=3, max_issues=2)
+    output.add("✖ [2/9] Building Proj.Bad")
+    output.add("error: ./Proj/Bad.lean:3:8: unknown identifier 'x'")
+    output.add("warning: ./Proj/Ok.lean:1:8: declaration uses 'sorry'")
+    output.add("⚠ [3/9] Built Proj.Ok (2.5s)")
+    for i in range(1000):
+        output.add(f"ℹ [{i}/1000] Built Proj.M{i} ({i}ms)")
+    output.add("error: build failed")
+    output.close()
+
+    summary = output.summary(slowest=2)
+    assert summary["lines"] == 1005
+    assert summary["tail"] == [
+        "ℹ [998/1000] Built Proj.M998 (998ms)",
+        "ℹ [999/1000] Built Proj.M999 (999ms)",
+        "error: build failed",
+    ]
+    assert summary["errors"] == [
+        "✖ [2/9] Building Proj.Bad",
+        "error: ./Proj/Bad.lean:3:8: unknown identifier 'x'",
+    ]
+    assert summary["warnings"] == [
+        "warning: ./Proj/Ok.lean:1:8: declaration uses 'sorry'",
+        "⚠ [3/9] Built Proj.Ok (2.5s)",
+    ]
+    assert summary["omitted_issues"] == 1
+    assert summary["slowest"] == [
+        {"target": "Proj.Ok", "seconds": 2.5},
+        {"target": "Proj.M999", "seconds": 0.999},
+    ]
+    assert summary["log_file"] == str(log)
+    assert len(log.read_text().splitlines()) == 1005
+    assert (tmp_path / "build.log.1").read_text() == "previous build\n"
+
+
+def test_parse_job_line() -> None:
+    assert parse_job_line("ℹ [2/8] Built Proj.Basic (1.6s)") == (
+        "Proj.Basic",
+        "built",
+        1.6,
+    )
+    assert parse_job_line("✖ [3/8] Building Proj.Bad") == ("Proj.Bad", "failed", None)
+    assert parse_job_line("✔ [4/8] Replayed Proj.Ok") == ("Proj.Ok", "built", None)
+    assert parse_job_line("ℹ [5/8] Built Main:c.o (with exports) (1.3s)") is None
+    assert parse_job_line("✔ [0/8] Ran job computation") is None
+
+
+def test_build_state_records_modules_and_answers_queries(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", str(tmp_path / "cache"))
+    root = tmp_path / "proj"
+    _write(root, "Proj.Basic", ["Mathlib"])
+    (root / "lakefile.lean").write_text(_LAKEFILE)
+    _write(root, "Proj.Lemmas", ["Proj.Basic"])
+    _write(root, "Proj.Main", ["Proj.Lemmas"])
+    _write(root, "Proj.New", [])
+
+    output = BuildOutput()
+    for line in [
+        "ℹ [1/4] Built Proj.Basic (12.5s)",
+        "ℹ [2/4] Built Proj.Lemmas (800ms)",
+        "✖ [3/4] Building Proj.Main",
+        "error: ./Proj/Main.lean:1:0: unknown identifier",
+    ]:
+        output.add(line)
+    BuildState.for_project(root).record_build(output.modules, output.jobs, 20.0, 1, [])
+
+    state = BuildState.for_project(root)
+    assert [m["module"] for m in state.slowest()] == ["Proj.Basic", "Proj.Lemmas"]
+    assert state.slowest(1)[0]["seconds"] == 12.5
+    assert state.failed() == ["Proj.Main"]
+    assert state.stale() == [
+        {"module": "Proj.Main", "reason": "failed"},
+        {"module": "Proj.New", "reason": "not built"},
+    ]
+    assert state.eta(2, 4) == pytest.approx(10.0)
+    assert state.eta(2, None) is None
+
+    # Editing a module makes it and its importers stale
+    basic = root / "Proj" / "Basic.lean"
+    basic.write_text(basic.read_text() + "def y := 2\n")
+    assert [
+        s for s in state.stale() if s["module"] in ("Proj.Basic", "Proj.Lemmas")
+    ] == [
+        {"module": "Proj.Basic", "reason": "source changed"},
+        {"module": "Proj.Lemmas", "reason": "imports Proj.Basic"},
+    ]
+
+
+def test_stale_uses_oleans_of_unrecorded_modules(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    (tmp_path / "lakefile.lean").write_text(_LAKEFILE)
+    _write(tmp_path, "Proj.Basic", [])
+    olean = tmp_path / ".lake" / "build" / "lib" / "Proj" / "Basic.olean"
+    olean.parent.mkdir(parents=True)
+    olean.write_bytes(b"olean")
+    source = tmp_path / "Proj" / "Basic.lean"
+    os.utime(source, ns=(0, olean.stat().st_mtime_ns - 10**9))
+    assert BuildState.for_project(tmp_path).stale() == []
+
+
+def test_format_duration() -> None:
+    assert format_duration(42.4) == "42s"
+    assert format_duration(125) == "2m 05s"
+    assert format_duration(3 * 3600 + 120) == "3h 02m"
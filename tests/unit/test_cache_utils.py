@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import os
+import types
+from pathlib import Path
+
+import pytest
+
+from lean_lsp_mcp import cache_utils
+from lean_lsp_mcp.build_utils import import_stamps, read_imports
+from lean_lsp_mcp.cache_utils import (
+    DiagnosticsCache,
+    OutlineCache,
+    content_key,
+    diagnostics_complete,
+    get_cache_dir,
+    project_fingerprint,
+)
+
+
+def test_project_fingerprint_tracks_toolchain_and_manifest(tmp_path: Path) -> None:
+    (tmp_path / "lean-toolchain").write_text("leanprover/lean4:v4.20.0\n")
+    first = project_fingerprint(tmp_path)
+    assert project_fingerprint(tmp_path) == first
+
+    (tmp_path / "lake-manifest.json").write_text("{}")
+    second = project_fingerprint(tmp_path)
+    (tmp_path / "lean-toolchain").write_text("leanprover/lean4:v4.21.0\n")
+
+    assert len({first, second, project_fingerprint(tmp_path)}) == 3
+
+
+def test_content_key_normalizes_newlines() -> None:
+    assert content_key("fp", "A.lean", "a\r\nb") == content_key("fp", "A.lean", "a\nb")
+    assert content_key("fp", "A.lean", "a") != content_key("fp", "B.lean", "a")
+
+
+def test_get_cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", str(tmp_path))
+    assert get_cache_dir() == tmp_path
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    assert get_cache_dir() is None
+
+
+def test_diagnostics_cache_lru() -> None:
+    cache = DiagnosticsCache(max_entries=2)
+    cache.put("fp", "a", ["a"])
+    cache.put("fp", "b", [])
+    assert cache.get("fp", "a") == ["a"]
+
+    cache.put("fp", "c", ["c"])
+
+    assert cache.get("fp", "b") is None
+    assert cache.get("fp", "a") == ["a"]
+    assert cache.get("fp", "c") == ["c"]
+
+
+def test_diagnostics_cache_disk_tier(tmp_path: Path) -> None:
+    DiagnosticsCache(max_entries=0, disk_dir=tmp_path).put("fp", "key", ["msg"])
+
+    fresh = DiagnosticsCache(max_entries=4, disk_dir=tmp_path)
+    assert fresh.get("fp", "key") == ["msg"]
+    assert len(fresh) == 1
+
+    fresh.invalidate("fp")
+    assert fresh.get("fp", "key") is None
+    assert DiagnosticsCache(disk_dir=tmp_path).get("fp", "key") is None
+
+
+def test_diagnostics_cache_from_env(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("LEAN_LSP_DIAGNOSTICS_CACHE_SIZE", "0")
+    monkeypatch.delenv("LEAN_LSP_DIAGNOSTICS_DISK_CACHE", raising=False)
+    assert not DiagnosticsCache.from_env().enabled
+
+    monkeypatch.setenv("LEAN_LSP_DIAGNOSTICS_DISK_CACHE", "true")
+    assert DiagnosticsCache.from_env().disk_dir == tmp_path / "diagnostics"
+
+
+def test_diagnostics_complete() -> None:
+    def state(complete: bool, error=None):
+        return types.SimpleNamespace(complete=complete, error=error)
+
+    client = types.SimpleNamespace(
+        opened_files={
+            "A.lean": state(True),
+            "B.lean": state(False),
+            "C.lean": state(True, {"message": "rpc"}),
+        }
+    )
+
+    assert diagnostics_complete(client, "A.lean")
+    assert not diagnostics_complete(client, "B.lean")
+    assert not diagnostics_complete(client, "C.lean")
+    assert not diagnostics_complete(client, "D.lean")
+
+
+def test_outline_cache_uses_mtime_then_hash(tmp_path: Path) -> None:
+    project = tmp_path / "project"
+    project.mkdir()
+    source = project / "A.lean"
+    source.write_text("def a := 1\n", encoding="utf-8")
+    cache = OutlineCache(tmp_path / "cache")
+
+    assert cache.get(project, "A.lean") is None
+    cache.put(project, "A.lean", "def a := 1\n", "## Declarations\n[Def: L1] a\n")
+    assert cache.get(project, "A.lean") == "## Declarations\n[Def: L1] a\n"
+
+    # Same content with a new mtime is still a hit
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.get(project, "A.lean") == "## Declarations\n[Def: L1] a\n"
+
+    source.write_text("def b := 1\n", encoding="utf-8")
+    assert cache.get(project, "A.lean") is None
+
+    cache.invalidate(project)
+    source.write_text("def a := 1\n", encoding="utf-8")
+    assert cache.get(project, "A.lean") is None
+
+
+def test_outline_cache_disabled(tmp_path: Path) -> None:
+    (tmp_path / "A.lean").write_text("def a := 1\n", encoding="utf-8")
+    cache = OutlineCache(None)
+    cache.put(tmp_path, "A.lean", "def a := 1\n", "outline")
+    assert cache.get(tmp_path, "A.lean") is None
+
+
+def test_file_key_is_memoized_per_stamp(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "A.lean").write_text("def a := 1\n")
+    cache = DiagnosticsCache()
+    fingerprint, key = cache.file_key(tmp_path, "A.lean", stamp=(0, 1))
+    assert key == content_key(fingerprint, "A.lean", "def a := 1\n")
+
+    # Same stamp: the file is not read again
+    monkeypatch.setattr(cache_utils, "get_file_contents", pytest.fail)
+    assert cache.file_key(tmp_path, "A.lean", stamp=(0, 1)) == (fingerprint, key)
+    with pytest.raises(pytest.fail.Exception):
+        cache.file_key(tmp_path, "A.lean", stamp=(0, 2))
+
+
+def test_file_key_changes_when_an_imported_module_is_rebuilt(tmp_path: Path) -> None:
+    (tmp_path / "lakefile.toml").write_text(
+        'name = "proj"\n[[lean_lib]]\nname = "Proj"\n'
+    )
+    (tmp_path / "Proj").mkdir()
+    (tmp_path / "Proj" / "Basic.lean").write_text("def b := 1\n")
+    (tmp_path / "A.lean").write_text("import Proj.Basic\ndef a := b\n")
+    olean = tmp_path / ".lake/build/lib/lean/Proj/Basic.olean"
+    olean.parent.mkdir(parents=True)
+    olean.write_bytes(b"v1")
+
+    def key() -> tuple[str, str]:
+        imports = import_stamps(tmp_path, read_imports(tmp_path / "A.lean"))
+        return cache.file_key(tmp_path, "A.lean", stamp=(0, 1), imports=imports)
+
+    cache = DiagnosticsCache()
+    before = key()
+    assert key() == before
+
+    # Rebuilt outside lean_build: same source stamp, different key
+    olean.write_bytes(b"rebuilt")
+    assert key() != before
@@ -2,12 +2,21 @@ from __future__ import annotations
 
 from __future__ import annotations
 
+import sys
+import time
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pytest
 
+from lean_lsp_mcp import client_utils, watch_utils
 from lean_lsp_mcp.client_utils import (
+    ClientRegistry,
+    LeanWorkerPool,
+    get_file_client,
+    get_pool_size,
+    infer_project_path,
+    lock_file,
     setup_client_for_file,
     startup_client,
     valid_lean_project_path,
@@ -18,10 +27,29 @@ class _MockLeanClient:
     def __init__(self, project_path: Path) -> None:
         self.project_path = project_path
         self.closed = False
+        self.opened: list[str] = []
+        self.closed_files: list[str] = []
 
     def close(self) -> None:
         self.closed = True
 
+    def open_file(self, path: str) -> None:
+        self.opened.append(path)
+
+    def get_file_content(self, path: str) -> str:
+        return f"content of {path}"
+
+    def close_files(self, paths: list[str], blocking: bool = True) -> None:
+        self.closed_files.extend(paths)
+
+
+def _wait_closed(client: _MockLeanClient, timeout: float = 5.0) -> bool:
+    """Evicted clients are closed by a background thread."""
+    deadline = time.monotonic() + timeout
+    while not client.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return client.closed
+
 
 class _LifespanContext:
     def __init__(
@@ -75,17 +103,23 @@ def test_startup_client_reuses_existing(
     startup_client(ctx)
     assert not first.closed
 
-    # change project path triggers close and replacement
+    # change project path starts a new client, the old one stays warm
     new_project = tmp_path / "proj2"
     new_project.mkdir()
     (new_project / "lean-toolchain").write_text("leanprover/lean4:v4.24.0\n")
     ctx.request_context.lifespan_context.lean_project_path = new_project
 
     startup_client(ctx)
-    assert first.closed
+    assert not first.closed
     assert ctx.request_context.lifespan_context.client.project_path == new_project
     assert len(patched_clients) == 2
 
+    # switching back reuses the first client
+    ctx.request_context.lifespan_context.lean_project_path = project
+    startup_client(ctx)
+    assert ctx.request_context.lifespan_context.client is first
+    assert len(patched_clients) == 2
+
 
 def test_valid_lean_project_path(tmp_path: Path) -> None:
     project = tmp_path / "proj"
@@ -115,6 +149,48 @@ def test_setup_client_for_file_discovers_project(
     assert len(patched_clients) == 1
 
 
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is Linux only"
+)
+def test_infer_project_path_follows_watcher_events(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(watch_utils, "_WATCHERS", {})
+    monkeypatch.setenv("LEAN_LSP_WATCH", "auto")
+    project = tmp_path / "proj"
+    lean_file = project / "Sub" / "Example.lean"
+    lean_file.parent.mkdir(parents=True)
+    lean_file.write_text("example")
+    (project / "Other.lean").write_text("example")
+    (project / "lean-toolchain").write_text("leanprover/lean4:v4.24.0\n")
+    ctx = _Context(_LifespanContext(None, None))
+
+    assert infer_project_path(ctx, str(lean_file)) == project
+    watcher = watch_utils.get_watcher(project)
+    try:
+        assert watcher.wait_ready(5)
+        assert infer_project_path(ctx, str(lean_file)) == project
+
+        # Cached: no lean-toolchain lookups while nothing changed
+        checks = []
+        original = client_utils.valid_lean_project_path
+        monkeypatch.setattr(
+            client_utils,
+            "valid_lean_project_path",
+            lambda p: checks.append(p) or original(p),
+        )
+        assert infer_project_path(ctx, str(lean_file)) == project
+        assert infer_project_path(ctx, str(project / "Other.lean")) == project
+        assert checks == []
+
+        # A moved lean-toolchain is reported by the watcher
+        (project / "lean-toolchain").rename(tmp_path / "lean-toolchain")
+        watcher.sync()
+        assert infer_project_path(ctx, str(lean_file)) == tmp_path
+    finally:
+        watcher.stop()
+
+
 def test_setup_client_for_file_reuses_client_for_same_project(
     tmp_path: Path, patched_clients: list[_MockLeanClient]
 ) -> None:
@@ -149,7 +225,7 @@ def test_setup_client_for_file_reuses_client_for_same_project(
 def test_setup_client_for_file_switches_projects(
     tmp_path: Path, patched_clients: list[_MockLeanClient]
 ) -> None:
-    """Verify that switching to a different project closes old client and creates new one."""
+    """Verify that switching projects starts a new client and keeps the old one warm."""
     project1 = tmp_path / "proj1"
     project1.mkdir()
     (project1 / "lean-toolchain").write_text("leanprover/lean4:v4.24.0\n")
@@ -175,12 +251,17 @@ def test_setup_client_for_file_switches_projects(
     assert rel_path2 == "File2.lean"
     second_client = ctx.request_context.lifespan_context.client
 
-    # Old client should be closed, new one created
-    assert first_client.closed
+    # Old client stays alive in the registry, new one created
+    assert not first_client.closed
     assert second_client is not first_client
     assert len(patched_clients) == 2
     assert ctx.request_context.lifespan_context.lean_project_path == project2
 
+    # Switching back does not restart the first project
+    setup_client_for_file(ctx, str(file1))
+    assert ctx.request_context.lifespan_context.client is first_client
+    assert len(patched_clients) == 2
+
 
 def test_startup_client_serializes_concurrent_calls(
     tmp_path: Path, patched_clients: list[_MockLeanClient]
@@ -201,3 +282,240 @@ def test_startup_client_serializes_concurrent_calls(
 
     assert len(patched_clients) == 1
     assert ctx.request_context.lifespan_context.client is patched_clients[0]
+
+
+def test_get_pool_size(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("LEAN_LSP_POOL_SIZE", raising=False)
+    assert get_pool_size() == 1
+    monkeypatch.setenv("LEAN_LSP_POOL_SIZE", "3")
+    assert get_pool_size() == 3
+    monkeypatch.setenv("LEAN_LSP_POOL_SIZE", "0")
+    assert get_pool_size() == 1
+    monkeypatch.setenv("LEAN_LSP_POOL_SIZE", "many")
+    assert get_pool_size() == 1
+
+
+def test_startup_client_creates_pool(
+    tmp_path: Path,
+    patched_clients: list[_MockLeanClient],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("LEAN_LSP_POOL_SIZE", "3")
+    project = tmp_path / "proj"
+    project.mkdir()
+    (project / "lean-toolchain").write_text("leanprover/lean4:v4.24.0\n")
+
+    ctx = _Context(_LifespanContext(project, None))
+    startup_client(ctx)
+
+    pool = ctx.request_context.lifespan_context.client
+    assert isinstance(pool, LeanWorkerPool)
+    assert pool.size == 3
+    assert pool.project_path == project.resolve()
+    assert len(patched_clients) == 3
+
+    pool.close()
+    assert all(c.closed for c in patched_clients)
+
+
+def test_worker_pool_pins_files_and_spreads_load(
+    tmp_path: Path, patched_clients: list[_MockLeanClient]
+) -> None:
+    pool = LeanWorkerPool(tmp_path, 2)
+    first, second = patched_clients
+
+    pool.open_file("A.lean")
+    pool.open_file("B.lean")
+    pool.open_file("A.lean")
+
+    # Unrelated files land on different workers, repeated files stay pinned
+    assert first.opened == ["A.lean", "A.lean"]
+    assert second.opened == ["B.lean"]
+    assert pool.get_file_content("B.lean") == "content of B.lean"
+    assert pool.worker_for("A.lean") is first
+
+    pool.close_files(["A.lean", "B.lean"])
+    assert first.closed_files == ["A.lean"]
+    assert second.closed_files == ["B.lean"]
+
+    with pytest.raises(FileNotFoundError):
+        pool.close_files(["A.lean"])
+
+
+def test_worker_pool_bounds_pins(
+    tmp_path: Path, patched_clients: list[_MockLeanClient]
+) -> None:
+    pool = LeanWorkerPool(tmp_path, 1)
+    worker = pool._workers[0]
+    worker.max_pins = 2
+
+    for path in ["A.lean", "B.lean", "A.lean", "C.lean"]:
+        pool.open_file(path)
+    # B.lean was used least recently, its pin is dropped like the client closes it
+    assert list(pool._pins) == ["A.lean", "C.lean"]
+    assert list(worker.pinned) == ["A.lean", "C.lean"]
+
+    pool.close()
+    assert not pool._pins
+    assert not worker.pinned
+
+
+def test_worker_pool_prefers_idle_worker(
+    tmp_path: Path, patched_clients: list[_MockLeanClient]
+) -> None:
+    pool = LeanWorkerPool(tmp_path, 2)
+    first, second = patched_clients
+
+    busy = pool._acquire("Busy.lean")
+    try:
+        # Worker with a running request is skipped for a new file
+        assert pool.worker_for("Other.lean") is second
+    finally:
+        pool._release(busy)
+    assert busy.client is first
+
+
+def test_client_registry_evicts_least_recently_used(tmp_path: Path) -> None:
+    registry = ClientRegistry(max_projects=2)
+    a, b, c = (_MockLeanClient(tmp_path / name) for name in "abc")
+
+    registry.add(a.project_path, a)
+    registry.add(b.project_path, b)
+    assert registry.get(a.project_path) is a  # a is now most recently used
+
+    registry.add(c.project_path, c)
+    assert _wait_closed(b)
+    assert not a.closed and not c.closed
+    assert b.project_path not in registry
+    assert len(registry) == 2
+
+    registry.close_all()
+    assert a.closed and c.closed
+    assert len(registry) == 0
+
+
+def test_client_registry_memory_budget(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(client_utils, "client_memory", lambda client: 600)
+    registry = ClientRegistry(max_projects=5, memory_budget=1000)
+    a, b = (_MockLeanClient(tmp_path / name) for name in "ab")
+
+    registry.add(a.project_path, a)
+    assert not a.closed
+
+    registry.add(b.project_path, b)
+    assert _wait_closed(a)
+    assert registry.get(b.project_path) is b
+
+
+def test_client_registry_memory_budget_unmeasurable(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(client_utils, "client_memory", lambda client: 0)
+    registry = ClientRegistry(max_projects=5, memory_budget=1000)
+    a, b, c = (_MockLeanClient(tmp_path / name) for name in "abc")
+
+    for client in (a, b, c):
+        registry.add(client.project_path, client)
+
+    # Nothing is evicted blindly; the missing measurement is reported once
+    assert len(registry) == 3
+    assert registry._budget_warned
+
+
+def test_client_registry_eviction_waits_for_running_tool(tmp_path: Path) -> None:
+    registry = ClientRegistry(max_projects=1)
+    a, b = (_MockLeanClient(tmp_path / name) for name in "ab")
+    registry.add(a.project_path, a)
+
+    # A tool got ``a`` and is mid-request when another project evicts it
+    with lock_file(a, "A.lean"):
+        registry.add(b.project_path, b)
+        assert a.project_path not in registry
+        time.sleep(0.05)
+        assert not a.closed
+
+    assert _wait_closed(a)
+    assert not b.closed
+
+
+def test_client_registry_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("LEAN_LSP_MAX_PROJECTS", "4")
+    monkeypatch.setenv("LEAN_LSP_MEMORY_BUDGET_MB", "2")
+    registry = ClientRegistry.from_env()
+    assert registry.max_projects == 4
+    assert registry.memory_budget == 2 * 1024 * 1024
+
+    monkeypatch.delenv("LEAN_LSP_MEMORY_BUDGET_MB")
+    assert ClientRegistry.from_env().memory_budget is None
+
+
+def test_get_file_client_returns_matching_client(
+    tmp_path: Path, patched_clients: list[_MockLeanClient]
+) -> None:
+    project = tmp_path / "proj"
+    project.mkdir()
+    (project / "lean-toolchain").write_text("leanprover/lean4:v4.24.0\n")
+    lean_file = project / "Example.lean"
+    lean_file.write_text("example")
+
+    ctx = _Context(_LifespanContext(None, None))
+
+    client, rel_path = get_file_client(ctx, str(lean_file))
+    assert client is patched_clients[0]
+    assert rel_path == "Example.lean"
+    assert get_file_client(ctx, str(tmp_path / "missing.lean")) is None
+
+
+def test_lock_file_serializes_single_client(tmp_path: Path) -> None:
+    client = _MockLeanClient(tmp_path)
+    active: list[int] = []
+    overlaps: list[int] = []
+
+    def _work() -> None:
+        with lock_file(client, "A.lean"):
+            active.append(1)
+            overlaps.append(len(active))
+            active.pop()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: _work(), range(20)))
+
+    assert overlaps == [1] * 20
+
+
+def test_lock_file_pool_only_blocks_pinned_worker(
+    tmp_path: Path, patched_clients: list[_MockLeanClient]
+) -> None:
+    pool = LeanWorkerPool(tmp_path, 2)
+
+    with lock_file(pool, "A.lean"):
+        # Another thread can use a file on the other worker meanwhile
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            content = executor.submit(pool.get_file_content, "B.lean").result(timeout=5)
+    assert content == "content of B.lean"
+
+
+def test_swap_client_replaces_without_gap(tmp_path: Path) -> None:
+    project = tmp_path / "proj"
+    other = tmp_path / "other"
+    old = _MockLeanClient(project)
+    other_client = _MockLeanClient(other)
+    new = _MockLeanClient(project)
+    lifespan = _LifespanContext(other, other_client)
+    registry = client_utils.get_client_registry(lifespan)
+    registry.add(project, old)
+
+    # A tool is still using the old client: it is closed only afterwards
+    with lock_file(old, "A.lean"):
+        client_utils.swap_client(lifespan, project, new)
+        assert registry.get(project) is new
+        assert lifespan.client is new
+        time.sleep(0.05)
+        assert not old.closed
+
+    assert _wait_closed(old)
+    assert not new.closed
+    # The previously active project stays warm
+    assert registry.get(other) is other_client and not other_client.closed
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import orjson
+import pytest
+
+from lean_lsp_mcp import http_utils
+from lean_lsp_mcp.http_utils import (
+    RateLimitExceeded,
+    ResponseCache,
+    cached_fetch,
+    normalize_query,
+    upstream_guard,
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server = self.server
+        server.requests.append(self.path)
+        time.sleep(server.delay)
+        server.peers.add(self.client_address)
+        body = orjson.dumps({"hits": [{"name": self.path}]})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def stub_server() -> Iterator[ThreadingHTTPServer]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.requests = []
+    server.delay = 0.0
+    server.peers = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_http(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setattr(http_utils, "RESPONSE_CACHE", ResponseCache())
+    http_utils.close_http_client()
+    yield
+    http_utils.close_http_client()
+
+
+def _search(server: ThreadingHTTPServer, query: str, num_results: int = 5):
+    url = f"http://127.0.0.1:{server.server_address[1]}/json"
+
+    def fetch(http):
+        response = http.get(url, params={"q": query})
+        response.raise_for_status()
+        return orjson.loads(response.content)["hits"][:num_results]
+
+    return cached_fetch(url, query, num_results, fetch)
+
+
+def test_cached_fetch_reuses_responses_and_connections(
+    stub_server: ThreadingHTTPServer,
+) -> None:
+    first = _search(stub_server, "Real.sin")
+    first[0]["name"] = "mutated by the caller"
+    assert _search(stub_server, "  Real.sin ") == [{"name": "/json?q=Real.sin"}]
+    assert len(stub_server.requests) == 1
+
+    # Different result counts and queries are separate entries
+    _search(stub_server, "Real.sin", num_results=3)
+    _search(stub_server, "Real.cos")
+    assert len(stub_server.requests) == 3
+    # All requests went through one kept-alive connection
+    assert len(stub_server.peers) == 1
+
+
+def test_errors_are_not_cached(stub_server: ThreadingHTTPServer) -> None:
+    url = f"http://127.0.0.1:{stub_server.server_address[1]}/missing"
+    calls = []
+
+    def fetch(http):
+        calls.append(1)
+        raise RuntimeError("upstream down")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cached_fetch(url, "q", 1, fetch)
+    assert len(calls) == 2
+
+
+def test_response_cache_ttl_and_lru(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(http_utils.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(max_entries=2, ttl=10)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1]
+    cache.put("c", [3])
+    assert cache.get("b") is None  # Least recently used
+    assert cache.get("a") == [1]
+
+    now[0] += 11
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+    disabled = ResponseCache(max_entries=0)
+    disabled.put("a", [1])
+    assert disabled.get("a") is None
+
+
+def test_normalize_query() -> None:
+    assert normalize_query("  Nat.add \n  _ ") == "Nat.add _"
+    assert normalize_query("Nat") != normalize_query("nat")
+
+
+def test_identical_requests_in_flight_are_coalesced(
+    stub_server: ThreadingHTTPServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(http_utils, "RESPONSE_CACHE", ResponseCache(max_entries=0))
+    stub_server.delay = 0.3
+    checks = []
+
+    def search(query: str):
+        with upstream_guard(lambda: checks.append(query)):
+            return _search(stub_server, query)
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(search, ["Nat"] * 4 + ["Int"] * 2))
+
+    assert results == [[{"name": "/json?q=Nat"}]] * 4 + [[{"name": "/json?q=Int"}]] * 2
+    assert sorted(stub_server.requests) == ["/json?q=Int", "/json?q=Nat"]
+    # Only the callers that reached the server were charged
+    assert sorted(checks) == ["Int", "Nat"]
+
+
+def test_guard_rejection_is_not_shared(stub_server: ThreadingHTTPServer) -> None:
+    def refuse() -> None:
+        raise RateLimitExceeded("limit")
+
+    with upstream_guard(refuse), pytest.raises(RateLimitExceeded):
+        _search(stub_server, "Nat")
+    assert stub_server.requests == []
+
+    # A cached answer needs no budget
+    _search(stub_server, "Nat")
+    with upstream_guard(refuse):
+        assert _search(stub_server, "Nat") == [{"name": "/json?q=Nat"}]
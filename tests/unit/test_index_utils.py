@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from lean_lsp_mcp import index_utils
+from lean_lsp_mcp.index_utils import DeclarationIndex, edit_distance, scan_declarations
+from lean_lsp_mcp.watch_utils import InotifyWatcher, PollingWatcher
+
+
+@pytest.fixture(autouse=True)
+def no_lean_src(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(index_utils, "_get_lean_src_search_path", lambda: None)
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_scan_declarations() -> None:
+    source = (
+        "import Foo\n"
+        "theorem add_zero' : True := trivial\n"
+        "  lemma Nat.succ_le {n : Nat} : True := trivial\n"
+        "instance : Inhabited Nat := ⟨0⟩\n"
+        "def f(x : Nat) := x\n"
+        "-- def commented := 1\n"
+        "structure Point₁ where\n"
+    )
+
+    assert scan_declarations(source.encode()) == [
+        ("add_zero'", "theorem", 1),
+        ("Nat.succ_le", "lemma", 2),
+        ("f", "def", 4),
+        ("Point₁", "structure", 6),
+    ]
+
+
+def test_index_matches_components_with_smart_case(tmp_path: Path) -> None:
+    _write(
+        tmp_path / "A.lean", "theorem Nat.add_comm : True := trivial\ndef addOne := 1\n"
+    )
+    _write(
+        tmp_path / ".lake/packages/lib/Lib.lean",
+        "theorem add_comm_zero : True := trivial\n",
+    )
+    _write(tmp_path / ".lake/build/ir/Gen.lean", "def add_generated := 1\n")
+    index = DeclarationIndex(tmp_path)
+
+    names = [r["name"] for r in index.search("add", limit=10)]
+    # Prefixes of the full name rank before prefixes of a namespace component
+    assert names == ["addOne", "add_comm_zero", "Nat.add_comm"]
+    assert index.search("nat.add") == [
+        {"name": "Nat.add_comm", "kind": "theorem", "file": "A.lean"}
+    ]
+    # Uppercase queries only match the exact case as prefix, typo matching ignores case
+    assert index.search("Nat.Add", limit=1) == index.search("nat.add", limit=1)
+    assert index.search("NAT.ADD_COMM_ZERO") == []
+    # The prefix match ranks before the one-typo match
+    assert [r["file"] for r in index.search("add_comm_")] == [
+        os.path.join(".lake", "packages", "lib", "Lib.lean"),
+        "A.lean",
+    ]
+    assert len(index.search("add", limit=2)) == 2
+
+
+def test_index_updates_changed_files_and_persists(tmp_path: Path) -> None:
+    project = tmp_path / "project"
+    _write(project / "A.lean", "def first := 1\n")
+    cache_path = tmp_path / "index.json"
+    index = DeclarationIndex(project, cache_path=cache_path, refresh_interval=0)
+
+    assert [r["name"] for r in index.search("first")] == ["first"]
+
+    _write(project / "A.lean", "def second := 1\n")
+    _write(project / "B.lean", "def third := 1\n")
+    assert index.search("first") == []
+    assert [r["name"] for r in index.search("second")] == ["second"]
+
+    (project / "B.lean").unlink()
+    assert index.search("third") == []
+
+    # A new process starts from the saved index
+    reloaded = DeclarationIndex(project, cache_path=cache_path)
+    reloaded._load()
+    assert set(reloaded._files) == {"A.lean"}
+    assert [r["name"] for r in reloaded.search("second")] == ["second"]
+
+
+def test_ranking_prefers_exact_and_namespace_suffix(tmp_path: Path) -> None:
+    decls = [f"theorem map_mul_{i} : True := trivial" for i in range(40)]
+    decls += [
+        "theorem MonoidHom.map_mul : True := trivial",
+        "theorem map_mul : True := trivial",
+    ]
+    _write(tmp_path / "A.lean", "\n".join(decls) + "\n")
+    index = DeclarationIndex(tmp_path)
+
+    names = [r["name"] for r in index.search("map_mul", limit=3)]
+
+    assert names == ["map_mul", "MonoidHom.map_mul", "map_mul_0"]
+
+
+def test_ranking_initials_substring_and_typos(tmp_path: Path) -> None:
+    _write(
+        tmp_path / "A.lean",
+        "theorem HasDerivAt.add : True := trivial\n"
+        "theorem Finset.card_le_one : True := trivial\n"
+        "theorem mul_comm_assoc : True := trivial\n",
+    )
+    index = DeclarationIndex(tmp_path)
+
+    assert [r["name"] for r in index.search("clo")] == ["Finset.card_le_one"]
+    assert [r["name"] for r in index.search("comm_as")] == ["mul_comm_assoc"]
+    assert [r["name"] for r in index.search("card_le_on3")] == ["Finset.card_le_one"]
+    assert [r["name"] for r in index.search("mul_cmom_assoc")] == ["mul_comm_assoc"]
+    assert index.search("zzzzzz") == []
+
+
+def test_edit_distance_is_bounded() -> None:
+    assert edit_distance("add_comm", "add_comm", 2) == 0
+    assert edit_distance("add_comm", "add_cmm", 2) == 1
+    assert edit_distance("add_comm", "mul_assoc", 2) == 3
+
+
+def test_search_many(tmp_path: Path) -> None:
+    _write(
+        tmp_path / "A.lean", "theorem add_comm : True := trivial\ndef mul_one := 1\n"
+    )
+    index = DeclarationIndex(tmp_path)
+
+    results = index.search_many(["add_comm", "mul", "nothing_here"], limit=5)
+
+    assert {q: [r["name"] for r in rs] for q, rs in results.items()} == {
+        "add_comm": ["add_comm"],
+        "mul": ["mul_one"],
+        "nothing_here": [],
+    }
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is Linux only"
+)
+def test_index_applies_watcher_changes(tmp_path: Path) -> None:
+    _write(tmp_path / "A.lean", "def first := 1\n")
+    watcher = InotifyWatcher(tmp_path).start()
+    assert watcher.wait_ready(5)
+    # Without a watcher this interval would hide every change
+    index = DeclarationIndex(tmp_path, refresh_interval=3600, watcher=watcher)
+    try:
+        assert [r["name"] for r in index.search("first")] == ["first"]
+
+        _write(tmp_path / "A.lean", "def second := 1\n")
+        _write(tmp_path / "Sub" / "B.lean", "def third := 1\n")
+        assert index.search("first") == []
+        assert [r["name"] for r in index.search("second")] == ["second"]
+        assert [r["name"] for r in index.search("third")] == ["third"]
+
+        (tmp_path / "Sub" / "B.lean").unlink()
+        assert index.search("third") == []
+    finally:
+        watcher.stop()
+
+
+def test_index_rescans_while_watcher_is_not_exact(tmp_path: Path) -> None:
+    _write(tmp_path / "A.lean", "def first := 1\n")
+    watcher = PollingWatcher(tmp_path)
+    index = DeclarationIndex(tmp_path, refresh_interval=0, watcher=watcher)
+    assert [r["name"] for r in index.search("first")] == ["first"]
+
+    _write(tmp_path / "A.lean", "def second := 1\n")
+    assert [r["name"] for r in index.search("second")] == ["second"]
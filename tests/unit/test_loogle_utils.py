@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+import orjson
+import pytest
+
+from lean_lsp_mcp.loogle_utils import LocalLoogle, _split_terms, default_imports
+
+
+def _entry(name: str, type_: str, consts: list[str], concl: list[str]) -> dict:
+    return {
+        "name": name,
+        "module": "Mathlib.Test",
+        "type": type_,
+        "doc": "",
+        "consts": consts,
+        "concl": concl,
+    }
+
+
+@pytest.fixture
+def loogle(tmp_path: Path) -> LocalLoogle:
+    entries = [
+        _entry(
+            "Real.sin_le_one",
+            "∀ (x : ℝ), Real.sin x ≤ 1",
+            ["Real", "Real.sin", "LE.le", "One.one"],
+            ["Real.sin", "LE.le", "One.one", "Real"],
+        ),
+        _entry(
+            "Real.sin_sq_add_cos_sq",
+            "∀ (x : ℝ), Real.sin x ^ 2 + Real.cos x ^ 2 = 1",
+            ["Real", "Real.sin", "Real.cos", "HPow.hPow", "HAdd.hAdd", "Eq"],
+            ["Real.sin", "Real.cos", "HPow.hPow", "HAdd.hAdd", "Eq", "Real"],
+        ),
+        _entry(
+            "mul_pow",
+            "(a * b) ^ n = a ^ n * b ^ n",
+            ["HMul.hMul", "HPow.hPow", "Eq", "Monoid"],
+            ["HMul.hMul", "HPow.hPow", "Eq"],
+        ),
+        _entry("List.map", "(α → β) → List α → List β", ["List"], ["List"]),
+        _entry(
+            "Real.differentiable_sin",
+            "Differentiable ℝ Real.sin",
+            ["Differentiable", "Real", "Real.sin"],
+            ["Differentiable", "Real", "Real.sin"],
+        ),
+    ]
+    path = tmp_path / "index.jsonl"
+    path.write_bytes(b"\n".join(orjson.dumps(e) for e in entries) + b"\n")
+    return LocalLoogle(tmp_path, path, ["Mathlib"])
+
+
+def _names(results) -> list[str]:
+    assert isinstance(results, list), results
+    return [r["name"] for r in results]
+
+
+def test_split_terms() -> None:
+    assert _split_terms('Real.sin, "two", f (a, b)') == [
+        "Real.sin",
+        '"two"',
+        "f (a, b)",
+    ]
+
+
+def test_constant_and_name_queries(loogle: LocalLoogle) -> None:
+    assert loogle.ready
+    assert _names(loogle.search("Real.sin")) == [
+        "Real.differentiable_sin",
+        "Real.sin_le_one",
+        "Real.sin_sq_add_cos_sq",
+    ]
+    assert _names(loogle.search('Real.sin, "differ"')) == ["Real.differentiable_sin"]
+    assert _names(loogle.search("Real.sin", num_results=1)) == [
+        "Real.differentiable_sin"
+    ]
+    # Unambiguous short names resolve
+    assert _names(loogle.search("cos")) == ["Real.sin_sq_add_cos_sq"]
+    # Same shape as loogle.lean-lang.org hits
+    assert loogle.search("List")[0] == {
+        "name": "List.map",
+        "type": "(α → β) → List α → List β",
+        "module": "Mathlib.Test",
+    }
+
+
+def test_pattern_queries(loogle: LocalLoogle) -> None:
+    assert _names(loogle.search("_ * (_ ^ _)")) == ["mul_pow"]
+    assert _names(loogle.search("(?a -> ?b) -> List ?a -> List ?b")) == ["List.map"]
+    assert _names(loogle.search("|- Real.sin _ ≤ _")) == ["Real.sin_le_one"]
+    assert _names(loogle.search("⊢ Differentiable _ _")) == ["Real.differentiable_sin"]
+    assert loogle.search("Real.tan") == "Unknown identifier 'Real.tan'"
+    assert loogle.search("List, Real") == []
+
+
+def test_failed_build_is_not_retried(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PATH", str(tmp_path))  # No lake
+    loogle = LocalLoogle(tmp_path, tmp_path / "cache" / "index.jsonl", ["Proj"])
+    assert not loogle.ready
+    loogle.build_in_background()
+    deadline = time.monotonic() + 5
+    while (loogle.error is None or loogle._building) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert loogle.error
+    assert loogle.search("Nat") == "Local loogle index is not built yet."
+
+    loogle.build_in_background()
+    assert not loogle._building
+
+
+def test_project_without_mathlib_indexes_its_libraries(tmp_path: Path) -> None:
+    (tmp_path / "lakefile.toml").write_text(
+        'name = "proj"\n\n[[lean_lib]]\nname = "Proj"\n\n[[lean_lib]]\nname = "Extra"\nroots = ["Extra.A", "Extra.B"]\n'
+    )
+    assert default_imports(tmp_path) == ["Proj", "Extra.A", "Extra.B"]
+    (tmp_path / ".lake" / "packages" / "mathlib").mkdir(parents=True)
+    assert default_imports(tmp_path) == ["Proj", "Extra.A", "Extra.B", "Mathlib"]
+
+
+def test_empty_index_is_not_ready(tmp_path: Path) -> None:
+    # Nothing to import: never ready, so lean_loogle asks the remote service
+    loogle = LocalLoogle(tmp_path, tmp_path / "index.jsonl", [])
+    assert default_imports(tmp_path) == []
+    assert not loogle.ready
+    loogle.build_in_background()
+    assert loogle.error and not loogle._building
+
+    # An index without declarations cannot answer queries either
+    (tmp_path / "empty.jsonl").write_bytes(b"")
+    assert not LocalLoogle(tmp_path, tmp_path / "empty.jsonl", ["Proj"]).ready
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from lean_lsp_mcp.outline_utils import generate_outline
+
+
+class _OutlineClient:
+    """Serves a source file and answers #info_trees for scratch copies."""
+
+    def __init__(self, project_path: Path) -> None:
+        self.project_path = project_path
+        self.documents: dict[str, str] = {}
+
+    def open_file(self, path: str) -> None:
+        self.documents[path] = (self.project_path / path).read_text(encoding="utf-8")
+
+    def get_file_content(self, path: str) -> str:
+        return self.documents[path]
+
+    def get_document_symbols(self, path: str) -> list[dict]:
+        lines = self.documents[path].split("\n")
+        return [
+            {
+                "name": line.split()[1],
+                "kind": 6,
+                "range": {
+                    "start": {"line": i, "character": 0},
+                    "end": {"line": i, "character": len(line)},
+                },
+            }
+            for i, line in enumerate(lines)
+            if line.startswith("def ")
+        ]
+
+    def get_diagnostics(self, path: str) -> list[dict]:
+        lines = self.documents[path].split("\n")
+        diagnostics = []
+        for i, line in enumerate(lines):
+            if line == "#info_trees in":
+                name = lines[i + 1].split()[1]
+                position = {"line": i, "character": 0}
+                diagnostics.append(
+                    {
+                        "range": {"start": position, "end": position},
+                        "severity": 3,
+                        "message": f"  • [Term] {name} (isBinder := true) : Nat @ ⟨{i}, 4⟩",
+                    }
+                )
+        return diagnostics
+
+    def close_files(self, paths: list[str]) -> None:
+        for path in paths:
+            del self.documents[path]
+
+
+def test_generate_outline_leaves_document_untouched(tmp_path: Path) -> None:
+    source = "import Foo\n\ndef a := 1\n\ndef b := 2\n"
+    (tmp_path / "A.lean").write_text(source, encoding="utf-8")
+    client = _OutlineClient(tmp_path)
+
+    outline = generate_outline(client, "A.lean")
+
+    assert outline == (
+        "## Imports\nFoo\n\n## Declarations\n[Def: L3] a : Nat\n[Def: L5] b : Nat\n"
+    )
+    # The source stays open and unmodified, the scratch copy is closed and removed
+    assert client.documents == {"A.lean": source}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["A.lean"]
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import pytest
+
+from lean_lsp_mcp.rate_limit_utils import (
+    RateLimiter,
+    get_rate_limiter,
+    max_wait_from_env,
+)
+
+
+def test_rate_limiter_burst_then_steady_rate() -> None:
+    now = [0.0]
+    limiter = RateLimiter(3, 30, clock=lambda: now[0])
+
+    assert [limiter.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.stats()["available"] == 0
+    assert limiter.reserve() is None
+    assert limiter.retry_after() == 10
+    assert limiter.reserve(max_wait=10) == 10
+
+    now[0] = 60
+    stats = limiter.stats()
+    assert stats["available"] == 3
+    assert (stats["allowed"], stats["delayed"], stats["rejected"]) == (4, 1, 1)
+    assert stats["wait_seconds"] == 10
+
+
+def test_get_rate_limiter_shares_instances() -> None:
+    limiters: dict = {}
+    first = get_rate_limiter(limiters, "loogle", 3, 30)
+    assert get_rate_limiter(limiters, "loogle", 3, 30) is first
+    assert get_rate_limiter(limiters, "leanfinder", 10, 30) is not first
+
+
+def test_max_wait_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("LEAN_LSP_RATE_LIMIT_WAIT", raising=False)
+    assert max_wait_from_env() == 0
+    monkeypatch.setenv("LEAN_LSP_RATE_LIMIT_WAIT", "2.5")
+    assert max_wait_from_env() == 2.5
+    monkeypatch.setenv("LEAN_LSP_RATE_LIMIT_WAIT", "soon")
+    assert max_wait_from_env() == 0
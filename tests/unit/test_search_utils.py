@@ -1,5 +1,7 @@
 import importlib
+import io
 import orjson
+import sys
 from pathlib import Path
 
 import pytest
@@ -93,6 +95,37 @@ class _DummyCompletedProcess:
         self.args = []
 
 
+class _DummyPopen:
+    """Streams the canned ripgrep output like a running process."""
+
+    def __init__(self, completed, cmd):
+        self.args = cmd
+        self.stdout = io.StringIO(completed.stdout)
+        self._stderr = completed.stderr
+        self._final_returncode = completed.returncode
+        self.returncode = None
+        self.killed = False
+
+    def poll(self):
+        # Still running until all output was read
+        if self.returncode is None and self.stdout.tell() == len(
+            self.stdout.getvalue()
+        ):
+            self.returncode = self._final_returncode
+        return self.returncode
+
+    def wait(self):
+        return self.poll()
+
+    def kill(self):
+        self.killed = True
+        self.returncode = -9
+
+    def communicate(self):
+        self.poll()
+        return self.stdout.read(), self._stderr
+
+
 def _configure_env(
     monkeypatch, search_utils, stdout_events, returncode=0, expected_cwd=None
 ):
@@ -106,14 +139,19 @@ def _configure_env(
 
     def fake_run(cmd, *, capture_output=False, text=False, cwd=None):
         run_calls.append((cmd, cwd))
-        if expected_cwd is not None and cmd and cmd[0] == "rg":
-            assert cwd == expected_cwd
         if cmd[:2] == ["lean", "--print-prefix"]:
             return lean_completed
         return completed
 
+    def fake_popen(cmd, *, cwd=None, **kwargs):
+        run_calls.append((cmd, cwd))
+        if expected_cwd is not None and cmd and cmd[0] == "rg":
+            assert cwd == expected_cwd
+        return _DummyPopen(completed, cmd)
+
     monkeypatch.setattr(search_utils, "check_ripgrep_status", fake_check)
     monkeypatch.setattr(search_utils.subprocess, "run", fake_run)
+    monkeypatch.setattr(search_utils.subprocess, "Popen", fake_popen)
 
     return completed, run_calls
 
@@ -510,3 +548,68 @@ def test_lean_search_handles_namespaces(monkeypatch, reload_search_utils):
     assert len(results) == 3
     names = {r["name"] for r in results}
     assert names == {"Nat.add", "List.add", "add"}
+
+
+def test_lean_search_stops_ripgrep_at_limit(monkeypatch, reload_search_utils):
+    search_utils = reload_search_utils
+    events = [_make_match("A.lean", f"def many{i} : Nat := {i}") for i in range(100)]
+    completed = _DummyCompletedProcess(events)
+    started = []
+
+    def fake_popen(cmd, **kwargs):
+        started.append(_DummyPopen(completed, cmd))
+        return started[-1]
+
+    monkeypatch.setattr(search_utils, "_get_lean_src_search_path", lambda: "/lean/src")
+    monkeypatch.setattr(search_utils.subprocess, "Popen", fake_popen)
+
+    results = search_utils.lean_local_search(
+        "many", limit=3, project_root=Path("/proj")
+    )
+
+    assert [r["name"] for r in results] == ["many0", "many1", "many2"]
+    # Project and Lean sources are searched by separate, concurrently running processes
+    assert [p.args[-1] for p in started] == [str(Path("/proj").resolve()), "/lean/src"]
+    assert all(p.killed for p in started)
+
+
+def test_lean_search_survives_verbose_ripgrep_stderr(
+    monkeypatch, reload_search_utils, tmp_path
+):
+    search_utils = reload_search_utils
+    # More stderr than a pipe holds, written before any stdout
+    script = "import sys; sys.stderr.write('x' * 1_000_000 + 'done'); sys.exit(2)"
+    monkeypatch.setattr(search_utils, "_get_lean_src_search_path", lambda: None)
+    monkeypatch.setattr(
+        search_utils, "_rg_command", lambda *args: [sys.executable, "-c", script]
+    )
+
+    with pytest.raises(RuntimeError, match="ripgrep exited with code 2") as excinfo:
+        search_utils.lean_local_search("anything", project_root=tmp_path)
+    assert str(excinfo.value).endswith("done")
+
+
+def test_lean_search_batch_single_pass(monkeypatch, reload_search_utils):
+    search_utils = reload_search_utils
+    events = [
+        _make_match("A.lean", "theorem Nat.add_comm : True := trivial"),
+        _make_match("A.lean", "theorem mul_comm : True := trivial"),
+        _make_match("A.lean", "def AddHom : Type := Unit"),
+        _make_match("A.lean", "theorem add_zero : True := trivial"),
+    ]
+    _, run_calls = _configure_env(monkeypatch, search_utils, events)
+
+    results = search_utils.lean_local_search_batch(
+        ["add", "Add", "mul_comm", "missing"], limit=5, project_root=Path("/proj")
+    )
+
+    assert {q: [r["name"] for r in rs] for q, rs in results.items()} == {
+        "add": ["Nat.add_comm", "AddHom", "add_zero"],
+        "Add": ["AddHom"],
+        "mul_comm": ["mul_comm"],
+        "missing": [],
+    }
+    rg_calls = [cmd for cmd, _ in run_calls if cmd[0] == "rg"]
+    # One scan of the project tree, case is resolved per query afterwards
+    assert len(rg_calls) == 1
+    assert "--ignore-case" in rg_calls[0]
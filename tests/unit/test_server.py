@@ -5,7 +5,8 @@ from pathlib import Path
 
 import pytest
 
-from lean_lsp_mcp import server
+from lean_lsp_mcp import http_utils, rate_limit_utils, server
+from lean_lsp_mcp.rate_limit_utils import RateLimiter
 
 
 class DummyClient:
@@ -16,11 +17,11 @@ class DummyClient:
         self.closed_calls += 1
 
 
-def _make_ctx(rate_limit: dict[str, list[int]] | None = None) -> types.SimpleNamespace:
+def _make_ctx(rate_limit: dict | None = None) -> types.SimpleNamespace:
     context = server.AppContext(
         lean_project_path=None,
         client=None,
-        rate_limit=rate_limit or {"test": []},
+        rate_limit=rate_limit if rate_limit is not None else {},
         lean_search_available=True,
     )
     request_context = types.SimpleNamespace(lifespan_context=context)
@@ -35,13 +36,8 @@ async def test_app_lifespan_defaults(monkeypatch: pytest.MonkeyPatch) -> None:
     async with server.app_lifespan(object()) as context:
         assert context.lean_project_path is None
         assert context.client is None
-        assert context.rate_limit == {
-            "leansearch": [],
-            "loogle": [],
-            "leanfinder": [],
-            "lean_state_search": [],
-            "hammer_premise": [],
-        }
+        # Rate limits are shared by all sessions
+        assert context.rate_limit is rate_limit_utils.RATE_LIMITERS
 
 
 @pytest.mark.asyncio
@@ -69,53 +65,198 @@ async def test_app_lifespan_closes_client(monkeypatch: pytest.MonkeyPatch) -> No
     assert dummy_client.closed_calls == 1
 
 
-def test_rate_limited_allows_within_limit(monkeypatch: pytest.MonkeyPatch) -> None:
-    times = iter([100, 101])
-    monkeypatch.setattr(server.time, "time", lambda: next(times))
+@pytest.mark.asyncio
+async def test_app_lifespan_closes_registered_clients(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.delenv("LEAN_PROJECT_PATH", raising=False)
+
+    active = DummyClient()
+    warm = DummyClient()
+
+    async with server.app_lifespan(object()) as context:
+        context.client_registry.add(Path("/a"), active)
+        context.client_registry.add(Path("/b"), warm)
+        context.client = active
+
+    assert active.closed_calls == 1
+    assert warm.closed_calls == 1
+
+
+class FakeClock:
+    def __init__(self, now: float = 100.0) -> None:
+        self.now = now
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _limited_ctx(
+    monkeypatch: pytest.MonkeyPatch, clock: FakeClock, wait: str = "0"
+) -> types.SimpleNamespace:
+    monkeypatch.setenv("LEAN_LSP_RATE_LIMIT_WAIT", wait)
+    monkeypatch.setattr(server.asyncio, "sleep", clock.sleep)
+    return _make_ctx({"test": RateLimiter(2, 10, clock=clock)})
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_allows_within_limit(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    ctx = _limited_ctx(monkeypatch, FakeClock())
 
     @server.rate_limited("test", max_requests=2, per_seconds=10)
+    @server.offload
     def wrapped(*, ctx: types.SimpleNamespace) -> str:
         """Test helper"""
         return "ok"
 
-    ctx = _make_ctx()
-    assert wrapped(ctx=ctx) == "ok"
-    assert wrapped(ctx=ctx) == "ok"
+    assert await wrapped(ctx=ctx) == "ok"
+    assert await wrapped(ctx=ctx) == "ok"
 
 
-def test_rate_limited_blocks_excess(monkeypatch: pytest.MonkeyPatch) -> None:
-    times = iter([100, 101, 102])
-    monkeypatch.setattr(server.time, "time", lambda: next(times))
+@pytest.mark.asyncio
+async def test_rate_limited_blocks_excess(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = FakeClock()
+    ctx = _limited_ctx(monkeypatch, clock)
 
     @server.rate_limited("test", max_requests=2, per_seconds=10)
+    @server.offload
     def wrapped(*, ctx: types.SimpleNamespace) -> str:
         """Test helper"""
         return "ok"
 
-    ctx = _make_ctx()
-    assert wrapped(ctx=ctx) == "ok"
-    assert wrapped(ctx=ctx) == "ok"
-    message = wrapped(ctx=ctx)
+    assert await wrapped(ctx=ctx) == "ok"
+    clock.now += 1
+    assert await wrapped(ctx=ctx) == "ok"
+    clock.now += 1
+    message = await wrapped(ctx=ctx)
     assert "Tool limit exceeded" in message
+    assert "Try again in 3 s" in message
+    assert (
+        ctx.request_context.lifespan_context.rate_limit["test"].stats()["rejected"] == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_refills_over_time(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = FakeClock()
+    ctx = _limited_ctx(monkeypatch, clock)
+
+    @server.rate_limited("test", max_requests=2, per_seconds=10)
+    @server.offload
+    def wrapped(*, ctx: types.SimpleNamespace) -> str:
+        """Test helper"""
+        return "ok"
 
+    assert [await wrapped(ctx=ctx) for _ in range(2)] == ["ok", "ok"]
+    clock.now += 5  # One slot per 5 s
+    assert await wrapped(ctx=ctx) == "ok"
+    assert "Tool limit exceeded" in await wrapped(ctx=ctx)
+    clock.now += 10
+    assert [await wrapped(ctx=ctx) for _ in range(2)] == ["ok", "ok"]
 
-def test_rate_limited_trims_expired(monkeypatch: pytest.MonkeyPatch) -> None:
-    times = iter([100])
-    monkeypatch.setattr(server.time, "time", lambda: next(times))
 
-    rate_limit = {"test": [80, 81]}
-    ctx = _make_ctx(rate_limit=rate_limit)
+@pytest.mark.asyncio
+async def test_rate_limited_waits_for_a_slot(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = FakeClock()
+    ctx = _limited_ctx(monkeypatch, clock, wait="6")
 
     @server.rate_limited("test", max_requests=2, per_seconds=10)
+    @server.offload
     def wrapped(*, ctx: types.SimpleNamespace) -> str:
         """Test helper"""
         return "ok"
 
-    assert wrapped(ctx=ctx) == "ok"
-    assert rate_limit["test"] == [100]
+    assert [await wrapped(ctx=ctx) for _ in range(3)] == ["ok"] * 3
+    assert clock.sleeps == [5.0]
+    # Waiting is bounded
+    monkeypatch.setenv("LEAN_LSP_RATE_LIMIT_WAIT", "1")
+    assert "Tool limit exceeded" in await wrapped(ctx=ctx)
+    stats = ctx.request_context.lifespan_context.rate_limit["test"].stats()
+    assert stats["allowed"] == 3
+    assert stats["delayed"] == 1
+    assert stats["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_upstream_counts_only_real_requests(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    ctx = _limited_ctx(monkeypatch, FakeClock())
+    ctx.request_context.lifespan_context.rate_limit["test"] = RateLimiter(
+        1, 10, clock=FakeClock()
+    )
+    monkeypatch.setattr(http_utils, "RESPONSE_CACHE", http_utils.ResponseCache())
+    monkeypatch.setattr(http_utils, "get_http_client", lambda: None)
+    fetched = []
+
+    @server.rate_limited("test", max_requests=1, per_seconds=10, upstream=True)
+    @server.offload
+    def wrapped(*, ctx: types.SimpleNamespace, query: str) -> list | str:
+        """Test helper"""
+        try:
+            return http_utils.cached_fetch(
+                "stub", query, 1, lambda _: fetched.append(query) or [query]
+            )
+        except Exception as e:
+            return f"error: {e}"
+
+    assert await wrapped(ctx=ctx, query="a") == ["a"]
+    # Cache hits are free
+    assert await wrapped(ctx=ctx, query="a") == ["a"]
+    assert "Tool limit exceeded" in await wrapped(ctx=ctx, query="b")
+    assert fetched == ["a"]
 
 
-def test_local_search_project_root_updates_context(
+@pytest.mark.asyncio
+async def test_rate_limited_upstream_waits_only_for_the_request(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    clock = FakeClock()
+    ctx = _limited_ctx(monkeypatch, clock, wait="10")
+    ctx.request_context.lifespan_context.rate_limit["test"] = RateLimiter(
+        1, 10, clock=clock
+    )
+    monkeypatch.setattr(http_utils, "RESPONSE_CACHE", http_utils.ResponseCache())
+    monkeypatch.setattr(http_utils, "get_http_client", lambda: None)
+
+    def sleep(seconds: float) -> None:
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(http_utils.time, "sleep", sleep)
+    runs, fetched = [], []
+
+    @server.rate_limited("test", max_requests=1, per_seconds=10, upstream=True)
+    @server.offload
+    def wrapped(*, ctx: types.SimpleNamespace, query: str) -> list | str:
+        """Test helper"""
+        runs.append(query)
+        try:
+            return http_utils.cached_fetch(
+                "stub", query, 1, lambda _: fetched.append(query) or [query]
+            )
+        except Exception as e:
+            return f"error: {e}"
+
+    assert await wrapped(ctx=ctx, query="a") == ["a"]
+    assert await wrapped(ctx=ctx, query="b") == ["b"]
+    # The second request waited for its slot, the tool body ran once
+    assert clock.sleeps == [10.0]
+    assert runs == fetched == ["a", "b"]
+    assert (
+        ctx.request_context.lifespan_context.rate_limit["test"].stats()["allowed"] == 2
+    )
+
+
+@pytest.mark.asyncio
+async def test_local_search_project_root_updates_context(
     monkeypatch: pytest.MonkeyPatch, tmp_path: Path
 ) -> None:
     fake_result = [{"name": "foo", "kind": "def", "file": "Foo.lean"}]
@@ -130,12 +271,13 @@ def test_local_search_project_root_updates_context(
         called["root"] = project_root
         return fake_result
 
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
     monkeypatch.setattr(server, "_RG_AVAILABLE", True)
     monkeypatch.setattr(server, "lean_local_search", fake_search)
 
     ctx = _make_ctx()
 
-    result = server.local_search(
+    result = await server.local_search(
         ctx=ctx, query=" foo ", limit=7, project_root=str(project_dir)
     )
 
@@ -148,7 +290,8 @@ def test_local_search_project_root_updates_context(
     assert ctx.request_context.lifespan_context.lean_project_path == project_dir.resolve()
 
 
-def test_local_search_requires_project_root_when_unset(
+@pytest.mark.asyncio
+async def test_local_search_requires_project_root_when_unset(
     monkeypatch: pytest.MonkeyPatch, tmp_path: Path
 ) -> None:
     monkeypatch.setattr(server, "_RG_AVAILABLE", True)
@@ -156,8 +299,188 @@ def test_local_search_requires_project_root_when_unset(
     ctx = _make_ctx()
     missing_path = tmp_path / "missing"
 
-    message = server.local_search(
+    message = await server.local_search(
         ctx=ctx, query="foo", project_root=str(missing_path)
     )
 
     assert "does not exist" in message
+
+
+class _AttemptClient:
+    """Fake Lean client that reports the attempted line as a diagnostic."""
+
+    max_opened_files = 2
+
+    def __init__(self, project_path: Path) -> None:
+        self.project_path = project_path
+        self.contents: dict[str, str] = {}
+        self.max_open = 0
+
+    def open_files(self, paths: list[str]) -> None:
+        for path in paths:
+            self.contents[path] = (self.project_path / path).read_text()
+        self.max_open = max(self.max_open, len(self.contents))
+
+    def open_file(self, path: str) -> None:
+        self.open_files([path])
+
+    def get_diagnostics(self, path: str) -> list[dict]:
+        line = self.contents[path].splitlines()[1]
+        position = {"line": 1, "character": 0}
+        return [
+            {
+                "range": {"start": position, "end": position},
+                "severity": 1,
+                "message": f"saw {line.strip()}",
+            }
+        ]
+
+    def get_goal(self, path: str, line: int, character: int) -> dict:
+        return {"rendered": f"goal {line}:{character}"}
+
+    def close_files(self, paths: list[str], blocking: bool = True) -> None:
+        for path in paths:
+            del self.contents[path]
+
+
+def test_multi_attempt_parallel_keeps_output_format(tmp_path: Path) -> None:
+    (tmp_path / "Proof.lean").write_text(
+        "theorem t : True := by\n  sorry\n", encoding="utf-8"
+    )
+    client = _AttemptClient(tmp_path)
+    snippets = ["  trivial", "  exact True.intro\n", "  simp"]
+
+    results = server._multi_attempt_parallel(client, "Proof.lean", 2, snippets)
+
+    assert results == [
+        f"{s.rstrip()}:\n goal 1:{len(s.rstrip())}\n\nl2c1-l2c1, severity: 1\nsaw {s.strip()}"
+        for s in snippets
+    ]
+    # Copies are opened in batches of max_opened_files and removed afterwards
+    assert client.max_open == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["Proof.lean"]
+
+
+def test_multi_attempt_parallel_spreads_over_pool(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "Proof.lean").write_text(
+        "theorem t : True := by\n  sorry\n", encoding="utf-8"
+    )
+    workers: list[_AttemptClient] = []
+
+    def _constructor(project_path, initial_build=False, prevent_cache_get=False):
+        workers.append(_AttemptClient(Path(project_path)))
+        return workers[-1]
+
+    monkeypatch.setattr("lean_lsp_mcp.client_utils.LeanLSPClient", _constructor)
+    pool = server.LeanWorkerPool(tmp_path, 2)
+
+    results = server._multi_attempt_parallel(
+        pool, "Proof.lean", 2, ["  a", "  b", "  c", "  d"]
+    )
+
+    assert [r.split(":")[0] for r in results] == ["  a", "  b", "  c", "  d"]
+    assert all(w.max_open == 2 for w in workers)
+    assert not pool._pins
+
+
+class _RunCodeClient:
+    """Fake Lean client for run_code that counts diagnostics requests."""
+
+    def __init__(self, project_path: Path) -> None:
+        self.project_path = project_path
+        self.contents: dict[str, str] = {}
+        self.opened_files: dict[str, types.SimpleNamespace] = {}
+        self.diagnostics_calls = 0
+
+    def get_file_content(self, path: str) -> str:
+        if path not in self.contents:
+            raise FileNotFoundError(path)
+        return self.contents[path]
+
+    def open_file(self, path: str) -> None:
+        self.contents[path] = (self.project_path / path).read_text()
+        self.opened_files[path] = types.SimpleNamespace(complete=True, error=None)
+
+    def update_file(self, path: str, changes) -> None:
+        raise AssertionError("identical code should not be re-sent")
+
+    def get_diagnostics(
+        self, path: str, inactivity_timeout: float = 15.0
+    ) -> list[dict]:
+        self.diagnostics_calls += 1
+        position = {"line": 1, "character": 0}
+        return [
+            {
+                "range": {"start": position, "end": position},
+                "severity": 3,
+                "message": "1",
+            }
+        ]
+
+
+@pytest.mark.asyncio
+async def test_run_code_caches_diagnostics(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    ctx = _make_ctx()
+    context = ctx.request_context.lifespan_context
+    context.lean_project_path = tmp_path
+    context.diagnostics_cache = server.DiagnosticsCache()
+    client = _RunCodeClient(tmp_path)
+
+    def _startup(ctx) -> None:
+        ctx.request_context.lifespan_context.client = client
+
+    monkeypatch.setattr(server, "startup_client", _startup)
+
+    code = "import Foo\n#eval 1"
+    first = await server.run_code(ctx, code)
+    second = await server.run_code(ctx, code)
+
+    assert first == second == ["l2c1-l2c1, severity: 3\n1"]
+    assert client.diagnostics_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_local_search_uses_ready_index(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    (tmp_path / "Foo.lean").write_text("theorem foo_bar : True := trivial\n")
+
+    def _no_rg(**kwargs):
+        raise AssertionError("ripgrep should not run once the index is ready")
+
+    monkeypatch.setattr(server, "_RG_AVAILABLE", True)
+    monkeypatch.setattr(server, "lean_local_search", _no_rg)
+    server.get_declaration_index(tmp_path).refresh()
+
+    ctx = _make_ctx()
+    ctx.request_context.lifespan_context.lean_project_path = tmp_path
+
+    assert await server.local_search(ctx=ctx, query="foo") == [
+        {"name": "foo_bar", "kind": "theorem", "file": "Foo.lean"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_file_outline_cache_hit_skips_client(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "lean-toolchain").write_text("leanprover/lean4:v4.20.0\n")
+    (tmp_path / "A.lean").write_text("def a := 1\n")
+    ctx = _make_ctx()
+    cache = server.OutlineCache(tmp_path / "cache")
+    ctx.request_context.lifespan_context.outline_cache = cache
+    cache.put(tmp_path, "A.lean", "def a := 1\n", "outline")
+
+    def _no_client(ctx, file_path):
+        raise AssertionError("cache hits should not start a Lean client")
+
+    monkeypatch.setattr(server, "get_file_client", _no_client)
+
+    assert await server.file_outline(ctx, str(tmp_path / "A.lean")) == "outline"
+    assert ctx.request_context.lifespan_context.lean_project_path == tmp_path
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from leanclient.utils import apply_changes_to_text
+
+from lean_lsp_mcp.snapshot_utils import (
+    WarmDocuments,
+    import_header,
+    minimal_change,
+    replace_line,
+)
+
+
+class _FakeClient:
+    def __init__(self, project_path: Path) -> None:
+        self.project_path = project_path
+        self.documents: dict[str, str] = {}
+        self.updates: list = []
+        self.closed: list[str] = []
+
+    def get_file_content(self, path: str) -> str:
+        if path not in self.documents:
+            raise FileNotFoundError(path)
+        return self.documents[path]
+
+    def open_file(self, path: str) -> None:
+        self.documents[path] = (self.project_path / path).read_text(encoding="utf-8")
+
+    def update_file(self, path: str, changes: list) -> None:
+        self.updates.append(changes)
+        self.documents[path] = apply_changes_to_text(self.documents[path], changes)
+
+    def close_files(self, paths: list[str]) -> None:
+        for path in paths:
+            self.closed.append(path)
+            del self.documents[path]
+
+
+def test_import_header_stops_at_first_command() -> None:
+    code = "import Mathlib\n-- note\n\nimport Foo\ntheorem t : True := trivial\nimport Bar\n"
+    assert import_header(code) == "import Mathlib\n-- note\n\nimport Foo\n"
+    assert import_header("def x := 1") == ""
+
+
+def test_replace_line_and_append() -> None:
+    assert replace_line("a\nb\nc", 2, "X") == "a\nX\nc"
+    assert replace_line("a\n", 3, "X") == "a\nX\n"
+
+
+def test_minimal_change_keeps_prefix_and_suffix() -> None:
+    old = "import A\nline1\nline2\nline3\n"
+    new = "import A\nline1\nchanged\nline3\n"
+
+    change = minimal_change(old, new)
+
+    assert change.start == (2, 0)
+    assert change.end == (3, 0)
+    assert change.text == "changed\n"
+    assert apply_changes_to_text(old, [change]) == new
+    assert minimal_change(old, old) is None
+
+
+def test_minimal_change_without_trailing_newline() -> None:
+    old = 'import A\ndef x := "😀"'
+    new = "import A\ndef x := 2\ndef y := 3"
+
+    change = minimal_change(old, new)
+
+    assert change.start == (1, 0)
+    # The emoji counts as two UTF-16 code units
+    assert change.end == (1, len('def x := "😀"') + 1)
+    assert apply_changes_to_text(old, [change]) == new
+
+
+def test_warm_documents_open_update_and_evict(tmp_path: Path) -> None:
+    client = _FakeClient(tmp_path)
+    warm = WarmDocuments(max_documents=1)
+
+    path = warm.update(client, "a", "import A\ndef x := 1\n")
+    assert path == warm.path_for(client, "a")
+    assert client.documents[path] == "import A\ndef x := 1\n"
+    # The scratch file is only needed while opening
+    assert not (tmp_path / path).exists()
+
+    warm.update(client, "a", "import A\ndef x := 2\n")
+    assert client.updates[-1][0].start == (1, 0)
+    assert client.documents[path] == "import A\ndef x := 2\n"
+
+    warm.update(client, "a", "import A\ndef x := 2\n")
+    assert len(client.updates) == 1
+
+    other = warm.update(client, "b", "import B\n")
+    assert client.closed == []
+    warm.close_evicted()
+    assert client.closed == [path]
+    assert other in client.documents
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+# SDKs that tools load on first use; importing the server must not pull them in
+HEAVY_MODULES = ("google.genai", "google.generativeai", "openai", "numpy")
+
+_PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import lean_lsp_mcp.server
+elapsed = time.perf_counter() - start
+heavy = sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)
+print(f"{{elapsed}}|{{','.join(heavy)}}")
+"""
+
+
+def _import_server() -> tuple[float, str]:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, LEAN_LOG_LEVEL="NONE"),
+        check=True,
+    )
+    elapsed, heavy = result.stdout.strip().splitlines()[-1].split("|")
+    return float(elapsed), heavy
+
+
+def test_server_import_skips_heavy_modules() -> None:
+    _, heavy = _import_server()
+    assert heavy == "", f"imported at startup: {heavy}"
+
+
+@pytest.mark.skipif(
+    "LEAN_LSP_IMPORT_BUDGET" not in os.environ,
+    reason="benchmark, set LEAN_LSP_IMPORT_BUDGET (seconds) to run",
+)
+def test_server_import_time() -> None:
+    # Best of three, the first run may pay for compiling bytecode
+    timings = [_import_server()[0] for _ in range(3)]
+    assert min(timings) < float(os.environ["LEAN_LSP_IMPORT_BUDGET"]), timings
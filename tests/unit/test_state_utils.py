@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from lean_lsp_mcp.http_utils import ResponseCache
+from lean_lsp_mcp.rate_limit_utils import SharedRateLimiter
+from lean_lsp_mcp.state_utils import SharedState
+
+
+def _reserve_many(path: str, count: int) -> int:
+    limiter = SharedRateLimiter(SharedState(Path(path)), "loogle", 6, 3600)
+    return sum(limiter.reserve() is not None for _ in range(count))
+
+
+def test_limiter_budget_is_shared_between_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "state.sqlite3")
+    SharedState(Path(path))  # Create the schema once
+    with multiprocessing.get_context("spawn").Pool(2) as pool:
+        allowed = pool.starmap(_reserve_many, [(path, 5)] * 2)
+    assert sum(allowed) == 6
+
+    stats = SharedRateLimiter(SharedState(Path(path)), "loogle", 6, 3600).stats()
+    assert (stats["allowed"], stats["rejected"], stats["available"]) == (6, 4, 0)
+
+
+def test_responses_are_shared_between_caches(tmp_path: Path) -> None:
+    store = SharedState(tmp_path / "state.sqlite3")
+    first = ResponseCache(max_entries=2, store=store)
+    # A separate connection, as another process would have
+    second = ResponseCache(max_entries=2, store=SharedState(tmp_path / "state.sqlite3"))
+
+    first.put(("loogle", "Nat", 8), [{"name": "Nat"}])
+    assert second.get(("loogle", "Nat", 8)) == [{"name": "Nat"}]
+    assert second.get(("loogle", "Int", 8)) is None
+
+    first.put(("loogle", "Int", 8), [])
+    first.put(("loogle", "Real", 8), [])
+    # The least recently used entry was pruned from the shared table
+    assert ResponseCache(store=store).get(("loogle", "Nat", 8)) is None
+
+
+def test_expired_responses_are_ignored(tmp_path: Path) -> None:
+    store = SharedState(tmp_path / "state.sqlite3")
+    store.put_response("key", b"[1]", ttl=-1, max_entries=10)
+    assert store.get_response("key") is None
+    store.put_response("key", b"[1]", ttl=60, max_entries=10)
+    assert store.get_response("key") == b"[1]"
+
+
+def test_shared_state_from_env(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("LEAN_LSP_SHARED_STATE", raising=False)
+    assert SharedState.from_env() is None
+
+    monkeypatch.setenv("LEAN_LSP_SHARED_STATE", "true")
+    assert SharedState.from_env().path == tmp_path / "state.sqlite3"
+
+    monkeypatch.setenv("LEAN_LSP_CACHE_DIR", "none")
+    assert SharedState.from_env() is None
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import threading
 
 from lean_lsp_mcp.utils import (
     OptionalTokenVerifier,
+    offload,
     extract_range,
     filter_diagnostics_by_position,
     find_start_position,
@@ -145,3 +147,26 @@ def test_format_diagnostics_line_filter() -> None:
     assert keep_all == ["l3c1-l3c4, severity: 1\nOnly on line three"]
     assert only_line_two == ["l3c1-l3c4, severity: 1\nOnly on line three"]
     assert other_line == []
+
+
+def test_offload_runs_blocking_work_off_the_event_loop() -> None:
+    release = threading.Event()
+
+    @offload
+    def blocking(value: int) -> int:
+        """Block until released."""
+        assert release.wait(timeout=5)
+        return value * 2
+
+    async def _run() -> list[int]:
+        first = asyncio.create_task(blocking(1))
+        second = asyncio.create_task(blocking(value=2))
+        # The loop stays responsive while both calls block in worker threads
+        await asyncio.sleep(0.05)
+        assert not first.done() and not second.done()
+        release.set()
+        return [await first, await second]
+
+    assert asyncio.run(_run()) == [2, 4]
+    assert asyncio.iscoroutinefunction(blocking)
+    assert blocking.__doc__ == "Block until released."
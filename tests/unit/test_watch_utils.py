@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+from lean_lsp_mcp import watch_utils
+from lean_lsp_mcp.watch_utils import InotifyWatcher, PollingWatcher, get_watcher
+
+linux_only = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is Linux only"
+)
+
+
+def _collect(watcher) -> list[set[Path]]:
+    events: list[set[Path]] = []
+    watcher.subscribe(events.append)
+    return events
+
+
+@linux_only
+def test_inotify_reports_file_changes(tmp_path: Path) -> None:
+    (tmp_path / "A.lean").write_text("def a := 1\n")
+    watcher = InotifyWatcher(tmp_path).start()
+    try:
+        assert watcher.wait_ready(5)
+        events = _collect(watcher)
+        before = watcher.stamp(tmp_path / "A.lean")
+        assert watcher.stamp(tmp_path / "A.lean") == before
+
+        (tmp_path / "A.lean").write_text("def a := 2\n")
+        (tmp_path / "_mcp_warm_x.lean").write_text("scratch\n")
+        after = watcher.stamp(tmp_path / "A.lean")
+        assert after != before
+        assert after[0] == before[0]  # File edits are not structural
+        assert events == [{tmp_path / "A.lean"}]
+
+        (tmp_path / "A.lean").unlink()
+        watcher.sync()
+        assert events[-1] == {tmp_path / "A.lean"}
+    finally:
+        watcher.stop()
+
+
+@linux_only
+def test_inotify_follows_new_directories(tmp_path: Path) -> None:
+    watcher = InotifyWatcher(tmp_path).start()
+    try:
+        assert watcher.wait_ready(5)
+        events = _collect(watcher)
+        generation = watcher.generation
+        (tmp_path / "Sub").mkdir()
+        watcher.sync()
+        assert watcher.generation > generation
+        assert events[-1] == {tmp_path / "Sub"}
+
+        (tmp_path / "Sub" / "B.lean").write_text("def b := 1\n")
+        (tmp_path / "lean-toolchain").write_text("leanprover/lean4:v4.0.0\n")
+        generation = watcher.generation
+        watcher.sync()
+        assert events[-1] == {tmp_path / "Sub" / "B.lean", tmp_path / "lean-toolchain"}
+        assert watcher.generation == generation + 1
+    finally:
+        watcher.stop()
+
+
+@linux_only
+def test_inotify_skips_lake_and_sets_up_in_background(tmp_path: Path) -> None:
+    (tmp_path / ".lake" / "packages" / "mathlib" / "Mathlib").mkdir(parents=True)
+    (tmp_path / "Proj").mkdir()
+    watcher = InotifyWatcher(tmp_path)
+    # Nothing is watched, nor exact, before the watcher's thread set it up
+    assert watcher._dirs == {}
+    assert watcher.stamp(tmp_path / "Proj" / "A.lean") is None
+    events = _collect(watcher)
+    watcher.start()
+    try:
+        assert watcher.wait_ready(5)
+        assert sorted(watcher._dirs.values()) == [tmp_path, tmp_path / "Proj"]
+        # Subscribers rescan what changed while the watches were added
+        assert events == [{tmp_path}]
+
+        (tmp_path / ".lake" / "packages" / "mathlib" / "Mathlib" / "B.lean").write_text(
+            "x\n"
+        )
+        watcher.sync()
+        assert events == [{tmp_path}]
+    finally:
+        watcher.stop()
+
+
+def test_polling_watcher_compares_scans(tmp_path: Path) -> None:
+    (tmp_path / "A.lean").write_text("def a := 1\n")
+    (tmp_path / ".lake" / "build").mkdir(parents=True)
+    watcher = PollingWatcher(tmp_path)
+    events = _collect(watcher)
+    assert watcher.stamp(tmp_path / "A.lean") is None
+
+    watcher.poll()
+    assert events == []
+
+    (tmp_path / "A.lean").write_text("def a := 22\n")
+    (tmp_path / "B.lean").write_text("def b := 1\n")
+    (tmp_path / ".lake" / "build" / "Gen.lean").write_text("def gen := 1\n")
+    (tmp_path / ".lake" / "packages").mkdir()
+    (tmp_path / ".lake" / "packages" / "Dep.lean").write_text("def dep := 1\n")
+    watcher.poll()
+    assert events == [{tmp_path / "A.lean", tmp_path / "B.lean"}]
+
+
+def test_get_watcher_respects_mode(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(watch_utils, "_WATCHERS", {})
+    monkeypatch.setenv("LEAN_LSP_WATCH", "off")
+    assert get_watcher(tmp_path) is None
+
+    monkeypatch.setattr(watch_utils, "_WATCHERS", {})
+    monkeypatch.setenv("LEAN_LSP_WATCH", "poll")
+    watcher = get_watcher(tmp_path)
+    try:
+        assert isinstance(watcher, PollingWatcher)
+        assert get_watcher(tmp_path) is watcher
+    finally:
+        watcher.stop()